@@ -44,9 +44,55 @@ def create_app():
         JWT_ACCESS_TOKEN_EXPIRES=timedelta(minutes=int(os.getenv("JWT_ACCESS_TOKEN_EXPIRES_MINUTES", "30"))),
         JWT_REFRESH_TOKEN_EXPIRES=timedelta(days=int(os.getenv("JWT_REFRESH_TOKEN_EXPIRES_DAYS", 30))),
         PREFERRED_URL_SCHEME=os.getenv("PREFERRED_URL_SCHEME", "http"),
+        REALTIME_HISTORY_OPS=int(os.getenv("REALTIME_HISTORY_OPS", "500")),
+        REALTIME_FLUSH_INTERVAL_MS=int(os.getenv("REALTIME_FLUSH_INTERVAL_MS", "1000")),
+        REALTIME_FLUSH_DIRTY_BYTES=int(os.getenv("REALTIME_FLUSH_DIRTY_BYTES", str(256 * 1024))),
+        REALTIME_BATCH_WINDOW_MS=float(os.getenv("REALTIME_BATCH_WINDOW_MS", "20")),
+        DOC_CACHE_MAX_BYTES=int(os.getenv("DOC_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+        SOCKETIO_BINARY_ENABLED=os.getenv("SOCKETIO_BINARY_ENABLED", "true").lower() == "true",
+        SOCKETIO_COMPRESS_THRESHOLD=int(os.getenv("SOCKETIO_COMPRESS_THRESHOLD", "1024")),
+        PRESENCE_TICK_HZ=float(os.getenv("PRESENCE_TICK_HZ", "20")),
+        OPLOG_SNAPSHOT_OPS=int(os.getenv("OPLOG_SNAPSHOT_OPS", "500")),
+        OPLOG_RETAIN_OPS=int(os.getenv("OPLOG_RETAIN_OPS", "1000")),
+        OPLOG_COMPACT_INTERVAL_SECONDS=float(os.getenv("OPLOG_COMPACT_INTERVAL_SECONDS", "60")),
+        CRDT_ENABLED=os.getenv("CRDT_ENABLED", "true").lower() == "true",
+        CRDT_COMPACT_UPDATES=int(os.getenv("CRDT_COMPACT_UPDATES", "200")),
+        SOCKET_MAX_CONNECTIONS=int(os.getenv("SOCKET_MAX_CONNECTIONS", "50000")),
+        SOCKET_MAX_DOCUMENTS_PER_CONNECTION=int(os.getenv("SOCKET_MAX_DOCUMENTS_PER_CONNECTION", "20")),
+        SOCKET_RATE_PER_SECOND=float(os.getenv("SOCKET_RATE_PER_SECOND", "20")),
+        SOCKET_BURST=float(os.getenv("SOCKET_BURST", "40")),
+        SOCKET_USER_RATE_PER_SECOND=float(os.getenv("SOCKET_USER_RATE_PER_SECOND", "40")),
+        SOCKET_USER_BURST=float(os.getenv("SOCKET_USER_BURST", "80")),
+        SOCKET_MAX_QUEUED_PACKETS=int(os.getenv("SOCKET_MAX_QUEUED_PACKETS", "500")),
+        SHARDING_ENABLED=os.getenv("SHARDING_ENABLED", "false").lower() == "true",
+        SHARD_BUS_URL=os.getenv("SHARD_BUS_URL") or os.getenv("REDIS_URL") or "memory://",
+        SHARD_HEARTBEAT_SECONDS=float(os.getenv("SHARD_HEARTBEAT_SECONDS", "5")),
+        SHARD_CALL_TIMEOUT_SECONDS=float(os.getenv("SHARD_CALL_TIMEOUT_SECONDS", "5")),
+        PERMISSION_CACHE_TTL_SECONDS=float(os.getenv("PERMISSION_CACHE_TTL_SECONDS", "60")),
+        PERMISSION_CACHE_MAX_DOCS=int(os.getenv("PERMISSION_CACHE_MAX_DOCS", "50000")),
+        OVERVIEW_CACHE_TTL_SECONDS=float(os.getenv("OVERVIEW_CACHE_TTL_SECONDS", "30")),
+        OVERVIEW_CACHE_MAX_USERS=int(os.getenv("OVERVIEW_CACHE_MAX_USERS", "20000")),
+        OVERVIEW_CACHE_URL=os.getenv("OVERVIEW_CACHE_URL") or None,
+        RECENT_COLLABORATORS_TTL_SECONDS=float(os.getenv("RECENT_COLLABORATORS_TTL_SECONDS", "300")),
+        RECENT_COLLABORATORS_MAX_USERS=int(os.getenv("RECENT_COLLABORATORS_MAX_USERS", "20000")),
+        RECENT_COLLABORATORS_PER_USER=int(os.getenv("RECENT_COLLABORATORS_PER_USER", "50")),
+        JWT_CLAIMS_CACHE_MAX=int(os.getenv("JWT_CLAIMS_CACHE_MAX", "10000")),
+        TOKEN_REVOCATION_REFRESH_SECONDS=float(os.getenv("TOKEN_REVOCATION_REFRESH_SECONDS", "5")),
+        TOKEN_BLOCKLIST_PURGE_INTERVAL_SECONDS=float(os.getenv("TOKEN_BLOCKLIST_PURGE_INTERVAL_SECONDS", "3600")),
+        TOKEN_BLOCKLIST_PURGE_BATCH=int(os.getenv("TOKEN_BLOCKLIST_PURGE_BATCH", "5000")),
+        PASSWORD_HASH_THREADS=int(os.getenv("PASSWORD_HASH_THREADS") or max(1, (os.cpu_count() or 2) // 2)),
+        PASSWORD_HASH_QUEUE=int(os.getenv("PASSWORD_HASH_QUEUE", "16")),
+        PASSWORD_HASH_NICE=int(os.getenv("PASSWORD_HASH_NICE", "10")),
+        ARGON2_TIME_COST=int(os.getenv("ARGON2_TIME_COST", "3")),
+        ARGON2_MEMORY_COST_KIB=int(os.getenv("ARGON2_MEMORY_COST_KIB", "65536")),
+        ARGON2_PARALLELISM=int(os.getenv("ARGON2_PARALLELISM", "4")),
+        METRICS_ENABLED=os.getenv("METRICS_ENABLED", "true").lower() == "true",
+    )
+    # enable show ratelimit headers; load tests (benchmarks/load_ws.py) turn the limits off
+    app.config.update(
+        RATELIMIT_HEADERS_ENABLED=True,
+        RATELIMIT_ENABLED=os.getenv("RATELIMIT_ENABLED", "true").lower() == "true",
     )
-    # enable show ratelimit headers
-    app.config.update(RATELIMIT_HEADERS_ENABLED=True)
 
     # Guardrail for missing DB URL in dev
     if not app.config["SQLALCHEMY_DATABASE_URI"]:
@@ -64,10 +110,47 @@ def create_app():
     jwt.init_app(app)
     limiter.init_app(app)
 
+    from .permissions import permission_cache
+    permission_cache.init_app(app)
+    from .overviews import overview_cache
+    overview_cache.init_app(app)
+    from .contacts import recent_collaborators
+    recent_collaborators.init_app(app)
+    from .tokens import token_verifier
+    token_verifier.init_app(app)
+    from .passwords import password_pool, PasswordHasherBusy
+    password_pool.init_app(app)
+
     # socket.io: set exact accepted origins indepentently from REST CORS
     sio_origins_env = os.getenv("SOCKETIO_CORS_ORIGINS")
     sio_cors = _parse_origins(sio_origins_env, api_cors)
 
+    # socket handlers must be imported before init_app, otherwise only the
+    # first app instance (e.g. in tests) gets them registered
+    from .realtime import docs as _  # noqa
+    from .realtime.history import op_history
+    from .realtime.buffer import write_buffer
+    from .realtime.oplog import op_log
+    from .realtime.crdt import crdt_sync
+    from .realtime.snapshots import snapshot_cache
+    from .realtime.codec import socket_codec
+    from .realtime.connections import connections
+    from .realtime.presence import presence
+    from .realtime.limits import socket_limiter
+    from .realtime.batcher import room_batcher
+    from .realtime.shards import shards, ShardUnavailable
+    op_history.init_app(app)
+    write_buffer.init_app(app)
+    op_log.init_app(app)
+    crdt_sync.init_app(app)
+    snapshot_cache.init_app(app)
+    socket_codec.init_app(app)
+    connections.init_app(app)
+    presence.init_app(app)
+    socket_limiter.init_app(app)
+    room_batcher.init_app(app)
+    shards.init_app(app)
+
     # Redis is optional; I skip it to save costs
     redis_url = None if testing else os.getenv("REDIS_URL") or None
     socketio.init_app(
@@ -78,6 +161,8 @@ def create_app():
         logger=True,
         engineio_logger=True,
     )
+    from .metrics import metrics, CONTENT_TYPE
+    metrics.init_app(app)
 
     # Import models/blueprints/handlers
     from . import models  # noqa
@@ -91,16 +176,12 @@ def create_app():
     app.register_blueprint(bp_users, url_prefix="/api")
     app.register_blueprint(bp_share, url_prefix="/api")
     app.register_blueprint(bp_summarize, url_prefix="/api")
-    from .realtime import docs as _  # noqa
 
     # wiring jwt token blocklist checking if token is blocked
-    from .models import TokenBlocklist
-
     @jwt.token_in_blocklist_loader
     def _is_token_revoked(jwt_header, jwt_payload):
-        """Return True if this token's JTI is in blocklist"""
-        jti = jwt_payload["jti"]
-        return db.session.query(TokenBlocklist.id).filter_by(jti=jti).scalar() is not None
+        """Return True if this token's JTI is in blocklist (kept in memory, see tokens.py)"""
+        return token_verifier.is_revoked(jwt_payload["jti"])
     
     
     @jwt.revoked_token_loader
@@ -129,9 +210,30 @@ def create_app():
         resp.status_code = 429
         return resp
 
+    @app.errorhandler(PasswordHasherBusy)
+    def handle_password_hasher_busy(e: PasswordHasherBusy):
+        app.logger.warning("password hashing shed: %s", e)
+        resp = jsonify(message="Too many sign-ins right now. Please try again in a moment.")
+        resp.status_code = 503
+        resp.headers["Retry-After"] = "1"
+        return resp
+
+    @app.errorhandler(ShardUnavailable)
+    def handle_shard_unavailable(e: ShardUnavailable):
+        app.logger.warning("document owner %s did not answer", e)
+        resp = jsonify(message="Document is temporarily unavailable. Please try again.")
+        resp.status_code = 503
+        return resp
+
 
     @app.get("/health")
     def health():
         return {"status": "ok"}
 
+    if app.config["METRICS_ENABLED"]:
+        @app.get("/metrics")
+        def prometheus_metrics():
+            """Prometheus scrape target; see metrics.py."""
+            return metrics.render(), 200, {"Content-Type": CONTENT_TYPE}
+
     return app
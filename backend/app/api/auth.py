@@ -1,8 +1,10 @@
+from datetime import datetime, timezone
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt, get_jwt_identity
 from pydantic import ValidationError
 from ..extensions import db, limiter
 from ..models import User, TokenBlocklist
+from ..tokens import token_verifier
 from ..validation.schemas import RegisterSchema, LoginSchema
 from .utils import _ve_to_json
 
@@ -36,8 +38,11 @@ def login():
 
     email, password = data.email, data.password
     u = db.session.query(User).filter_by(email=email).first()
+    stored = u.password_hash if u else None
     if not u or not u.check_password(password):
         return jsonify({"message": "Invalid credentials"}), 401
+    if u.password_hash != stored:
+        db.session.commit()  # rehashed with the current Argon2 parameters
     access = create_access_token(identity=str(u.id))
     refresh = create_refresh_token(identity=str(u.id))
     return jsonify({"access_token": access, "refresh_token": refresh, "user_id": u.id})
@@ -53,12 +58,14 @@ def refresh():
 @jwt_required()
 def logout():
     j = get_jwt()
+    expires_at = datetime.fromtimestamp(j["exp"], timezone.utc)
     db.session.add(
         TokenBlocklist(
-        jti=j["jti"], token_type=j["type"], user_id=int(get_jwt_identity())
+        jti=j["jti"], token_type=j["type"], expires_at=expires_at, user_id=int(get_jwt_identity())
         )
     )
     db.session.commit()
+    token_verifier.revoke(j["jti"], expires_at)
     return jsonify(msg="logged out current token"), 200
 
 
@@ -1,12 +1,28 @@
+import time
 from functools import wraps
 from flask import Blueprint, jsonify, request
-from sqlalchemy import func
+from sqlalchemy import func, insert, tuple_, update
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from pydantic import ValidationError
 from ..extensions import db
 from ..models import User, Document, DocumentCollaborator
-from ..validation.schemas import CreateDocSchema, UpdateDocSchema
-from .utils import _ve_to_json
+from ..overviews import overview_cache
+from ..search import highlight, plain_text, search
+from ..permissions import permission_cache
+from ..validation.schemas import BulkCreateDocSchema, CreateDocSchema, UpdateDocSchema
+from ..realtime.batcher import room_batcher
+from ..realtime.buffer import write_buffer
+from ..realtime.codec import socket_codec
+from ..realtime.crdt import crdt_sync
+from ..realtime.delta import ops_of
+from ..realtime.docs import snapshot_payload
+from ..realtime.history import op_history
+from ..realtime.shards import shards
+from ..realtime.snapshots import snapshot_cache
+from .utils import (
+    _ve_to_json, _encode_cursor, _decode_cursor, _page_limit, _encode_rank_cursor, _decode_rank_cursor,
+    _digest, _not_modified, _precondition_failed, _with_etag,
+)
 
 bp = Blueprint("docs", __name__)
 
@@ -15,10 +31,7 @@ def require_doc_permission(levels=("viewer","editor","owner")):
         @wraps(fn)
         def wrapper(doc_id, *args, **kwargs):
             user_id = int(get_jwt_identity())
-            collab = db.session.query(DocumentCollaborator).filter_by(
-                document_id=doc_id, user_id=user_id
-            ).first()
-            if not collab or collab.permission_level not in levels:
+            if permission_cache.level(doc_id, user_id) not in levels:
                 return jsonify({"message": "Access denied"}), 403
             return fn(doc_id, *args, **kwargs)
         return wrapper
@@ -37,154 +50,344 @@ def create_document():
     title = data.title if data.title is not None else "Untitled Document"
     description = data.description if data.description is not None else ""
     content = data.content
-    doc = Document(title=title, description=description, content=content, owner_id=user_id)
+    doc = Document(title=title, description=description, content=content, content_text=plain_text(content),
+                   owner_id=user_id)
     db.session.add(doc); db.session.flush()
     db.session.add(DocumentCollaborator(document_id=doc.id, user_id=user_id, permission_level="owner"))
     db.session.commit()
+    permission_cache.invalidate(doc.id)
+    overview_cache.invalidate([user_id])
     return jsonify({"id": doc.id, "title": doc.title, "description": doc.description}), 201
 
+@bp.post("/documents/bulk")
+@jwt_required()
+def create_documents_bulk():
+    """{documents: [{title, description, content}, ...]}: one transaction, results in request order."""
+    user_id = int(get_jwt_identity())
+    try:
+        data = BulkCreateDocSchema.model_validate(request.get_json() or {})
+    except ValidationError as e:
+        return _ve_to_json(e), 422
+
+    rows = [
+        {"title": d.title, "description": d.description if d.description is not None else "",
+         "content": d.content, "content_text": plain_text(d.content), "owner_id": user_id}
+        for d in data.documents
+    ]
+    ids = db.session.execute(insert(Document).returning(Document.id, sort_by_parameter_order=True), rows).scalars().all()
+    db.session.execute(insert(DocumentCollaborator), [
+        {"document_id": doc_id, "user_id": user_id, "permission_level": "owner"} for doc_id in ids
+    ])
+    db.session.commit()
+    # fresh ids can't be in the permission cache: misses aren't cached
+    overview_cache.invalidate([user_id])
+    return jsonify([
+        {"id": doc_id, "title": row["title"], "description": row["description"]} for doc_id, row in zip(ids, rows)
+    ]), 201
+
+def _keyset(query, cursor, limit: int):
+    """
+    One page of `query` newest first by (updated_at, id), starting after
+    `cursor`; returns (rows, cursor for the next page or None). Rows must
+    have `id` and `updated_at` columns.
+    """
+    if cursor is not None:
+        query = query.filter(tuple_(Document.updated_at, Document.id) < tuple_(*cursor))
+    rows = query.order_by(Document.updated_at.desc(), Document.id.desc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, _encode_cursor(rows[-1].updated_at, rows[-1].id)
+
 # TODO: remove old documents view before production deploy
 @bp.get("/documents")
 @jwt_required()
 def list_documents():
+    """?limit=&cursor=; the next page's cursor comes back in X-Next-Cursor."""
     user_id = int(get_jwt_identity())
-    docs = (
-        db.session.query(Document)
+    try:
+        limit = _page_limit(request.args.get("limit"))
+        cursor = _decode_cursor(request.args.get("cursor"))
+    except ValueError:
+        return jsonify({"message": "Invalid limit or cursor"}), 400
+
+    # listed columns only: never load (and detoast) content
+    query = (
+        db.session.query(Document.id, Document.title, Document.owner_id, Document.updated_at)
         .join(DocumentCollaborator, Document.id==DocumentCollaborator.document_id)
         .filter(DocumentCollaborator.user_id==user_id)
-        .order_by(Document.updated_at.desc())
-        .all()
     )
-    return jsonify([{
+    docs, next_cursor = _keyset(query, cursor, limit)
+    resp = jsonify([{
         "id": d.id, "title": d.title, "owner_id": d.owner_id,
         "updated_at": d.updated_at.isoformat()
     } for d in docs])
+    if next_cursor:
+        resp.headers["X-Next-Cursor"] = next_cursor
+    return resp
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 50  # every hit gets a headline
+
+@bp.get("/documents/search")
+@jwt_required()
+def search_documents():
+    """
+    ?q=&limit=&cursor=
+    The caller's documents matching `q` (web search syntax), best first,
+    with an HTML-escaped headline that wraps matches in <mark>. As with
+    /documents, X-Next-Cursor holds the cursor of the next page.
+    """
+    uid = int(get_jwt_identity())
+    q = (request.args.get("q") or "").strip()
+    if not q:
+        return jsonify({"message": "q required"}), 400
+    try:
+        limit = _page_limit(request.args.get("limit"), SEARCH_PAGE_SIZE, SEARCH_MAX_PAGE_SIZE)
+        cursor = _decode_rank_cursor(request.args.get("cursor"))
+    except ValueError:
+        return jsonify({"message": "Invalid limit or cursor"}), 400
+
+    rows = search(uid, q, limit, cursor)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_rank_cursor(rows[-1].rank, rows[-1].id)
+    resp = jsonify([
+        {
+            "id": r.id,
+            "title": r.title,
+            "updated_at": r.updated_at.isoformat(),
+            "permission_level": r.permission_level,
+            "rank": r.rank,
+            "headline": highlight(r.headline),
+        }
+        for r in rows
+    ])
+    if next_cursor:
+        resp.headers["X-Next-Cursor"] = next_cursor
+    return resp
 
 @bp.get("/documents/overview")
 @jwt_required()
 def list_documents_overview():
+    """
+    ?limit=&section=mine|shared_with_me&mine_cursor=&shared_cursor=
+    Each list is one page (newest first); `next_cursor` holds the cursor for
+    the following page of each, or null at the end. Pass `section` to page
+    through one list without recomputing the other.
+    """
     uid = int(get_jwt_identity())
     dc = DocumentCollaborator
+    section = request.args.get("section")
+    if section not in (None, "mine", "shared_with_me"):
+        return jsonify({"message": "Invalid section"}), 400
 
-    # owned by user (with shared count)
-    shared_counts_sq = (
-        db.session.query(
-            dc.document_id.label("doc_id"),
-            func.count(dc.user_id).label("shared_count")
-        )
-        .join(Document, Document.id == dc.document_id)
-        .filter(Document.owner_id == uid, dc.user_id != uid)
-        .group_by(dc.document_id)
-        .subquery()
-    )
-
-    owned_rows = (
-        db.session.query(Document, shared_counts_sq.c.shared_count)
-        .outerjoin(shared_counts_sq, Document.id == shared_counts_sq.c.doc_id)
-        .filter(Document.owner_id == uid)
-        .order_by(Document.updated_at.desc())
-        .all()
-    )
+    try:
+        limit = _page_limit(request.args.get("limit"))
+        mine_cursor = _decode_cursor(request.args.get("mine_cursor"))
+        shared_cursor = _decode_cursor(request.args.get("shared_cursor"))
+    except ValueError:
+        return jsonify({"message": "Invalid limit or cursor"}), 400
 
-    mine = [
-        {
-            "id": d.id,
-            "title": d.title,
-            "updated_at": d.updated_at.isoformat(),
-            "shared_count": sc if sc is not None else 0
-        }
-        for d, sc in owned_rows
-    ]
+    key = "|".join([section or "", str(limit), request.args.get("mine_cursor", ""),
+                    request.args.get("shared_cursor", "")])
+    cached = overview_cache.get(uid, key)
+    if cached:
+        tag, body = cached
+        return _not_modified(tag) or _with_etag(jsonify(body), tag)
+    started = time.monotonic()
 
-    # shared with user (owned by others)
-    u = User
-    shared_rows = (
+    # every listed document has a collaborator row for this user; edits move
+    # max(updated_at), shares/roles/renames sharing_version, adds/removes count and ids
+    state = (
         db.session.query(
-            Document,
-            dc.permission_level,
-            u.id.label("owner_id"),
-            u.username.label("owner_username"),
-            u.email.label("owner_email"),
+            func.count(Document.id),
+            func.max(Document.updated_at),
+            func.coalesce(func.sum(Document.sharing_version), 0),
+            func.coalesce(func.sum(Document.id), 0),
         )
         .join(dc, dc.document_id == Document.id)
-        .join(u, u.id == Document.owner_id)
-        .filter(dc.user_id == uid, Document.owner_id != uid)
-        .order_by(Document.updated_at.desc())
-        .all()
+        .filter(dc.user_id == uid)
+        .one()
     )
+    tag = f"o{uid}.{_digest(*state)}"
+    not_modified = _not_modified(tag)
+    if not_modified:
+        return not_modified
 
-    shared_with_me = [
-        {
-            "id": d.id,
-            "title": d.title,
-            "updated_at": d.updated_at.isoformat(),
-            "permission_level": pl,
-            "owner": {
-                "id": oid,
-                "username": ouname,
-                "email": oemail
+    body = {"next_cursor": {}}
+    if section in (None, "mine"):
+        owned_rows, body["next_cursor"]["mine"] = _keyset(
+            db.session.query(Document.id, Document.title, Document.updated_at).filter(Document.owner_id == uid),
+            mine_cursor, limit,
+        )
+        # shared count for this page only
+        shared_counts = dict(
+            db.session.query(dc.document_id, func.count(dc.user_id))
+            .filter(dc.document_id.in_([d.id for d in owned_rows]), dc.user_id != uid)
+            .group_by(dc.document_id)
+            .all()
+        ) if owned_rows else {}
+        body["mine"] = [
+            {
+                "id": d.id,
+                "title": d.title,
+                "updated_at": d.updated_at.isoformat(),
+                "shared_count": shared_counts.get(d.id, 0)
             }
-        }
-        for d, pl, oid, ouname, oemail in shared_rows
-    ]
+            for d in owned_rows
+        ]
 
-    return jsonify({"mine": mine, "shared_with_me": shared_with_me})
+    if section in (None, "shared_with_me"):
+        # shared with user (owned by others)
+        u = User
+        shared_rows, body["next_cursor"]["shared_with_me"] = _keyset(
+            db.session.query(
+                Document.id,
+                Document.title,
+                Document.updated_at,
+                dc.permission_level,
+                u.id.label("owner_id"),
+                u.username.label("owner_username"),
+                u.email.label("owner_email"),
+            )
+            .join(dc, dc.document_id == Document.id)
+            .join(u, u.id == Document.owner_id)
+            .filter(dc.user_id == uid, Document.owner_id != uid),
+            shared_cursor, limit,
+        )
+        body["shared_with_me"] = [
+            {
+                "id": d.id,
+                "title": d.title,
+                "updated_at": d.updated_at.isoformat(),
+                "permission_level": d.permission_level,
+                "owner": {
+                    "id": d.owner_id,
+                    "username": d.owner_username,
+                    "email": d.owner_email
+                }
+            }
+            for d in shared_rows
+        ]
+
+    overview_cache.put(uid, key, tag, body, started)
+    return _with_etag(jsonify(body), tag)
+
+
+def _document_tag(doc_id: int, user_id: int):
+    """ETag of GET /documents/<id> for this user, None if the document is gone."""
+    tag = shards.run(doc_id, "snapshot.tag", wait=True)
+    return tag and f"{tag}.{permission_cache.level(doc_id, user_id)}"
 
 
 @bp.get("/documents/<int:doc_id>")
 @jwt_required()
 @require_doc_permission(("viewer","editor","owner"))
 def get_document(doc_id: int):
-    d = db.session.get(Document, doc_id)
+    uid = int(get_jwt_identity())
+    tag = _document_tag(doc_id, uid)
+    if not tag: return jsonify({"message": "Not found"}), 404
+    not_modified = _not_modified(tag)
+    if not_modified:
+        return not_modified
+
+    # the owner's snapshot includes edits that are not flushed yet
+    d = shards.run(doc_id, "snapshot", wait=True)
     if not d: return jsonify({"message": "Not found"}), 404
 
-    uid = int(get_jwt_identity())
-    collab = (
-        db.session.query(DocumentCollaborator).filter_by(document_id=doc_id, user_id=uid).first()
-    )
-    perm = collab.permission_level if collab else ("owner" if d.owner_id == uid else None)
+    perm = permission_cache.level(doc_id, uid) or ("owner" if d["owner_id"] == uid else None)
 
-    owner = db.session.get(User, d.owner_id)
+    owner = db.session.query(User.id, User.username, User.email).filter_by(id=d["owner_id"]).first()
     owner_info = {
         "id": owner.id,
         "username": owner.username,
         "email": owner.email
-    } if owner else {"id": d.owner_id}
-
-    return jsonify({
-        "id": d.id,
-        "title": d.title,
-        "summary": d.summary,
-        "description": d.description,
-        "owner_id": d.owner_id,
+    } if owner else {"id": d["owner_id"]}
+
+    return _with_etag(jsonify({
+        "id": d["id"],
+        "title": d["title"],
+        "summary": d["summary"],
+        "description": d["description"],
+        "content": d["content"],
+        "version": d["version"],
+        "owner_id": d["owner_id"],
         "owner": owner_info,
         "permission_level": perm,
-        "updated_at": d.updated_at.isoformat(),
-    })
+        "updated_at": d["updated_at"],
+    }), tag)
 
 @bp.put("/documents/<int:doc_id>")
 @jwt_required()
 @require_doc_permission(("editor","owner"))
 def update_document(doc_id: int):
-    d = db.session.get(Document, doc_id)
-    if not d: return jsonify({"message": "Not found"}), 404
+    """Honours If-Match with a GET's ETag (weak comparison): 412 if the document changed since."""
+    uid = int(get_jwt_identity())
+    if request.if_match:
+        failed = _precondition_failed(_document_tag(doc_id, uid))
+        if failed:
+            return failed
 
     try:
         data = UpdateDocSchema.model_validate(request.get_json() or {})
     except ValidationError as e:
         return _ve_to_json(e), 422
 
+    fields = {}
     if data.title is not None:
-        d.title = data.title
+        fields["title"] = data.title
     if data.description is not None:
-        d.description = data.description
-    if data.content is not None:
-        d.content = data.content
+        fields["description"] = data.description
     if data.summary is not None:
-        d.summary = data.summary
-    d.updated_at = db.func.now()
-    db.session.commit()
-    return jsonify({"message":"updated"})
+        fields["summary"] = data.summary
+    if data.content is None:
+        # metadata only: the row needn't be loaded
+        updated = db.session.execute(
+            update(Document).where(Document.id == doc_id).values(**fields, updated_at=func.now())
+        ).rowcount
+        db.session.commit()
+        if not updated: return jsonify({"message": "Not found"}), 404
+        shards.run(doc_id, "snapshot.invalidate")
+    else:
+        # content must be replaced where the live copy lives
+        fields["content"] = data.content
+        shards.run(doc_id, "overwrite", wait=True, fields=fields)
+    overview_cache.invalidate_documents([doc_id])
+    return _with_etag(jsonify({"message":"updated"}), _document_tag(doc_id, uid))
+
+
+@shards.task("overwrite")
+def _overwrite(doc_id: int, fields: dict) -> None:
+    """A full overwrite invalidates every live editor's base version."""
+    with op_history.lock(doc_id):
+        d = db.session.get(Document, doc_id)
+        if not d:
+            return
+        live = write_buffer.discard(doc_id)
+        for name, value in fields.items():
+            setattr(d, name, value)
+        if "content" in fields:
+            d.content_text = plain_text(d.content)
+        d.updated_at = db.func.now()
+        d.version = max(d.version, live.version if live else 0) + 1
+        d.content_version = d.version
+        update = ystate = None
+        if live is not None and live.crdt is not None:
+            # keep the Y history Yjs clients share: rewrite the text and store it compacted
+            ystate = live.crdt
+            update = crdt_sync.replace(ystate, ops_of(d.content))
+            written = crdt_sync.persist(doc_id, ystate, compact=True)
+        db.session.commit()
+        if ystate is not None:
+            crdt_sync.written(ystate, *written)
+        op_history.reset(doc_id)
+        room_batcher.discard(doc_id)
+        snapshot_cache.invalidate(doc_id)
+    socket_codec.broadcast("load_document_content", snapshot_payload(snapshot_cache.get(doc_id)), doc_id)
+    if update:
+        crdt_sync.broadcast(doc_id, update)
 
 @bp.delete("/documents/<int:doc_id>")
 @jwt_required()
@@ -192,5 +395,21 @@ def update_document(doc_id: int):
 def delete_document(doc_id: int):
     d = db.session.get(Document, doc_id)
     if not d: return jsonify({"message": "Not found"}), 404
-    db.session.delete(d); db.session.commit()
+    collaborators = overview_cache.collaborators([doc_id])
+    shards.run(doc_id, "delete", wait=True)
+    permission_cache.invalidate(doc_id)
+    overview_cache.invalidate(collaborators)
     return "", 204
+
+
+@shards.task("delete")
+def _delete(doc_id: int) -> None:
+    with op_history.lock(doc_id):
+        d = db.session.get(Document, doc_id)
+        if d:
+            db.session.delete(d)
+            db.session.commit()
+        write_buffer.discard(doc_id)
+        op_history.reset(doc_id)
+        room_batcher.discard(doc_id)
+        snapshot_cache.invalidate(doc_id)
@@ -1,32 +1,121 @@
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from pydantic import ValidationError
+from sqlalchemy import or_, update
+from sqlalchemy.dialects.postgresql import insert
 from app.extensions import db, socketio
 from app.models import Document, DocumentCollaborator, User
-from app.emailer import send_share_email_bg
+from app.emailer import send_share_email_bg, send_shares_email_bg
+from app.contacts import recent_collaborators
+from app.overviews import overview_cache
+from app.permissions import permission_cache
+from app.realtime.shards import shards
+from app.api.utils import _not_modified, _ve_to_json, _with_etag
+from app.validation.schemas import BulkShareSchema, BulkShareDocsSchema
 
 bp_share = Blueprint("share", __name__)
 
 def _owner_required(doc_id: int, uid: int) -> bool:
-    d = db.session.get(Document, doc_id)
-    if not d or d.owner_id != uid:
-        return False
-    return True
+    owner_id = db.session.query(Document.owner_id).filter_by(id=doc_id).scalar()
+    return owner_id is not None and owner_id == uid
+
+def _bump_sharing_versions(doc_ids: list):
+    """
+    Call before committing a change to the documents' collaborators; keeps
+    updated_at. Returns (id, sharing_version, title) per document.
+    """
+    return db.session.execute(
+        update(Document)
+        .where(Document.id.in_(doc_ids))
+        .values(sharing_version=Document.sharing_version + 1, updated_at=Document.updated_at)
+        .returning(Document.id, Document.sharing_version, Document.title)
+    ).all()
+
+def _bump_sharing_version(doc_id: int):
+    return _bump_sharing_versions([doc_id])[0]
+
+def _upsert_collaborators(rows: list) -> None:
+    """INSERT ... ON CONFLICT for {document_id, user_id, permission_level} rows; owners' rows are left alone."""
+    stmt = insert(DocumentCollaborator).values(rows)
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=[DocumentCollaborator.document_id, DocumentCollaborator.user_id],
+        set_={"permission_level": stmt.excluded.permission_level},
+        where=DocumentCollaborator.permission_level != "owner",
+    ))
+
+def _resolve_users(user_ids, emails) -> list:
+    """(id, username, email) of the users with any of these ids or emails, in one query."""
+    if not user_ids and not emails:
+        return []
+    return (
+        db.session.query(User.id, User.username, User.email)
+        .filter(or_(User.id.in_(list(user_ids)), User.email.in_(list(emails))))
+        .all()
+    )
+
+def _notify_shared(doc_id: int, title: str, level: str, inviter, invitee_id: int, invitee=None, email=None) -> None:
+    """Socket notification and (fire & forget) email for one new share."""
+    # richer socket payload (includes inviter info)
+    socketio.emit(
+        "notify",
+        {
+            "type": "share_added",
+            "doc_id": doc_id,
+            "title": title,
+            "permission_level": level,
+            "by_user": {
+                "id": inviter.id if inviter else None,
+                "username": inviter.username if inviter else None,
+                "email": inviter.email if inviter else None,
+            },
+        },
+        room=f"user_{invitee_id}",
+    )
+
+    invitee_email = (invitee.email if invitee else email)
+    invitee_name  = (invitee.username if invitee and invitee.username else None)
+    inviter_name  = (inviter.username or inviter.email) if inviter else "Someone"
+    if invitee_email:
+        send_share_email_bg(invitee_email, title, inviter_name, doc_id=doc_id, recipient_name=invitee_name)
+
+def _notify_shared_many(docs: list, level: str, inviter, invitee) -> None:
+    """_notify_shared() for (id, title) of several documents: one socket event and one email."""
+    if len(docs) == 1:
+        _notify_shared(docs[0].id, docs[0].title, level, inviter, invitee.id, invitee)
+        return
+    socketio.emit(
+        "notify",
+        {
+            "type": "shares_added",
+            "documents": [{"doc_id": d.id, "title": d.title} for d in docs],
+            "permission_level": level,
+            "by_user": {
+                "id": inviter.id if inviter else None,
+                "username": inviter.username if inviter else None,
+                "email": inviter.email if inviter else None,
+            },
+        },
+        room=f"user_{invitee.id}",
+    )
+
+    inviter_name = (inviter.username or inviter.email) if inviter else "Someone"
+    if invitee.email:
+        send_shares_email_bg(invitee.email, [(d.id, d.title) for d in docs], inviter_name,
+                             recipient_name=invitee.username or None)
 
 @bp_share.get("/documents/<int:doc_id>/collaborators")
 @jwt_required()
 def list_collaborators(doc_id):
     uid = int(get_jwt_identity())
-    d = db.session.get(Document, doc_id)
+    d = db.session.query(Document.owner_id, Document.sharing_version).filter_by(id=doc_id).first()
     if not d:
         return jsonify(message="Not found"), 404
-    if d.owner_id != uid:
-        collab = (
-            db.session.query(DocumentCollaborator)
-            .filter_by(document_id=doc_id, user_id=uid)
-            .first()
-        )
-        if not collab:
-            return jsonify(message="Access denied"), 403
+    if d.owner_id != uid and permission_cache.level(doc_id, uid) is None:
+        return jsonify(message="Access denied"), 403
+    tag = f"c{doc_id}.{d.sharing_version}"
+    not_modified = _not_modified(tag)
+    if not_modified:
+        return not_modified
 
     rows = (
         db.session.query(DocumentCollaborator, User.username, User.email)
@@ -34,10 +123,10 @@ def list_collaborators(doc_id):
         .filter(DocumentCollaborator.document_id == doc_id)
         .all()
     )
-    return jsonify([
+    return _with_etag(jsonify([
         {"user_id": c.user_id, "username": uname, "email": email, "permission_level": c.permission_level}
         for c, uname, email in rows
-    ])
+    ]), tag)
 
 @bp_share.post("/documents/<int:doc_id>/collaborators")
 @jwt_required()
@@ -63,51 +152,123 @@ def add_collaborator(doc_id):
             return jsonify(message="User with this email not found"), 404
         user_id = invitee.id
 
-    # upsert
-    c = db.session.query(DocumentCollaborator).filter_by(document_id=doc_id, user_id=user_id).first()
     if user_id == uid:
         return jsonify(message="Cannot change your own role here"), 400
-    if c:
-        c.permission_level = level
-    else:
-        db.session.add(DocumentCollaborator(document_id=doc_id, user_id=user_id, permission_level=level))
+    _upsert_collaborators([{"document_id": doc_id, "user_id": user_id, "permission_level": level}])
+    bumped = _bump_sharing_version(doc_id)
     db.session.commit()
+    shards.run(doc_id, "snapshot.update", fields={"sharing_version": bumped.sharing_version})
+    permission_cache.invalidate(doc_id, user_id)
+    overview_cache.invalidate([uid, user_id])  # share count, shared list
+    recent_collaborators.invalidate([uid, user_id])
 
-    doc = db.session.get(Document, doc_id)
-    inviter = db.session.get(User, uid)
-    invitee = invitee or db.session.get(User, user_id)
+    people = {u.id: u for u in db.session.query(User).filter(User.id.in_((uid, user_id)))}
+    inviter = people.get(uid)
+    invitee = invitee or people.get(user_id)
+    _notify_shared(doc_id, bumped.title, level, inviter, user_id, invitee, email)
 
-    # richer socket payload (includes inviter info)
-    socketio.emit(
-        "notify",
-        {
-            "type": "share_added",
-            "doc_id": doc_id,
-            "title": doc.title if doc else "",
-            "permission_level": level,
-            "by_user": {
-                "id": inviter.id if inviter else uid,
-                "username": inviter.username if inviter else None,
-                "email": inviter.email if inviter else None,
-            },
-        },
-        room=f"user_{user_id}",
-    )
+    return jsonify(msg="shared"), 200
 
-    # email (fire & forget)
-    invitee_email = (invitee.email if invitee else email)
-    invitee_name  = (invitee.username if invitee and invitee.username else None)
-    inviter_name  = (inviter.username or inviter.email) if inviter else "Someone"
-    if invitee_email:
-        send_share_email_bg(invitee_email, doc.title if doc else "", inviter_name, doc_id=doc_id, recipient_name=invitee_name)
+@bp_share.post("/documents/<int:doc_id>/collaborators/bulk")
+@jwt_required()
+def add_collaborators_bulk(doc_id):
+    """
+    {user_ids: [...], emails: [...], permission_level, notify}: share one
+    document with many users in one transaction. Unknown users are
+    reported back, not an error.
+    """
+    uid = int(get_jwt_identity())
+    if not _owner_required(doc_id, uid):
+        return jsonify(message="Only owner can share"), 403
+    try:
+        data = BulkShareSchema.model_validate(request.get_json() or {})
+    except ValidationError as e:
+        return _ve_to_json(e), 422
+    if not data.user_ids and not data.emails:
+        return jsonify(message="user_ids or emails required"), 400
 
-    return jsonify(msg="shared"), 200
+    people = _resolve_users(set(data.user_ids) | {uid}, data.emails)
+    inviter = next((u for u in people if u.id == uid), None)
+    requested_ids, requested_emails = set(data.user_ids), set(data.emails)
+    invitees = [u for u in people if u.id != uid and (u.id in requested_ids or u.email in requested_emails)]
+    not_found = {
+        "user_ids": sorted(requested_ids - {u.id for u in people}),
+        "emails": sorted(requested_emails - {u.email for u in people}),
+    }
+    if not invitees:
+        return jsonify(shared=[], not_found=not_found), 200
+
+    _upsert_collaborators([
+        {"document_id": doc_id, "user_id": u.id, "permission_level": data.permission_level} for u in invitees
+    ])
+    bumped = _bump_sharing_version(doc_id)
+    db.session.commit()
+    shards.run(doc_id, "snapshot.update", fields={"sharing_version": bumped.sharing_version})
+    permission_cache.invalidate(doc_id)
+    overview_cache.invalidate([uid] + [u.id for u in invitees])
+    recent_collaborators.invalidate([uid] + [u.id for u in invitees])
+
+    if data.notify:
+        for u in invitees:
+            _notify_shared(doc_id, bumped.title, data.permission_level, inviter, u.id, u)
+    return jsonify(shared=sorted(u.id for u in invitees), not_found=not_found), 200
+
+@bp_share.post("/documents/bulk/collaborators")
+@jwt_required()
+def share_documents_bulk():
+    """
+    {document_ids: [...], user_id | email, permission_level, notify}: share
+    many documents with one user in one transaction. Documents the caller
+    doesn't own are reported back as `denied`.
+    """
+    uid = int(get_jwt_identity())
+    try:
+        data = BulkShareDocsSchema.model_validate(request.get_json() or {})
+    except ValidationError as e:
+        return _ve_to_json(e), 422
+    if not data.user_id and not data.email:
+        return jsonify(message="user_id or email required"), 400
+    if data.user_id == uid:
+        return jsonify(message="Cannot change your own role here"), 400
+
+    people = _resolve_users({uid} | ({data.user_id} if data.user_id else set()), [data.email] if data.email else [])
+    inviter = next((u for u in people if u.id == uid), None)
+    invitee = next((u for u in people if u.id != uid and (u.id == data.user_id or u.email == data.email)), None)
+    if not invitee:
+        return jsonify(message="User not found"), 404
+
+    requested = list(dict.fromkeys(data.document_ids))
+    owned = {
+        doc_id for doc_id, in
+        db.session.query(Document.id).filter(Document.id.in_(requested), Document.owner_id == uid).all()
+    }
+    denied = [doc_id for doc_id in requested if doc_id not in owned]
+    if not owned:
+        return jsonify(shared=[], denied=denied), 200
+
+    _upsert_collaborators([
+        {"document_id": doc_id, "user_id": invitee.id, "permission_level": data.permission_level}
+        for doc_id in owned
+    ])
+    position = {doc_id: i for i, doc_id in enumerate(requested)}
+    bumped = sorted(_bump_sharing_versions(list(owned)), key=lambda doc: position[doc.id])
+    db.session.commit()
+    # one message each, however many documents
+    shards.broadcast("snapshot.sharing_versions", versions=[[doc.id, doc.sharing_version] for doc in bumped])
+    permission_cache.invalidate_documents([doc.id for doc in bumped], invitee.id)
+    overview_cache.invalidate([uid, invitee.id])
+    recent_collaborators.invalidate([uid, invitee.id])
+
+    if data.notify:
+        _notify_shared_many(bumped, data.permission_level, inviter, invitee)
+    return jsonify(shared=[doc_id for doc_id in requested if doc_id in owned], denied=denied), 200
 
 @bp_share.patch("/documents/<int:doc_id>/collaborators/<int:target_id>")
 @jwt_required()
 def change_role(doc_id, target_id):
     uid = int(get_jwt_identity())
-    if not _owner_required(doc_id, uid):
+    d = db.session.query(Document.owner_id).filter_by(id=doc_id).first()
+    if not d or d.owner_id != uid:
         return jsonify(message="Only owner can change roles"), 403
     
     data = request.get_json() or {}
@@ -115,10 +276,6 @@ def change_role(doc_id, target_id):
     if level not in ("viewer", "editor"):
         return jsonify(message="Invalid permission_level"), 400
     
-    d = db.session.get(Document, doc_id)
-    if not d:
-        return jsonify(message="Not found"), 404
-    
     if target_id == d.owner_id:
         return jsonify(message="Cannot change owner's role. Transfer ownership first"), 400
 
@@ -126,7 +283,11 @@ def change_role(doc_id, target_id):
     if not c:
         return jsonify(message="Not found"), 404
     c.permission_level = level
+    bumped = _bump_sharing_version(doc_id)
     db.session.commit()
+    shards.run(doc_id, "snapshot.update", fields={"sharing_version": bumped.sharing_version})
+    permission_cache.invalidate(doc_id, target_id)
+    overview_cache.invalidate([target_id])
 
     # emit real-time update to the collaborator if connected
     socketio.emit(
@@ -134,7 +295,7 @@ def change_role(doc_id, target_id):
         {
             "type": "share_role_changed",
             "doc_id": doc_id,
-            "title": d.title,
+            "title": bumped.title,
             "permission_level": level,
             "by_user_id": uid,
             "target_user_id": target_id,
@@ -186,7 +347,13 @@ def transfer_ownership(doc_id):
             
             # switch owner
             d.owner_id = new_owner_id
+            d.sharing_version = Document.sharing_version + 1
         db.session.commit()
+        shards.run(doc_id, "snapshot.update", fields={"owner_id": new_owner_id, "sharing_version": d.sharing_version})
+        permission_cache.invalidate(doc_id, uid)
+        permission_cache.invalidate(doc_id, new_owner_id)
+        # everyone sees the new owner
+        overview_cache.invalidate_documents([doc_id])
 
         # emit real-time update to the new owner if connected
         socketio.emit(
@@ -222,13 +389,10 @@ def transfer_ownership(doc_id):
 @jwt_required()
 def remove_collaborator(doc_id, target_id):
     uid = int(get_jwt_identity())
-    if not _owner_required(doc_id, uid):
+    d = db.session.query(Document.owner_id).filter_by(id=doc_id).first()
+    if not d or d.owner_id != uid:
         return jsonify(message="Only owner can remove"), 403
     
-    d = db.session.get(Document, doc_id)
-    if not d:
-        return jsonify(message="Not found"), 404    
-    
     if target_id == d.owner_id:
         return jsonify(message="Cannot remove owner. Transfer ownership first"), 400
 
@@ -237,7 +401,11 @@ def remove_collaborator(doc_id, target_id):
         return jsonify(message="Not found"), 404
     
     db.session.delete(c)
+    bumped = _bump_sharing_version(doc_id)
     db.session.commit()
+    shards.run(doc_id, "snapshot.update", fields={"sharing_version": bumped.sharing_version})
+    permission_cache.invalidate(doc_id, target_id)
+    overview_cache.invalidate([uid, target_id])
 
     # emit real-time update to the removed collaborator if connected
     socketio.emit(
@@ -245,7 +413,7 @@ def remove_collaborator(doc_id, target_id):
         {
             "type": "share_removed",
             "doc_id": doc_id,
-            "title": d.title,
+            "title": bumped.title,
             "by_user_id": uid,
         },
         room=f"user_{target_id}",
@@ -1,8 +1,11 @@
 from flask import Blueprint, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.extensions import db, limiter
-from app.models import Document, DocumentCollaborator
+from app.models import Document
+from app.overviews import overview_cache
+from app.permissions import permission_cache
 from app.llm import summarize_text
+from app.realtime.shards import shards
 from sqlalchemy import func
 
 bp_summarize = Blueprint("summarize", __name__)
@@ -10,9 +13,7 @@ bp_summarize = Blueprint("summarize", __name__)
 def _has_access(doc, uid: int) -> bool:
     if doc.owner_id == uid:
         return True
-    return db.session.query(DocumentCollaborator.id).filter_by(
-        document_id=doc.id, user_id=uid
-    ).scalar() is not None
+    return permission_cache.level(doc.id, uid) is not None
 
 @bp_summarize.post("/documents/<int:doc_id>/summary")
 @jwt_required()
@@ -26,11 +27,15 @@ def summarize_doc(doc_id: int):
         return jsonify(message="Access denied"), 403
 
     try:
-        content = getattr(doc, "content", None) or ""
+        # the owner's snapshot includes edits that are not flushed yet
+        snap = shards.run(doc_id, "snapshot", wait=True)
+        content = snap["content"] if snap else (getattr(doc, "content", None) or "")
         summary = summarize_text(content)
         doc.summary = summary
         doc.updated_at = func.now()  # bump timestamp
         db.session.commit()
+        shards.run(doc_id, "snapshot.update", fields={"summary": summary})
+        overview_cache.invalidate_documents([doc_id])
         return jsonify(summary=summary)
     except Exception as e:
         current_app.logger.exception("summarize failed (doc_id=%s): %s", doc_id, e)
@@ -1,7 +1,11 @@
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import select, update
+from app.contacts import search_users
 from app.extensions import db
-from app.models import User
+from app.models import Document, DocumentCollaborator, User
+from app.overviews import overview_cache
+from app.realtime.shards import shards
 
 bp_users = Blueprint("users", __name__)
 
@@ -17,23 +21,28 @@ def me_patch():
     uid = int(get_jwt_identity())
     u = db.session.get(User, uid)
     data = request.get_json() or {}
-    if "username" in data and data["username"]:
+    owned = []
+    if "username" in data and data["username"] and data["username"] != u.username:
         u.username = data["username"]
+        # the name shows in collaborator lists and, for owners, document bodies: new ETags
+        rows = db.session.execute(
+            update(Document)
+            .where(Document.id.in_(select(DocumentCollaborator.document_id).where(DocumentCollaborator.user_id == uid)))
+            .values(sharing_version=Document.sharing_version + 1, updated_at=Document.updated_at)
+            .returning(Document.id, Document.owner_id, Document.sharing_version)
+            .execution_options(synchronize_session=False)
+        ).all()
+        owned = [(r.id, r.sharing_version) for r in rows if r.owner_id == uid]
     db.session.commit()
+    for doc_id, sharing_version in owned:
+        shards.run(doc_id, "snapshot.update", fields={"sharing_version": sharing_version})
+    # other users' shared lists show the owner's name
+    overview_cache.invalidate_documents([doc_id for doc_id, _ in owned])
     return jsonify(msg="updated")
 
 @bp_users.get("/users/search")
 @jwt_required()
 def user_search():
     uid = int(get_jwt_identity())
-    q = (request.args.get("q") or "").strip()
-    if not q or len(q) < 5:
-        return jsonify([]) # require at least 5 chars for query
-    rows = (
-        db.session.query(User.id, User.username, User.email)
-        .filter(User.email.ilike(f"%{q}%"), User.id != uid)
-        .order_by(User.email.asc())
-        .limit(10)
-        .all()
-    )
-    return jsonify([{"id": r.id, "username": r.username, "email": r.email} for r in rows])
+    rows = search_users(uid, request.args.get("q") or "")
+    return jsonify([{"id": id_, "username": username, "email": email} for id_, username, email in rows])
@@ -1,3 +1,10 @@
+import base64
+import hashlib
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+
+from flask import jsonify, make_response, request
 from pydantic import ValidationError
 
 def _ve_to_json(e: ValidationError):
@@ -9,4 +16,78 @@ def _ve_to_json(e: ValidationError):
             "msg": str(err.get("msg", "")),
             "type": err.get("type", ""),
         })
-    return {"message": "Invalid payload", "errors": errs}
\ No newline at end of file
+    return {"message": "Invalid payload", "errors": errs}
+
+# keyset pagination over (updated_at, id), newest first
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def _encode_cursor(updated_at: datetime, doc_id: int) -> str:
+    raw = f"{updated_at.isoformat()}|{doc_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    """(updated_at, id) of the last row of the previous page; ValueError if malformed."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        stamp, doc_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(stamp), int(doc_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def _page_limit(value: Optional[str], default: int = DEFAULT_PAGE_SIZE, maximum: int = MAX_PAGE_SIZE) -> int:
+    """?limit=, clamped to 1..maximum; ValueError if not a number."""
+    if value is None or value == "":
+        return default
+    return max(1, min(maximum, int(value)))
+
+
+# search results page by (rank, id), best first; repr() round-trips the float
+def _encode_rank_cursor(rank: float, doc_id: int) -> str:
+    raw = f"{rank!r}|{doc_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_rank_cursor(cursor: Optional[str]) -> Optional[Tuple[float, int]]:
+    """(rank, id) of the last hit of the previous page; ValueError if malformed."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        rank, doc_id = raw.rsplit("|", 1)
+        return float(rank), int(doc_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+# conditional requests: weak ETags, since bodies carry timestamps that can
+# differ for the same state (e.g. the snapshot cache's updated_at)
+def _digest(*parts) -> str:
+    return hashlib.blake2b(json.dumps(parts, default=str).encode(), digest_size=8).hexdigest()
+
+
+def _not_modified(tag: str):
+    """A 304 if the request's If-None-Match has `tag`, else None."""
+    if request.if_none_match.contains_weak(tag):
+        return _with_etag(make_response("", 304), tag)
+    return None
+
+
+def _precondition_failed(tag: Optional[str]):
+    """A 412 if the request has an If-Match that `tag` doesn't satisfy, else None."""
+    if_match = request.if_match
+    if not if_match or (tag is not None and (if_match.star_tag or if_match.contains_weak(tag))):
+        return None
+    return make_response(jsonify({"message": "Precondition failed"}), 412)
+
+
+def _with_etag(resp, tag: str):
+    resp.set_etag(tag, weak=True)
+    # browsers keep the body but always revalidate
+    resp.headers["Cache-Control"] = "private, no-cache"
+    return resp
@@ -0,0 +1,156 @@
+"""
+User lookup for the share dialog (GET /users/search).
+
+The dialog searches on every debounced keystroke, so:
+  - people the caller recently worked with are kept in memory per user
+    (RecentCollaborators) and matched there first. When they alone fill
+    a page, or the query is shorter than MIN_QUERY_CHARS, the users table
+    is not queried at all;
+  - otherwise email and username are matched by case-insensitive prefix
+    through idx_users_email_prefix / idx_users_username_prefix, each side
+    an index range scan stopping after RESULT_LIMIT rows.
+"""
+from typing import List, Tuple
+
+from sqlalchemy import func, select, union_all
+
+from .cache import TTLCache
+from .extensions import db
+from .models import Document, DocumentCollaborator, User
+from .realtime.shards import shards
+
+# below this, only recent collaborators are searched: no enumerating users
+MIN_QUERY_CHARS = 5
+RESULT_LIMIT = 10
+# recent collaborators are taken from the user's most recently updated documents
+RECENT_DOCUMENTS = 200
+
+Contact = Tuple[int, str, str]  # id, username, email
+
+
+def _like_prefix(q: str) -> str:
+    return q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def _matches(contact: Contact, q: str) -> bool:
+    return contact[2].lower().startswith(q) or contact[1].lower().startswith(q)
+
+
+class RecentCollaborators:
+    """
+    Per user, the people sharing their RECENT_DOCUMENTS most recently
+    updated documents, most recent first (at most RECENT_COLLABORATORS_PER_USER).
+    Loaded on first use and kept RECENT_COLLABORATORS_TTL_SECONDS; sharing
+    a document invalidates both sides so a new collaborator shows up at
+    once. Renames and removals are picked up at expiry.
+    """
+
+    def __init__(self):
+        # user_id -> [Contact]; the TTL applies per user
+        self._cache = TTLCache()
+        self.per_user = 50
+        # counters
+        self.hits = 0
+        self.misses = 0
+        self.answered = 0
+        self.lookups = 0
+
+    def init_app(self, app) -> None:
+        self._cache.ttl = app.config["RECENT_COLLABORATORS_TTL_SECONDS"]
+        self._cache.max_entries = app.config["RECENT_COLLABORATORS_MAX_USERS"]
+        self.per_user = app.config["RECENT_COLLABORATORS_PER_USER"]
+        self._cache.clear()
+
+    def get(self, user_id: int) -> List[Contact]:
+        contacts = self._cache.get(user_id)
+        if contacts is not None:
+            self.hits += 1
+            return contacts
+        self.misses += 1
+        mine = DocumentCollaborator
+        other = db.aliased(DocumentCollaborator)
+        recent = (
+            select(Document.id, Document.updated_at)
+            .join(mine, mine.document_id == Document.id)
+            .where(mine.user_id == user_id)
+            .order_by(Document.updated_at.desc())
+            .limit(RECENT_DOCUMENTS)
+            .subquery()
+        )
+        rows = (
+            db.session.query(User.id, User.username, User.email)
+            .join(other, other.user_id == User.id)
+            .join(recent, recent.c.id == other.document_id)
+            .filter(User.id != user_id)
+            .group_by(User.id)
+            .order_by(func.max(recent.c.updated_at).desc(), User.id)
+            .limit(self.per_user)
+            .all()
+        )
+        contacts = [(r.id, r.username, r.email) for r in rows]
+        self._cache.put(user_id, contacts)
+        return contacts
+
+    def invalidate(self, user_ids: List[int]) -> None:
+        """Forget these users' recent collaborators on every worker."""
+        users = sorted(set(user_ids))
+        if users:
+            shards.broadcast("contacts.invalidate", user_ids=users)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "users": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "answered": self.answered,
+            "lookups": self.lookups,
+        }
+
+    def _drop(self, user_ids: List[int]) -> None:
+        for user_id in user_ids:
+            self._cache.pop(user_id)
+
+
+recent_collaborators = RecentCollaborators()
+
+
+@shards.task("contacts.invalidate")
+def _invalidate(user_ids: List[int]) -> None:
+    recent_collaborators._drop(user_ids)
+
+
+def _prefix(column, pattern: str, user_id: int):
+    key = func.lower(column).collate("C")
+    return (
+        select(User.id, User.username, User.email)
+        .where(key.like(pattern, escape="\\"), User.id != user_id)
+        .order_by(key)
+        .limit(RESULT_LIMIT)
+    )
+
+
+def search_users(user_id: int, q: str) -> List[Contact]:
+    """
+    Up to RESULT_LIMIT users other than the caller whose email or username
+    starts with `q` (case-insensitive): recent collaborators first, then
+    email matches by email, then username matches by username.
+    """
+    q = q.strip().lower()
+    if not q:
+        return []
+    recent = [c for c in recent_collaborators.get(user_id) if _matches(c, q)]
+    if len(recent) >= RESULT_LIMIT or len(q) < MIN_QUERY_CHARS:
+        recent_collaborators.answered += 1
+        return recent[:RESULT_LIMIT]
+
+    recent_collaborators.lookups += 1
+    pattern = _like_prefix(q)
+    rows = db.session.execute(
+        union_all(_prefix(User.email, pattern, user_id), _prefix(User.username, pattern, user_id))
+    ).all()
+    found = {c[0]: c for c in recent}
+    for r in rows:
+        found.setdefault(r.id, (r.id, r.username, r.email))
+    return list(found.values())[:RESULT_LIMIT]
@@ -1,15 +1,14 @@
 from functools import wraps
-from typing import Optional, Dict
+from typing import Optional, Tuple
 
-import jwt
 from flask import request, current_app
 from flask_socketio import emit
 
-from ..extensions import db
-from ..models import DocumentCollaborator
-
-# In-memory map of Socket.IO sid -> user_id
-_SID_USER: Dict[str, int] = {}
+from ..metrics import metrics
+from ..permissions import permission_cache
+from ..realtime.connections import connections
+from ..realtime.limits import socket_limiter
+from ..tokens import token_verifier
 
 
 def _extract_token_from_handshake() -> Optional[str]:
@@ -31,42 +30,44 @@ def ws_on_connect_auth() -> Optional[int]:
     if not token:
         current_app.logger.debug("WS connect: missing token")
         return None
-    try:
-        payload = jwt.decode(
-            token,
-            current_app.config["JWT_SECRET_KEY"],
-            algorithms=["HS256"],
-            options={"verify_aud": False},
-        )
-        uid = int(payload["sub"])
-    except Exception as e:
-        current_app.logger.debug("WS connect: JWT decode failed: %s", e)
+    claims = token_verifier.verify(token)
+    if claims is None:
+        current_app.logger.debug("WS connect: invalid, expired or revoked token")
         return None
+    uid = int(claims["sub"])
 
-    _SID_USER[request.sid] = uid
+    if not connections.connect(request.sid, uid):
+        current_app.logger.warning("WS connect: refused sid=%s, worker is at SOCKET_MAX_CONNECTIONS", request.sid)
+        return None
     current_app.logger.debug("WS connect OK: sid=%s uid=%s", request.sid, uid)
     return uid
 
 
-def ws_on_disconnect_cleanup() -> None:
-    """Clean up sid mapping on disconnect."""
-    uid = _SID_USER.pop(request.sid, None)
+def ws_on_disconnect_cleanup() -> Tuple[int, ...]:
+    """Drop the sid from the connection registry; returns the documents it had joined."""
+    uid = connections.user(request.sid)
+    docs = connections.disconnect(request.sid)
     current_app.logger.debug("WS disconnect: sid=%s uid=%s", request.sid, uid)
+    return docs
 
 
 def ws_login_required(fn):
     """
     Decorator for Socket.IO events:
-    Ensures the socket was authenticated at connect time.
+    Ensures the socket was authenticated at connect time and is within
+    its rate limits (realtime/limits.py; the event may be held and run later).
     Injects 'user_id' as first arg to the handler.
     """
     @wraps(fn)
     def wrapper(*args, **kwargs):
-        uid = _SID_USER.get(request.sid)
+        uid = connections.user(request.sid)
         if not uid:
             emit("error", {"message": "unauthenticated"}, room=request.sid)
             return
-        return fn(uid, *args, **kwargs)
+        if not socket_limiter.admit(uid, fn, args[0] if args else None):
+            return
+        with metrics.timed("socket_event_seconds", event=request.event["message"]):
+            return fn(uid, *args, **kwargs)
     return wrapper
 
 
@@ -80,17 +81,15 @@ def document_access_required(levels=("viewer", "editor", "owner")):
     def deco(fn):
         @wraps(fn)
         def wrapper(user_id, data, *args, **kwargs):
-            doc_id = (data or {}).get("document_id")
+            try:
+                doc_id = int((data or {}).get("document_id") or 0)
+            except (TypeError, ValueError):
+                doc_id = 0
             if not doc_id:
                 emit("error", {"message": "Missing document_id"}, room=request.sid)
                 return
 
-            collab = (
-                db.session.query(DocumentCollaborator)
-                .filter_by(document_id=doc_id, user_id=user_id)
-                .first()
-            )
-            if not collab or collab.permission_level not in levels:
+            if permission_cache.level(doc_id, user_id) not in levels:
                 emit("error", {"message": "Access denied"}, room=request.sid)
                 return
 
@@ -4,7 +4,7 @@ import ssl
 from email.message import EmailMessage
 import logging
 from concurrent.futures import ThreadPoolExecutor
-from typing import Optional
+from typing import List, Optional, Tuple
 
 log = logging.getLogger(__name__)
 
@@ -85,6 +85,44 @@ def _build_share_email(
     return subject, html, text
 
 
+def _build_shares_email(
+    recipient_name: Optional[str],
+    documents: List[Tuple[int, str]],
+    invited_by: str,
+) -> tuple[str, str, str]:
+    """One email for many documents shared at once (bulk sharing)."""
+    subject = f"{invited_by} shared {len(documents)} documents with you"
+    greet_name = recipient_name or "there"
+
+    items = "".join(
+        f'<li style="margin:.25rem 0"><a href="{PUBLIC_ORIGIN}/docs/{doc_id}/"><em>{title or "Untitled"}</em></a></li>'
+        for doc_id, title in documents
+    )
+    html = f"""
+      <div style="font-family:system-ui,Segoe UI,Roboto,Arial">
+        <h2 style="margin:0 0 .5rem">Yei, you've been invited to {len(documents)} docs!</h2>
+        <p>Hi {greet_name}, </p>
+        <p style="margin:.25rem 0 1rem">
+          <strong>{invited_by}</strong> shared these documents with you:
+        </p>
+        <ul style="font-size:16px;margin:.25rem 0 1rem">{items}</ul>
+        <p> Hush, hush, open them and start collaborating!</p>
+        <p style="color:#64748b;font-size:12px;margin-top:1rem">
+           Oh, btw: If you weren't expecting this, you can just ignore it :>.
+        </p>
+      </div>
+    """
+    lines = "".join(f"  - {title or 'Untitled'}: {PUBLIC_ORIGIN}/docs/{doc_id}\n" for doc_id, title in documents)
+    text = (
+        f"Hi {greet_name},\n"
+        f"{invited_by} shared {len(documents)} documents with you:\n"
+        f"{lines}"
+        f"Hush, hush, open them and start collaborating!\n"
+        f"If you weren't expecting this, you can ignore it.\n"
+    )
+    return subject, html, text
+
+
 def _send_smtp(to_email: str, subject: str, html: str, text: str) -> bool:
     msg = EmailMessage()
     msg["From"] = FROM_EMAIL
@@ -150,7 +188,24 @@ def send_share_email(
         invited_by=invited_by,
         doc_id=doc_id,
     )
+    return _send(to_email, subject, html, text)
+
+def send_shares_email(
+    to_email: str,
+    documents: List[Tuple[int, str]],
+    invited_by: str,
+    *,
+    recipient_name: Optional[str] = None,
+) -> bool:
+    """Like send_share_email(), for (doc_id, title) of several documents."""
+    if not ENABLED or not FROM_EMAIL or not to_email:
+        log.info("Email disabled or missing FROM/recipient; skip. to=%s", to_email)
+        return False
+
+    subject, html, text = _build_shares_email(recipient_name, documents, invited_by)
+    return _send(to_email, subject, html, text)
 
+def _send(to_email: str, subject: str, html: str, text: str) -> bool:
     if BACKEND == "ses":
         return _send_ses(to_email, subject, html, text)
     return _send_smtp(to_email, subject, html, text)
@@ -173,4 +228,14 @@ def send_share_email_bg(
         invited_by,
         recipient_name=recipient_name,
         doc_id=doc_id,
-    )
\ No newline at end of file
+    )
+
+def send_shares_email_bg(
+    to_email: str,
+    documents: List[Tuple[int, str]],
+    invited_by: str,
+    *,
+    recipient_name: Optional[str] = None,
+) -> None:
+    """Background version of send_shares_email(). Returns immediately."""
+    _executor.submit(send_shares_email, to_email, documents, invited_by, recipient_name=recipient_name)
@@ -8,7 +8,7 @@ import os
 
 db = SQLAlchemy()
 jwt = JWTManager()
-socketio = SocketIO(cors_allowed_origins="*", message_queue=None)  # set Redis URL later
+socketio = SocketIO(cors_allowed_origins="*")  # message_queue (Redis) is set in create_app
 limiter = Limiter(key_func=get_remote_address, 
                   storage_uri=os.getenv("LIMITER_STORAGE_URI", "memory://") # Redis in prod
-                  )
\ No newline at end of file
+                  )
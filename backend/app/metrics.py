@@ -0,0 +1,242 @@
+"""
+Prometheus text-format metrics for the realtime path, served at /metrics
+next to /health. nginx only proxies /api and /socket.io, so the route is
+reachable from inside the deployment only.
+
+  - collab_socket_event_seconds{event}: authenticated socket handlers
+    (timed in ws_login_required);
+  - collab_permission_check_seconds: PermissionCache.level(), hits included;
+  - collab_db_commit_seconds: Session.commit(), flush included;
+  - collab_socket_room_sockets: room sizes on this worker;
+  - collab_socket_sent_{packets,bytes}_total: Engine.IO packets handed to
+    the transports (a broadcast counts once per recipient; bytes are the
+    encoded payload, characters for text frames);
+  - collab_event_loop_lag_seconds plus eventlet hub timers/listeners:
+    how far behind the hub is;
+  - every numeric value of the realtime components' stats().
+
+Recording is a bisect and a few integer adds; everything else is computed
+when /metrics is scraped. Values are per worker and labelled with the
+worker id (shards.py), "standalone" without sharding.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .extensions import socketio
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SIZE_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 250)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+HELP = {
+    "socket_event_seconds": "Socket event handler latency",
+    "permission_check_seconds": "Permission check latency",
+    "db_commit_seconds": "Database commit latency, flush included",
+    "event_loop_lag_seconds": "How late the event loop wakes a sleeping green thread",
+}
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name: str, labels: str) -> Iterable[str]:
+        sep = "," if labels else ""
+        running = 0
+        for bound, count in zip(self.bounds, self.counts):
+            running += count
+            yield f'{name}_bucket{{{labels}{sep}le="{bound}"}} {running}'
+        yield f'{name}_bucket{{{labels}{sep}le="+Inf"}} {self.count}'
+        yield f"{name}_sum{{{labels}}} {self.sum}"
+        yield f"{name}_count{{{labels}}} {self.count}"
+
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    """Histograms, send counters and component stats; see the module docstring."""
+
+    def __init__(self):
+        self.enabled = True
+        self.lag_interval = 0.25
+        self._histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Histogram] = {}
+        self._stats: List[Tuple[str, Callable[[], dict]]] = []
+        self._lock = threading.Lock()
+        self._hooked = False
+        self._worker = None
+        # counters
+        self.sent_packets = 0
+        self.sent_bytes = 0
+
+    def init_app(self, app) -> None:
+        """Call after socketio.init_app(): wraps the Engine.IO server it created."""
+        self.enabled = app.config["METRICS_ENABLED"]
+        if not self.enabled:
+            return
+        self._hook_sessions()
+        self._hook_sends()
+
+        from .contacts import recent_collaborators
+        from .overviews import overview_cache
+        from .passwords import password_pool
+        from .permissions import permission_cache
+        from .realtime.batcher import room_batcher
+        from .realtime.buffer import write_buffer
+        from .realtime.connections import connections
+        from .realtime.crdt import crdt_sync
+        from .realtime.limits import socket_limiter
+        from .realtime.oplog import op_log
+        from .realtime.presence import presence
+        from .realtime.shards import shards
+        from .realtime.snapshots import snapshot_cache
+        from .tokens import token_verifier
+        self._stats = [
+            ("socket", connections.stats),
+            ("socket_limiter", socket_limiter.stats),
+            ("permission_cache", permission_cache.stats),
+            ("overview_cache", overview_cache.stats),
+            ("recent_collaborators", recent_collaborators.stats),
+            ("tokens", token_verifier.stats),
+            ("passwords", password_pool.stats),
+            ("write_buffer", write_buffer.stats),
+            ("op_log", op_log.stats),
+            ("snapshot_cache", snapshot_cache.stats),
+            ("room_batcher", room_batcher.stats),
+            ("presence", presence.stats),
+            ("crdt", crdt_sync.stats),
+            ("shards", shards.stats),
+        ]
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram())
+        histogram.observe(seconds)
+
+    @contextmanager
+    def timed(self, name: str, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def render(self) -> str:
+        self._ensure_worker()
+        from .realtime.connections import connections
+        from .realtime.shards import shards
+        worker = f'worker="{_label(shards.worker_id or "standalone")}"'
+        out: List[str] = []
+
+        seen = set()
+        for (name, labels), histogram in sorted(list(self._histograms.items())):
+            metric = f"collab_{name}"
+            if name not in seen:
+                seen.add(name)
+                out.append(f"# HELP {metric} {HELP.get(name, name)}")
+                out.append(f"# TYPE {metric} histogram")
+            label_text = ",".join([worker] + [f'{k}="{_label(v)}"' for k, v in labels])
+            out.extend(histogram.lines(metric, label_text))
+
+        rooms = Histogram(SIZE_BUCKETS)
+        for size in connections.room_sizes():
+            rooms.observe(size)
+        out.append("# HELP collab_socket_room_sockets Sockets per document room")
+        out.append("# TYPE collab_socket_room_sockets histogram")
+        out.extend(rooms.lines("collab_socket_room_sockets", worker))
+
+        for name, value in (("sent_packets_total", self.sent_packets), ("sent_bytes_total", self.sent_bytes)):
+            out.append(f"# TYPE collab_socket_{name} counter")
+            out.append(f"collab_socket_{name}{{{worker}}} {value}")
+
+        for name, value in self._hub().items():
+            out.append(f"# TYPE collab_eventlet_{name} gauge")
+            out.append(f"collab_eventlet_{name}{{{worker}}} {value}")
+
+        for prefix, stats in self._stats:
+            for key, value in stats().items():
+                if isinstance(value, (int, float)):
+                    out.append(f"# TYPE collab_{prefix}_{key} untyped")
+                    out.append(f"collab_{prefix}_{key}{{{worker}}} {float(value)}")
+        return "\n".join(out) + "\n"
+
+    def _hub(self) -> Dict[str, int]:
+        """Timers scheduled on the eventlet hub and file descriptors it watches."""
+        if socketio.async_mode != "eventlet":
+            return {}
+        from eventlet import hubs
+        hub = hubs.get_hub()
+        return {
+            "timers": len(hub.timers) + len(hub.next_timers),
+            "listeners": sum(len(fds) for fds in hub.listeners.values()),
+        }
+
+    def _hook_sessions(self) -> None:
+        if self._hooked:
+            return
+        self._hooked = True
+
+        @event.listens_for(Session, "before_commit")
+        def _started(session):
+            session.info["metrics_commit_started"] = time.perf_counter()
+
+        @event.listens_for(Session, "after_commit")
+        def _committed(session):
+            started = session.info.pop("metrics_commit_started", None)
+            if started is not None:
+                self.observe("db_commit_seconds", time.perf_counter() - started)
+
+        @event.listens_for(Session, "after_rollback")
+        def _rolled_back(session):
+            session.info.pop("metrics_commit_started", None)
+
+    def _hook_sends(self) -> None:
+        # everything python-socketio sends, broadcasts included, ends up here
+        eio = socketio.server.eio
+        send_packet = eio.send_packet
+        if getattr(send_packet, "_metrics", False):
+            return
+
+        def counted(sid, pkt):
+            self.sent_packets += 1
+            if isinstance(pkt.data, (str, bytes)):
+                self.sent_bytes += len(pkt.data)
+            return send_packet(sid, pkt)
+
+        counted._metrics = True
+        eio.send_packet = counted
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None and self.lag_interval > 0:
+            self._worker = socketio.start_background_task(self._run)
+
+    def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            socketio.sleep(self.lag_interval)
+            self.observe("event_loop_lag_seconds", max(0.0, time.perf_counter() - started - self.lag_interval))
+
+
+metrics = Metrics()
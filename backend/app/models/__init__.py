@@ -1,10 +1,9 @@
 from datetime import datetime
-from sqlalchemy import func, CheckConstraint, ForeignKey, Index
-from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy import func, CheckConstraint, Computed, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
+from sqlalchemy.orm import deferred
 from ..extensions import db
-from argon2 import PasswordHasher
-
-ph = PasswordHasher()
+from ..passwords import password_pool
 
 class User(db.Model):
     __tablename__ = "users"
@@ -15,13 +14,19 @@ class User(db.Model):
     created_at = db.Column(db.DateTime(timezone=True), server_default=func.now(), nullable=False)
 
     def set_password(self, raw: str) -> None:
-        self.password_hash = ph.hash(raw)
+        self.password_hash = password_pool.hash(raw)
     
     def check_password(self, raw: str) -> bool:
-        try:
-            return ph.verify(self.password_hash, raw)
-        except Exception:
-            return False
+        """On success, also upgrades password_hash to the current Argon2 parameters (commit it)."""
+        ok, rehashed = password_pool.verify(self.password_hash, raw)
+        if rehashed is not None:
+            self.password_hash = rehashed
+        return ok
+
+# share dialog lookups (app/contacts.py): case-insensitive prefix matches, in
+# byte order so LIKE 'abc%' and ORDER BY can both use a plain btree
+Index("idx_users_email_prefix", func.lower(User.email).collate("C"))
+Index("idx_users_username_prefix", func.lower(User.username).collate("C"))
 
 class Document(db.Model):
     __tablename__ = "documents"
@@ -30,11 +35,47 @@ class Document(db.Model):
     description = db.Column(db.Text)
     content = db.Column(JSONB)  # store Quill Delta or Yjs snapshot
     summary = db.Column(db.Text)
+    version = db.Column(db.BigInteger, nullable=False, default=0, server_default="0")  # bumped per realtime op
+    # version `content` reflects; later ops are in document_ops (see realtime/oplog.py)
+    content_version = db.Column(db.BigInteger, nullable=False, default=0, server_default="0")
+    # bumped when the collaborator set, a role or a collaborator's name changes (ETags, see api/utils.py)
+    sharing_version = db.Column(db.BigInteger, nullable=False, default=0, server_default="0")
+    # plain text of `content`, written with it (see search.py); title and text are indexed for search
+    content_text = deferred(db.Column(db.Text, nullable=False, default="", server_default=""))
+    search_vector = deferred(db.Column(TSVECTOR, Computed(
+        "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+        "setweight(to_tsvector('simple', content_text), 'B')",
+        persisted=True,
+    )))
+    ydoc_state = deferred(db.Column(db.LargeBinary))  # compacted Yjs update, see realtime/crdt.py
     owner_id = db.Column(db.BigInteger, ForeignKey("users.id", ondelete="RESTRICT"), nullable=False)
     created_at = db.Column(db.DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at = db.Column(db.DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
 
-Index("idx_documents_owner_id", Document.owner_id)
+# document lists page newest first by (updated_at, id); see api/documents.py
+Index("idx_documents_owner_updated", Document.owner_id, Document.updated_at.desc(), Document.id.desc())
+Index("idx_documents_updated", Document.updated_at.desc(), Document.id.desc())
+Index("idx_documents_search", Document.search_vector, postgresql_using="gin")
+
+class DocumentOp(db.Model):
+    """One realtime change (a Quill Delta) that produced `version`."""
+    __tablename__ = "document_ops"
+    document_id = db.Column(db.BigInteger, ForeignKey("documents.id", ondelete="CASCADE"), primary_key=True)
+    version = db.Column(db.BigInteger, primary_key=True)
+    ops = db.Column(JSONB, nullable=False)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+class DocumentYjsUpdate(db.Model):
+    """Yjs updates appended since the last compaction into Document.ydoc_state."""
+    __tablename__ = "document_yjs_updates"
+    id = db.Column(db.BigInteger, primary_key=True)
+    document_id = db.Column(db.BigInteger, ForeignKey("documents.id", ondelete="CASCADE"), nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index("idx_document_yjs_updates_document_id", "document_id"),
+    )
 
 class DocumentCollaborator(db.Model):
     __tablename__ = "document_collaborators"
@@ -53,4 +94,11 @@ class TokenBlocklist(db.Model):
     jti = db.Column(db.String(36), index=True, nullable=False, unique=True)
     token_type = db.Column(db.String(10), nullable=False) # either "access" | "refresh"
     created_at = db.Column(db.DateTime(timezone=True), server_default=func.now(), nullable=False)
-    user_id = db.Column(db.BigInteger, nullable=False)
\ No newline at end of file
+    # the token's own expiry; the row is purged after it (see tokens.py)
+    expires_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    user_id = db.Column(db.BigInteger, nullable=False)
+
+    __table_args__ = (
+        Index("idx_token_blocklist_created_at", "created_at"),
+        Index("idx_token_blocklist_expires_at", "expires_at"),
+    )
\ No newline at end of file
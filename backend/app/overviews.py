@@ -0,0 +1,146 @@
+import json
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .cache import TTLCache
+from .extensions import db
+from .models import DocumentCollaborator
+from .realtime.shards import shards
+
+try:
+    import redis
+except ImportError:  # only needed for the shared tier
+    redis = None
+
+_KEY = "overview:"
+
+
+class OverviewCache:
+    """
+    Rendered /documents/overview pages, per user and query string, with
+    their ETag. Kept in process, and optionally in Redis as well
+    (OVERVIEW_CACHE_URL) so other workers and restarts start warm.
+
+    A user's pages depend on every document they collaborate on, so:
+      - anything that changes what a document shows in overviews (title,
+        updated_at, owner, deletion) invalidates all its collaborators:
+        REST writes, realtime flushes (buffer.py) and ownership transfers;
+      - share, role change and removal invalidate the users whose lists
+        actually change: the target and, for share counts, the owner.
+    invalidate() drops the user's pages on every worker through the shard
+    bus and deletes them from Redis. A page computed while an invalidation
+    was in flight is not stored in process; in Redis, such a page lives at
+    most OVERVIEW_CACHE_TTL_SECONDS.
+    """
+
+    def __init__(self):
+        # user_id -> {query key: (etag, body)}; the TTL applies per user
+        self._local = TTLCache()
+        # user_id -> time.monotonic() of the last invalidation
+        self._invalidated = TTLCache()
+        self._redis = None
+        self.ttl = 30.0
+        # counters
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def init_app(self, app) -> None:
+        self.ttl = app.config["OVERVIEW_CACHE_TTL_SECONDS"]
+        self._local.ttl = self._invalidated.ttl = self.ttl
+        self._local.max_entries = self._invalidated.max_entries = app.config["OVERVIEW_CACHE_MAX_USERS"]
+        self._local.clear()
+        self._invalidated.clear()
+        url = app.config["OVERVIEW_CACHE_URL"]
+        if url and redis is None:
+            raise RuntimeError("OVERVIEW_CACHE_URL is set but the redis package is not installed")
+        self._redis = redis.Redis.from_url(url) if url else None
+
+    def get(self, user_id: int, key: str) -> Optional[Tuple[str, dict]]:
+        """(etag, body) of a cached page, or None."""
+        pages: Optional[Dict[str, Tuple[str, dict]]] = self._local.get(user_id)
+        if pages is not None and key in pages:
+            self.hits += 1
+            return pages[key]
+        if self._redis is not None:
+            raw = self._redis.hget(_KEY + str(user_id), key)
+            if raw is not None:
+                self.shared_hits += 1
+                tag, body = json.loads(raw)
+                self._store_local(user_id, key, (tag, body))
+                return tag, body
+        self.misses += 1
+        return None
+
+    def put(self, user_id: int, key: str, tag: str, body: dict, started: float) -> None:
+        """Store a page computed since `started` (time.monotonic()), unless the user was invalidated meanwhile."""
+        invalidated = self._invalidated.get(user_id)
+        if invalidated is not None and invalidated >= started:
+            return
+        self._store_local(user_id, key, (tag, body))
+        if self._redis is not None:
+            name = _KEY + str(user_id)
+            pipe = self._redis.pipeline()
+            pipe.hset(name, key, json.dumps([tag, body]))
+            pipe.expire(name, max(1, int(self.ttl)))
+            pipe.execute()
+
+    def collaborators(self, doc_ids: Iterable[int]) -> List[int]:
+        """Users whose overviews show any of these documents (read before deleting them)."""
+        ids = list(doc_ids)
+        if not ids:
+            return []
+        rows = (
+            db.session.query(DocumentCollaborator.user_id)
+            .filter(DocumentCollaborator.document_id.in_(ids))
+            .distinct()
+            .all()
+        )
+        return [user_id for user_id, in rows]
+
+    def invalidate_documents(self, doc_ids: Iterable[int]) -> None:
+        """Call after committing a change to what these documents show in overviews."""
+        self.invalidate(self.collaborators(doc_ids))
+
+    def invalidate(self, user_ids: Iterable[int]) -> None:
+        """Forget these users' pages everywhere."""
+        users = sorted(set(user_ids))
+        if not users:
+            return
+        if self._redis is not None:
+            self._redis.delete(*[_KEY + str(user_id) for user_id in users])
+        shards.broadcast("overviews.invalidate", user_ids=users)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            "users": len(self._local),
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.shared_hits) / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+        }
+
+    def _store_local(self, user_id: int, key: str, page: Tuple[str, dict]) -> None:
+        pages = self._local.get(user_id)
+        if pages is None:
+            pages = {}
+            self._local.put(user_id, pages)
+        pages[key] = page
+
+    def _drop(self, user_ids: List[int]) -> None:
+        now = time.monotonic()
+        for user_id in user_ids:
+            self._local.pop(user_id)
+            self._invalidated.put(user_id, now)
+        self.invalidations += len(user_ids)
+
+
+overview_cache = OverviewCache()
+
+
+@shards.task("overviews.invalidate")
+def _invalidate(user_ids: List[int]) -> None:
+    overview_cache._drop(user_ids)
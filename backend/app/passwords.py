@@ -0,0 +1,152 @@
+"""
+Argon2 password hashing off the eventlet hub.
+
+An Argon2 hash or verification is tens of milliseconds of CPU and 64 MiB
+of memory at the default parameters. Run on the hub, it stalls every
+socket of the worker for that long, once per login. Here it runs on
+eventlet's native thread pool (tpool), where argon2-cffi releases the
+GIL, while the calling green thread waits:
+
+  - at most PASSWORD_HASH_THREADS run at once (0: inline, as before);
+  - they run PASSWORD_HASH_NICE steps below the hub's priority, so on a
+    busy machine the hub still gets the CPU it needs;
+  - at most PASSWORD_HASH_QUEUE more wait for a slot; beyond that the
+    request is shed with PasswordHasherBusy (503 + Retry-After) instead
+    of queueing logins behind each other while the hub stays busy.
+
+Hashes are made with the ARGON2_* parameters. A successful verification
+of a hash made with other parameters rehashes the password in the same
+pool job, so raising them upgrades users as they log in.
+
+benchmarks/bench_login_storm.py measures socket latency during a burst
+of logins.
+"""
+import os
+import threading
+from typing import Callable, Optional, Tuple
+
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+
+from .extensions import socketio
+
+try:
+    from eventlet.patcher import original
+    _native_id = original("threading").get_native_id
+except ImportError:
+    _native_id = threading.get_native_id
+
+
+class PasswordHasherBusy(RuntimeError):
+    """Too many hashes queued; try again later."""
+
+
+class PasswordPool:
+    """Argon2 hashing on a bounded native thread pool; see the module docstring."""
+
+    def __init__(self):
+        self.threads = 2
+        self.max_queue = 16
+        self.nice = 10
+        self.hasher = PasswordHasher()
+        self._slots = threading.BoundedSemaphore(self.threads)
+        self._lock = threading.Lock()
+        self._offload: Optional[bool] = None
+        self._running = 0
+        self._waiting = 0
+        # counters
+        self.hashed = 0
+        self.verified = 0
+        self.rehashed = 0
+        self.shed = 0
+
+    def init_app(self, app) -> None:
+        self.threads = app.config["PASSWORD_HASH_THREADS"]
+        self.max_queue = app.config["PASSWORD_HASH_QUEUE"]
+        self.nice = app.config["PASSWORD_HASH_NICE"]
+        self.hasher = PasswordHasher(
+            time_cost=app.config["ARGON2_TIME_COST"],
+            memory_cost=app.config["ARGON2_MEMORY_COST_KIB"],
+            parallelism=app.config["ARGON2_PARALLELISM"],
+        )
+        # created here: gunicorn's eventlet worker has monkey patched threading by now
+        self._slots = threading.BoundedSemaphore(max(1, self.threads))
+        self._lock = threading.Lock()
+        self._offload = None
+
+    def hash(self, password: str) -> str:
+        hashed = self._submit(self.hasher.hash, password)
+        self.hashed += 1
+        return hashed
+
+    def verify(self, stored: str, password: str) -> Tuple[bool, Optional[str]]:
+        """(matches, new hash if `stored` was made with other parameters)."""
+        ok, rehashed = self._submit(self._verify, stored, password)
+        self.verified += 1
+        if rehashed is not None:
+            self.rehashed += 1
+        return ok, rehashed
+
+    def stats(self) -> dict:
+        return {
+            "threads": self.threads,
+            "running": self._running,
+            "waiting": self._waiting,
+            "hashed": self.hashed,
+            "verified": self.verified,
+            "rehashed": self.rehashed,
+            "shed": self.shed,
+        }
+
+    def _verify(self, stored: str, password: str) -> Tuple[bool, Optional[str]]:
+        try:
+            self.hasher.verify(stored, password)
+        except (VerificationError, InvalidHashError):
+            return False, None
+        if self.hasher.check_needs_rehash(stored):
+            return True, self.hasher.hash(password)
+        return True, None
+
+    def _submit(self, fn: Callable, *args):
+        if self.threads <= 0:
+            return fn(*args)
+        with self._lock:
+            if self._running + self._waiting >= self.threads + self.max_queue:
+                self.shed += 1
+                raise PasswordHasherBusy(f"{self._running} hashing, {self._waiting} waiting")
+            self._waiting += 1
+        self._slots.acquire()
+        with self._lock:
+            self._waiting -= 1
+            self._running += 1
+        try:
+            if self._offloaded():
+                from eventlet import tpool
+                return tpool.execute(self._niced, fn, *args)
+            return fn(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+            self._slots.release()
+
+    def _niced(self, fn: Callable, *args):
+        # on the tpool thread; Linux nice values are per thread, and the
+        # threads libargon2 starts for its lanes inherit it
+        if self.nice and hasattr(os, "setpriority"):
+            try:
+                os.setpriority(os.PRIO_PROCESS, _native_id(), self.nice)
+            except OSError:
+                pass
+        return fn(*args)
+
+    def _offloaded(self) -> bool:
+        # without eventlet's monkey patching the caller is a native thread already
+        if self._offload is None:
+            self._offload = False
+            if socketio.async_mode == "eventlet":
+                from eventlet import patcher
+                self._offload = patcher.is_monkey_patched("thread")
+        return self._offload
+
+
+password_pool = PasswordPool()
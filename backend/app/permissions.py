@@ -0,0 +1,105 @@
+import time
+from typing import Dict, List, Optional
+
+from .cache import TTLCache
+from .extensions import db
+from .metrics import metrics
+from .models import DocumentCollaborator
+from .realtime.shards import shards
+
+_MISS = object()
+
+
+class PermissionCache:
+    """
+    Per-(document, user) permission level shared by the REST and socket
+    permission checks. Only granted levels are cached; misses always go to
+    Postgres so a fresh share is seen immediately. Entries expire after
+    PERMISSION_CACHE_TTL_SECONDS, but anything that changes a collaborator
+    row must call invalidate() so revocations apply on the very next check.
+    A level read while an invalidation of its document was in flight is
+    returned but not stored.
+    """
+
+    def __init__(self):
+        # doc_id -> {user_id: level}; the TTL applies per document
+        self._cache = TTLCache()
+        # doc_id -> time.monotonic() of the last invalidation
+        self._invalidated = TTLCache()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app) -> None:
+        self._cache.ttl = self._invalidated.ttl = app.config["PERMISSION_CACHE_TTL_SECONDS"]
+        self._cache.max_entries = self._invalidated.max_entries = app.config["PERMISSION_CACHE_MAX_DOCS"]
+
+    def level(self, doc_id: int, user_id: int) -> Optional[str]:
+        """'owner' | 'editor' | 'viewer', or None without access."""
+        started = time.perf_counter()
+        try:
+            return self._level(doc_id, user_id)
+        finally:
+            metrics.observe("permission_check_seconds", time.perf_counter() - started)
+
+    def _level(self, doc_id: int, user_id: int) -> Optional[str]:
+        levels: Optional[Dict[int, Optional[str]]] = self._cache.get(doc_id)
+        if levels is not None:
+            level = levels.get(user_id, _MISS)
+            if level is not _MISS:
+                self.hits += 1
+                return level
+        self.misses += 1
+        started = time.monotonic()
+        level = (
+            db.session.query(DocumentCollaborator.permission_level)
+            .filter_by(document_id=doc_id, user_id=user_id)
+            .scalar()
+        )
+        if level is None:
+            return None
+        invalidated = self._invalidated.get(doc_id)
+        if invalidated is not None and invalidated >= started:
+            # a revoke may have landed after the read: don't cache its result
+            return level
+        levels = self._cache.get(doc_id)
+        if levels is None:
+            levels = {}
+            self._cache.put(doc_id, levels)
+        levels[user_id] = level
+        return level
+
+    def invalidate(self, doc_id: int, user_id: Optional[int] = None) -> None:
+        """Forget one user's level on a document, or everyone's, on every worker."""
+        self.invalidate_documents([doc_id], user_id)
+
+    def invalidate_documents(self, doc_ids: List[int], user_id: Optional[int] = None) -> None:
+        """invalidate() for many documents in one broadcast."""
+        if doc_ids:
+            shards.broadcast("permissions.invalidate", doc_ids=sorted(set(doc_ids)), user_id=user_id)
+
+    def _drop(self, doc_id: int, user_id: Optional[int]) -> None:
+        self._invalidated.put(doc_id, time.monotonic())
+        if user_id is None:
+            self._cache.pop(doc_id)
+            return
+        levels = self._cache.get(doc_id)
+        if levels is not None:
+            levels.pop(user_id, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "documents": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+permission_cache = PermissionCache()
+
+
+@shards.task("permissions.invalidate")
+def _invalidate(doc_ids: List[int], user_id: Optional[int] = None) -> None:
+    for doc_id in doc_ids:
+        permission_cache._drop(doc_id, user_id)
@@ -0,0 +1,142 @@
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from flask import current_app
+
+from ..extensions import socketio
+from . import delta
+from .codec import socket_codec
+from .delta import Op
+
+# (version, ops, sender sid or None for Yjs changes, sender wants binary, enqueued at)
+_Entry = Tuple[int, List[Op], Optional[str], bool, float]
+
+
+class RoomBatcher:
+    """
+    Outbound side of document_change. Applied changes are queued per room
+    and sent every REALTIME_BATCH_WINDOW_MS as one `document_updates` frame
+    per recipient:
+
+        {document_id, items: [{version, delta: {ops}} | {version, ack: true}]}
+
+    Runs of other people's changes are composed into a single delta. Clients
+    that sent changes in the window get their own frame with their acks in
+    version order; everyone else shares one broadcast. A window of 0 sends
+    every change immediately.
+    """
+
+    def __init__(self):
+        self.window = 0.02
+        self._pending: Dict[int, List[_Entry]] = {}
+        self._lock = threading.Lock()
+        self._app = None
+        self._worker = None
+        self._clock = time.monotonic
+        # counters
+        self.changes = 0
+        self.frames = 0
+        self.sent = 0
+        self.latency_seconds_total = 0.0
+        self.latency_seconds_max = 0.0
+
+    def init_app(self, app) -> None:
+        self.window = app.config["REALTIME_BATCH_WINDOW_MS"] / 1000
+        self._app = app
+
+    def enqueue(self, doc_id: int, version: int, ops: List[Op], sender_sid: Optional[str],
+                binary: bool = False) -> None:
+        """Queue an applied change; call with the document's op_history lock held."""
+        with self._lock:
+            self._pending.setdefault(doc_id, []).append((version, ops, sender_sid, binary, self._clock()))
+            self.changes += 1
+        if self.window <= 0:
+            self.flush(doc_id)
+        else:
+            self._ensure_worker()
+
+    def flush(self, doc_id: Optional[int] = None, skip_sid: Optional[str] = None) -> int:
+        """
+        Send what is queued for one room (all rooms by default); returns
+        frames sent. `skip_sid` leaves a socket out of the room broadcast
+        (a joining client that gets those changes another way).
+        """
+        with self._lock:
+            if doc_id is None:
+                batches, self._pending = self._pending, {}
+            else:
+                entries = self._pending.pop(doc_id, None)
+                batches = {doc_id: entries} if entries else {}
+        now = self._clock()
+        frames = 0
+        for room_id, entries in batches.items():
+            frames += self._send(room_id, entries, skip_sid)
+            self.sent += len(entries)
+            for *_, queued_at in entries:
+                waited = now - queued_at
+                self.latency_seconds_total += waited
+                self.latency_seconds_max = max(self.latency_seconds_max, waited)
+        self.frames += frames
+        return frames
+
+    def discard(self, doc_id: int) -> None:
+        """Drop queued changes for a document that was reset or deleted."""
+        with self._lock:
+            self._pending.pop(doc_id, None)
+
+    def _send(self, doc_id: int, entries: List[_Entry], skip_sid: Optional[str] = None) -> int:
+        senders = {sid: binary for _, _, sid, binary, _ in entries if sid is not None}
+        socket_codec.broadcast(
+            "document_updates", {"document_id": doc_id, "items": _items(entries, None)}, doc_id,
+            skip_sid=list(senders) + ([skip_sid] if skip_sid else []),
+        )
+        for sid, binary in senders.items():
+            socket_codec.send("document_updates", {"document_id": doc_id, "items": _items(entries, sid)}, sid, binary)
+        return 1 + len(senders)
+
+    def stats(self) -> dict:
+        return {
+            "window_ms": round(self.window * 1000, 1),
+            "pending_rooms": len(self._pending),
+            "changes": self.changes,
+            "frames": self.frames,
+            "changes_per_frame": round(self.changes / self.frames, 2) if self.frames else 0.0,
+            "added_latency_ms_avg": (
+                round(self.latency_seconds_total / self.sent * 1000, 2) if self.sent else 0.0
+            ),
+            "added_latency_ms_max": round(self.latency_seconds_max * 1000, 2),
+        }
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None:
+            self._worker = socketio.start_background_task(self._run)
+
+    def _run(self) -> None:
+        while True:
+            socketio.sleep(self.window or 0.02)
+            try:
+                self.flush()
+            except Exception:
+                with self._app.app_context():
+                    current_app.logger.exception("broadcast batch flush failed")
+
+
+def _items(entries: List[_Entry], own_sid: Optional[str]) -> List[dict]:
+    """Frame items for one recipient: own changes become acks, the rest is composed."""
+    items: List[dict] = []
+    run: Optional[List[Op]] = None
+    for version, ops, sid, _, _ in entries:
+        if sid is not None and sid == own_sid:
+            items.append({"version": version, "ack": True})
+            run = None
+        elif run is None:
+            run = ops
+            items.append({"version": version, "delta": {"ops": run}})
+        else:
+            run = delta.compose(run, ops)
+            items[-1] = {"version": version, "delta": {"ops": run}}
+    return items
+
+
+room_batcher = RoomBatcher()
@@ -0,0 +1,257 @@
+import atexit
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import insert, update
+from sqlalchemy.orm import undefer
+
+from ..extensions import db, socketio
+from ..models import Document, DocumentOp
+from ..overviews import overview_cache
+from ..search import plain_text
+from .crdt import crdt_sync
+from .delta import Op
+from .oplog import op_log
+
+
+class LiveDocument:
+    """Authoritative state of a document that is being edited right now."""
+    __slots__ = ("content", "version", "flushed_version", "snapshot_version", "dirty_bytes", "pending_ops", "crdt",
+                 "flush_lock")
+
+    def __init__(self, content: List[Op], version: int, snapshot_version: Optional[int] = None):
+        self.content = content
+        self.version = version
+        self.flushed_version = version
+        # version of documents.content; the ops after it are in document_ops
+        self.snapshot_version = version if snapshot_version is None else snapshot_version
+        self.dirty_bytes = 0
+        self.pending_ops: List[Tuple[int, List[Op]]] = []
+        self.crdt = None  # YState once a Yjs client has used it (crdt.py)
+        # one flush at a time, or two could append the same versions
+        self.flush_lock = threading.Lock()
+
+    @property
+    def dirty(self) -> bool:
+        return self.version != self.flushed_version or (self.crdt is not None and self.crdt.dirty)
+
+
+class WriteBehindBuffer:
+    """
+    Realtime edits are applied to an in-memory LiveDocument and written
+    later, in one transaction for all dirty documents: every
+    REALTIME_FLUSH_INTERVAL_MS, as soon as a document has collected
+    REALTIME_FLUSH_DIRTY_BYTES of changes, when its room empties and at exit.
+
+    A flush appends the changes to document_ops, bumps documents.version
+    and refreshes content_text so search sees the edits (search.py); the
+    full content is only rewritten every OPLOG_SNAPSHOT_OPS changes and
+    when the room empties (see oplog.py).
+    """
+
+    def __init__(self):
+        self.interval = 1.0
+        self.max_dirty_bytes = 256 * 1024
+        self._docs: Dict[int, LiveDocument] = {}
+        self._app = None
+        self._worker = None
+        # counters
+        self.edits = 0
+        self.rows_written = 0
+        self.ops_appended = 0
+        self.snapshots = 0
+        self.bytes_changed = 0
+        self.bytes_written = 0
+        self.flushes = 0
+        self.flush_seconds_total = 0.0
+        self.flush_seconds_max = 0.0
+        self.flush_seconds_last = 0.0
+
+    def init_app(self, app) -> None:
+        self.interval = app.config["REALTIME_FLUSH_INTERVAL_MS"] / 1000
+        self.max_dirty_bytes = app.config["REALTIME_FLUSH_DIRTY_BYTES"]
+        if self._app is None:
+            atexit.register(self._flush_at_exit)
+        self._app = app
+
+    def peek(self, doc_id: int) -> Optional[LiveDocument]:
+        return self._docs.get(doc_id)
+
+    def load(self, doc_id: int) -> Optional[LiveDocument]:
+        """Live state of the document, read from Postgres on first use."""
+        live = self._docs.get(doc_id)
+        if live is not None:
+            return live
+        doc = db.session.get(Document, doc_id, options=[undefer(Document.ydoc_state)])
+        if not doc:
+            return None
+        content, version = op_log.materialize(doc)
+        live = self._docs[doc_id] = LiveDocument(content, version, doc.content_version)
+        op_log.ensure_worker()
+        if doc.ydoc_state is not None and crdt_sync.enabled:
+            crdt_sync.attach(doc_id, live, doc.ydoc_state)
+        return live
+
+    def apply(self, doc_id: int, live: LiveDocument, content: List[Op], change: List[Op]) -> int:
+        """Record a new content state produced by `change`; returns the new version."""
+        live.content = content
+        live.version += 1
+        live.pending_ops.append((live.version, change))
+        size = len(json.dumps(change))
+        live.dirty_bytes += size
+        self.bytes_changed += size
+        self.edits += 1
+        if live.dirty_bytes >= self.max_dirty_bytes:
+            self.flush([doc_id])
+        else:
+            self._ensure_worker()
+        return live.version
+
+    def schedule(self) -> None:
+        """Make sure the next periodic flush happens (state changed outside apply())."""
+        self._ensure_worker()
+
+    def flush(self, doc_ids: Optional[Iterable[int]] = None, snapshot: bool = False) -> int:
+        """
+        Write dirty documents (all of them by default); returns documents
+        written. `snapshot` folds their content into documents.content even
+        if the op log tail is still short. A document another flush is
+        writing is skipped by the periodic flush (all documents) and waited
+        for when asked for by id (release, dirty bytes).
+        """
+        ids = list(self._docs) if doc_ids is None else list(doc_ids)
+        locked = []
+        try:
+            batch = []
+            for doc_id in ids:
+                live = self._docs.get(doc_id)
+                if live is None or not live.flush_lock.acquire(blocking=doc_ids is not None):
+                    continue
+                locked.append(live)
+                fold = live.version - live.snapshot_version >= op_log.snapshot_ops or snapshot
+                if live.dirty or (fold and live.snapshot_version != live.version):
+                    batch.append((doc_id, live, live.version, live.content, list(live.pending_ops), fold))
+            return self._write(batch) if batch else 0
+        finally:
+            for live in locked:
+                live.flush_lock.release()
+
+    def release(self, doc_id: int) -> None:
+        """Flush (with a snapshot) and forget a document nobody is editing anymore."""
+        self.flush([doc_id], snapshot=True)
+        live = self._docs.get(doc_id)
+        if live is not None and not live.dirty:
+            del self._docs[doc_id]
+
+    def discard(self, doc_id: int) -> Optional[LiveDocument]:
+        """Forget a document without writing it (deleted or overwritten via REST)."""
+        return self._docs.pop(doc_id, None)
+
+    @property
+    def coalescing_ratio(self) -> float:
+        return self.edits / self.rows_written if self.rows_written else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "live_documents": len(self._docs),
+            "dirty_documents": sum(1 for d in self._docs.values() if d.dirty),
+            "edits": self.edits,
+            "rows_written": self.rows_written,
+            "ops_appended": self.ops_appended,
+            "snapshots": self.snapshots,
+            # serialized bytes written to Postgres per byte of change
+            "write_amplification": round(self.bytes_written / self.bytes_changed, 2) if self.bytes_changed else 0.0,
+            "flushes": self.flushes,
+            "coalescing_ratio": round(self.coalescing_ratio, 2),
+            "flush_ms_avg": round(self.flush_seconds_total / self.flushes * 1000, 2) if self.flushes else 0.0,
+            "flush_ms_max": round(self.flush_seconds_max * 1000, 2),
+            "flush_ms_last": round(self.flush_seconds_last * 1000, 2),
+        }
+
+    def _write(self, batch: list) -> int:
+        started = time.perf_counter()
+        now = datetime.now(timezone.utc)
+        ops_rows = [
+            {"document_id": doc_id, "version": version, "ops": ops}
+            for doc_id, _, _, _, pending, _ in batch for version, ops in pending
+        ]
+        appended = [
+            {"id": doc_id, "version": version, "content_text": plain_text({"ops": content}), "updated_at": now}
+            for doc_id, _, version, content, _, fold in batch if not fold
+        ]
+        folded = [
+            {"id": doc_id, "content": {"ops": content}, "content_text": plain_text({"ops": content}),
+             "content_version": version, "version": version, "updated_at": now}
+            for doc_id, _, version, content, _, fold in batch if fold
+        ]
+        try:
+            if ops_rows:
+                db.session.execute(insert(DocumentOp), ops_rows)
+            if appended:
+                db.session.execute(update(Document), appended)
+            if folded:
+                db.session.execute(update(Document), folded)
+                op_log.prune([row["id"] for row in folded])
+            ydocs = [
+                (live.crdt, crdt_sync.persist(doc_id, live.crdt))
+                for doc_id, live, *_ in batch if live.crdt is not None and live.crdt.dirty
+            ]
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            current_app.logger.exception("write-behind flush failed for %d documents", len(batch))
+            return 0
+        elapsed = time.perf_counter() - started
+
+        for ystate, (count, compacted) in ydocs:
+            crdt_sync.written(ystate, count, compacted)
+        # updated_at moved: the documents reorder in their collaborators' overviews
+        overview_cache.invalidate_documents([doc_id for doc_id, *_ in batch])
+        for _, live, version, _, pending, fold in batch:
+            live.flushed_version = version
+            del live.pending_ops[:len(pending)]
+            if fold:
+                live.snapshot_version = version
+            if not live.dirty:
+                live.dirty_bytes = 0
+        self.rows_written += len(batch)
+        self.ops_appended += len(ops_rows)
+        self.snapshots += len(folded)
+        self.bytes_written += sum(len(json.dumps(row["ops"])) for row in ops_rows)
+        self.bytes_written += sum(len(json.dumps(row["content"])) for row in folded)
+        self.bytes_written += sum(len(row["content_text"]) for row in appended)
+        self.flushes += 1
+        self.flush_seconds_total += elapsed
+        self.flush_seconds_last = elapsed
+        self.flush_seconds_max = max(self.flush_seconds_max, elapsed)
+        current_app.logger.debug(
+            "write-behind flush: %d docs, %d ops, %d snapshots in %.1f ms (coalescing %.1fx)",
+            len(batch), len(ops_rows), len(folded), elapsed * 1000, self.coalescing_ratio,
+        )
+        return len(batch)
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None and self.interval > 0:
+            self._worker = socketio.start_background_task(self._run)
+
+    def _run(self) -> None:
+        while True:
+            socketio.sleep(self.interval)
+            with self._app.app_context():
+                try:
+                    self.flush()
+                except Exception:
+                    current_app.logger.exception("write-behind flush loop failed")
+
+    def _flush_at_exit(self) -> None:
+        if self._app is None or not any(d.dirty for d in self._docs.values()):
+            return
+        with self._app.app_context():
+            self.flush()
+
+
+write_buffer = WriteBehindBuffer()
@@ -0,0 +1,100 @@
+"""
+Opt-in compact encoding for the large realtime payloads
+(`load_document_content`, `document_updates`).
+
+A client asks for it at connect time with `?encoding=msgpack`. Payloads for
+those sockets are sent as a single binary attachment: one flag byte followed
+by the MessagePack body, zlib-compressed when it is at least
+SOCKETIO_COMPRESS_THRESHOLD bytes. Everyone else keeps getting plain JSON,
+so old and new clients can share a room. Without the `msgpack` package the
+server silently stays on JSON.
+"""
+import zlib
+from typing import Any, List, Optional, Set, Union
+
+from ..extensions import socketio
+
+try:
+    import msgpack
+except ImportError:  # optional dependency
+    msgpack = None
+
+FLAG_PLAIN = 0
+FLAG_DEFLATE = 1
+
+DEFAULT_THRESHOLD = 1024
+
+
+def encode(payload: Any, threshold: int = DEFAULT_THRESHOLD) -> bytes:
+    body = msgpack.packb(payload, use_bin_type=True)
+    if len(body) >= threshold:
+        # level 1: ~5x smaller and still cheaper than json.dumps (benchmarks/bench_codec.py)
+        return bytes([FLAG_DEFLATE]) + zlib.compress(body, 1)
+    return bytes([FLAG_PLAIN]) + body
+
+
+def decode(data: bytes) -> Any:
+    body = data[1:]
+    if data[0] == FLAG_DEFLATE:
+        body = zlib.decompress(body)
+    return msgpack.unpackb(body, raw=False)
+
+
+class SocketCodec:
+    """Tracks which sockets asked for binary payloads and emits accordingly."""
+
+    def __init__(self):
+        self.enabled = msgpack is not None
+        self.threshold = DEFAULT_THRESHOLD
+        self._binary_sids: Set[str] = set()
+
+    def init_app(self, app) -> None:
+        self.enabled = app.config["SOCKETIO_BINARY_ENABLED"] and msgpack is not None
+        self.threshold = app.config["SOCKETIO_COMPRESS_THRESHOLD"]
+
+    def negotiate(self, sid: str, requested: Optional[str]) -> str:
+        """Record the encoding for a new connection and return the one in use."""
+        if requested == "msgpack" and self.enabled:
+            self._binary_sids.add(sid)
+            return "msgpack"
+        return "json"
+
+    def forget(self, sid: str) -> None:
+        self._binary_sids.discard(sid)
+
+    def is_binary(self, sid: str) -> bool:
+        return sid in self._binary_sids
+
+    def doc_room(self, doc_id: int, sid: str) -> str:
+        """Per-encoding sub-room a socket joins next to `doc_<id>`."""
+        return f"doc_{doc_id}:{'msgpack' if sid in self._binary_sids else 'json'}"
+
+    def _encode_or_none(self, payload: Any) -> Optional[bytes]:
+        try:
+            return encode(payload, self.threshold)
+        except (TypeError, ValueError, UnicodeEncodeError):
+            return None  # e.g. a lone surrogate; JSON can carry it, msgpack can't
+
+    def send(self, event: str, payload: Any, sid: str, binary: Optional[bool] = None) -> None:
+        """
+        Emit to one socket. Pass `binary` when the socket may be connected to
+        another worker (shards.py); otherwise it is looked up here.
+        """
+        if binary is None:
+            binary = sid in self._binary_sids
+        data = self._encode_or_none(payload) if binary and self.enabled else None
+        socketio.emit(event, payload if data is None else data, to=sid)
+
+    def broadcast(
+        self, event: str, payload: Any, doc_id: int, skip_sid: Union[str, List[str], None] = None
+    ) -> None:
+        """Emit to everyone in the document room, encoding once per encoding."""
+        socketio.emit(event, payload, to=f"doc_{doc_id}:json", skip_sid=skip_sid)
+        if not self.enabled:
+            return
+        # binary sockets may live on other workers, so encode even if none are here
+        data = self._encode_or_none(payload)
+        socketio.emit(event, payload if data is None else data, to=f"doc_{doc_id}:msgpack", skip_sid=skip_sid)
+
+
+socket_codec = SocketCodec()
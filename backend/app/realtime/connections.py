@@ -0,0 +1,179 @@
+"""
+Who is connected to this worker: sid -> user, user -> sids, document -> sids.
+
+Replaces the bare sid -> user dict in decorators/socketio_auth.py, which
+had no reverse lookups. Socket.IO rooms know the sids in a room, but not
+which user a sid belongs to or how many tabs a user has open, so anything
+that needs this information asks the registry instead.
+
+Lookups by sid, user or document are O(1). join, leave and disconnect
+cost O(documents the socket joined), at most
+SOCKET_MAX_DOCUMENTS_PER_CONNECTION: each goes through the socket's own
+tuple of document ids (the sid -> documents index), never through every
+document the registry tracks. Entries are kept small because most users
+have one tab and most documents have one or two sockets:
+  - a connection is a __slots__ object holding a tuple of document ids;
+  - an index entry is the bare sid while there is one, and becomes a set
+    when a second sid arrives.
+benchmarks/bench_connections.py measures the footprint. Memory is bounded
+by SOCKET_MAX_CONNECTIONS (further connects are refused) and
+SOCKET_MAX_DOCUMENTS_PER_CONNECTION (further joins are refused).
+
+With sharding (shards.py) each worker only knows its own sockets.
+"""
+import threading
+from typing import Dict, Iterator, Optional, Set, Tuple, Union
+
+Entry = Union[str, Set[str]]
+
+
+class _Connection:
+    __slots__ = ("user_id", "docs")
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.docs: Tuple[int, ...] = ()
+
+
+def _add(index: Dict[int, Entry], key: int, sid: str) -> None:
+    entry = index.get(key)
+    if entry is None:
+        index[key] = sid
+    elif isinstance(entry, str):
+        if entry != sid:
+            index[key] = {entry, sid}
+    else:
+        entry.add(sid)
+
+
+def _discard(index: Dict[int, Entry], key: int, sid: str) -> None:
+    entry = index.get(key)
+    if entry is None:
+        return
+    if isinstance(entry, str):
+        if entry == sid:
+            del index[key]
+        return
+    entry.discard(sid)
+    if len(entry) == 1:
+        index[key] = next(iter(entry))
+
+
+def _iter(entry: Optional[Entry]) -> Iterator[str]:
+    if entry is None:
+        return iter(())
+    return iter((entry,)) if isinstance(entry, str) else iter(list(entry))
+
+
+class ConnectionRegistry:
+    """Bidirectional index of this worker's sockets; see the module docstring."""
+
+    def __init__(self):
+        self.max_connections = 0
+        self.max_documents = 0
+        self._sids: Dict[str, _Connection] = {}
+        self._users: Dict[int, Entry] = {}
+        self._docs: Dict[int, Entry] = {}
+        self._lock = threading.Lock()
+        # counters
+        self.peak = 0
+        self.refused = 0
+
+    def init_app(self, app) -> None:
+        self.max_connections = app.config["SOCKET_MAX_CONNECTIONS"]
+        self.max_documents = app.config["SOCKET_MAX_DOCUMENTS_PER_CONNECTION"]
+
+    def connect(self, sid: str, user_id: int) -> bool:
+        """Register an authenticated socket; False if the worker is full."""
+        with self._lock:
+            old = self._sids.get(sid)
+            if old is None and self.max_connections and len(self._sids) >= self.max_connections:
+                self.refused += 1
+                return False
+            if old is not None:
+                self._drop(sid, old)
+            self._sids[sid] = _Connection(user_id)
+            _add(self._users, user_id, sid)
+            self.peak = max(self.peak, len(self._sids))
+        return True
+
+    def disconnect(self, sid: str) -> Tuple[int, ...]:
+        """Forget a socket; returns the documents it had joined."""
+        with self._lock:
+            conn = self._sids.pop(sid, None)
+            if conn is None:
+                return ()
+            self._drop(sid, conn)
+            return conn.docs
+
+    def join(self, sid: str, doc_id: int) -> bool:
+        """False for unknown sockets and ones at SOCKET_MAX_DOCUMENTS_PER_CONNECTION."""
+        with self._lock:
+            conn = self._sids.get(sid)
+            if conn is None:
+                return False
+            if doc_id in conn.docs:
+                return True
+            if self.max_documents and len(conn.docs) >= self.max_documents:
+                self.refused += 1
+                return False
+            conn.docs += (doc_id,)
+            _add(self._docs, doc_id, sid)
+        return True
+
+    def leave(self, sid: str, doc_id: int) -> bool:
+        """False if the socket wasn't in the document. O(documents the socket joined)."""
+        with self._lock:
+            conn = self._sids.get(sid)
+            if conn is None or doc_id not in conn.docs:
+                return False
+            conn.docs = tuple(d for d in conn.docs if d != doc_id)
+            _discard(self._docs, doc_id, sid)
+        return True
+
+    def user(self, sid: str) -> Optional[int]:
+        conn = self._sids.get(sid)
+        return conn.user_id if conn is not None else None
+
+    def documents(self, sid: str) -> Tuple[int, ...]:
+        conn = self._sids.get(sid)
+        return conn.docs if conn is not None else ()
+
+    def user_sids(self, user_id: int) -> Iterator[str]:
+        return _iter(self._users.get(user_id))
+
+    def document_sids(self, doc_id: int) -> Iterator[str]:
+        return _iter(self._docs.get(doc_id))
+
+    def count(self, doc_id: int) -> int:
+        """Sockets in a document."""
+        entry = self._docs.get(doc_id)
+        if entry is None:
+            return 0
+        return 1 if isinstance(entry, str) else len(entry)
+
+    def users(self, doc_id: int) -> Set[int]:
+        """Distinct users with the document open."""
+        return {self._sids[sid].user_id for sid in self.document_sids(doc_id) if sid in self._sids}
+
+    def room_sizes(self) -> Iterator[int]:
+        """Sockets per document, for every document with any."""
+        for entry in list(self._docs.values()):
+            yield 1 if isinstance(entry, str) else len(entry)
+
+    def stats(self) -> dict:
+        return {
+            "connections": len(self._sids),
+            "users": len(self._users),
+            "documents": len(self._docs),
+            "peak": self.peak,
+            "refused": self.refused,
+        }
+
+    def _drop(self, sid: str, conn: _Connection) -> None:
+        _discard(self._users, conn.user_id, sid)
+        for doc_id in conn.docs:
+            _discard(self._docs, doc_id, sid)
+
+
+connections = ConnectionRegistry()
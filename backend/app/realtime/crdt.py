@@ -0,0 +1,255 @@
+"""
+Yjs-compatible sync for document content, next to the OT protocol of docs.py.
+
+A client joins with `{document_id, protocol: "yjs"}` and then exchanges
+y-protocols messages as `yjs` events ({document_id, message: bytes}): the
+server sends its state vector on join (sync step 1), answers the client's
+step 1 with just the updates it is missing (step 2) and relays incremental
+updates. Awareness messages are relayed as they are.
+
+The document's owner (shards.py) keeps one pycrdt Doc per live document
+whose "quill" Y.Text mirrors LiveDocument.content, so OT and Yjs clients can
+edit the same document: Yjs updates become Quill deltas for OT clients, and
+OT changes are applied to the Y.Text and sent to Yjs clients as updates.
+
+Stored form: documents.ydoc_state holds a compacted update (the full state)
+and document_yjs_updates the updates written since, one merged row per
+write-behind flush. Past CRDT_COMPACT_UPDATES rows the next flush folds them
+back into ydoc_state. documents.content stays authoritative; a stored state
+that doesn't match it is brought in line when the document is loaded.
+
+Without the `pycrdt` package (or with CRDT_ENABLED off) only OT is served.
+"""
+from typing import List, Optional, Tuple
+
+from sqlalchemy import delete, update
+
+from ..extensions import db, socketio
+from ..models import Document, DocumentYjsUpdate
+from . import delta
+from .delta import Op
+
+try:
+    from pycrdt import Doc, Text, create_sync_message, create_update_message, merge_updates, read_message, write_message
+except ImportError:  # optional dependency
+    Doc = None
+
+TEXT_NAME = "quill"  # the shared type y-quill binds to
+
+# y-protocols message types (first byte) and sync steps (second byte)
+SYNC = 0
+AWARENESS = 1
+STEP1 = 0
+STEP2 = 1
+UPDATE = 2
+
+
+def _content_of(text) -> List[Op]:
+    ops: List[Op] = []
+    for insert, attributes in text.diff():
+        op = {"insert": insert}
+        if attributes:
+            op["attributes"] = attributes
+        delta._push(ops, op)
+    return ops
+
+
+def _normalized(ops: List[Op]) -> List[Op]:
+    normalized: List[Op] = []
+    for op in ops:
+        if op.get("insert") != "":
+            delta._push(normalized, {k: v for k, v in op.items() if k != "attributes" or v})
+    return normalized
+
+
+class Diverged(ValueError):
+    """
+    An update the Y.Text took but the Quill content could not follow. The
+    text has been put back; `update` (the client's update and the undo) has
+    to reach every Yjs client, the sender included.
+    """
+
+    def __init__(self, message: str, update_: bytes):
+        super().__init__(message)
+        self.update = update_
+
+
+class YState:
+    """A live document's Y.Doc plus the updates not yet written to Postgres."""
+    __slots__ = ("doc", "text", "pending", "rows", "compacted", "_deltas", "_updates", "_subscriptions")
+
+    def __init__(self, updates: List[bytes]):
+        self.doc = Doc()
+        self.text = self.doc.get(TEXT_NAME, type=Text)
+        for stored in updates:
+            self.doc.apply_update(stored)
+        self.pending: List[bytes] = []
+        self.rows = max(len(updates) - 1, 0)
+        self.compacted = bool(updates)
+        self._deltas: List[List[Op]] = []
+        self._updates: List[bytes] = []
+        self._subscriptions = (
+            self.text.observe(lambda event: self._deltas.append(event.delta)),
+            self.doc.observe(lambda event: self._updates.append(event.update)),
+        )
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self.pending) or not self.compacted
+
+    def content(self) -> List[Op]:
+        return _content_of(self.text)
+
+    def take(self) -> Tuple[List[List[Op]], Optional[bytes]]:
+        """Text deltas (UTF-8 offsets) and the merged update since the last call."""
+        deltas, self._deltas = self._deltas, []
+        updates, self._updates = self._updates, []
+        if not updates:
+            return deltas, None
+        merged = updates[0] if len(updates) == 1 else merge_updates(*updates)
+        self.pending.append(merged)
+        return deltas, merged
+
+
+class CrdtSync:
+    """Y state of live documents; see the module docstring."""
+
+    def __init__(self):
+        self.enabled = Doc is not None
+        self.compact_after = 200
+        # counters
+        self.updates_in = 0
+        self.updates_out = 0
+        self.rows_written = 0
+        self.compactions = 0
+        self.reverted = 0
+
+    def init_app(self, app) -> None:
+        self.enabled = app.config["CRDT_ENABLED"] and Doc is not None
+        self.compact_after = app.config["CRDT_COMPACT_UPDATES"]
+
+    def attach(self, doc_id: int, live, state: Optional[bytes]) -> YState:
+        """Give a LiveDocument its Y state: the stored one, or one seeded from its content."""
+        updates = [state] if state is not None else []
+        if state is not None:
+            updates += [
+                row.data for row in db.session.query(DocumentYjsUpdate.data)
+                .filter_by(document_id=doc_id).order_by(DocumentYjsUpdate.id)
+            ]
+        ystate = YState(updates)
+        if ystate.content() != _normalized(live.content):
+            self.replace(ystate, live.content)
+        live.crdt = ystate
+        return ystate
+
+    def sync_step1(self, ystate: YState) -> bytes:
+        return create_sync_message(ystate.doc)
+
+    def receive(self, ystate: YState, message: bytes,
+                before: List[Op]) -> Tuple[Optional[bytes], List[Op], List[Op], Optional[bytes]]:
+        """
+        Handle a sync message against content `before`. Returns the reply
+        (for step 1), the Quill change it made to the text, the content
+        after it and the update to relay to other Yjs clients. Raises
+        ValueError on garbage, Diverged if the change doesn't apply to `before`.
+        """
+        try:
+            if message[0] != SYNC or message[1] not in (STEP1, STEP2, UPDATE):
+                raise ValueError("not a sync message")
+            payload = read_message(message[2:])
+            if message[1] == STEP1:
+                return bytes([SYNC, STEP2]) + write_message(ystate.doc.get_update(payload)), [], before, None
+            if payload != b"\x00\x00":  # empty update
+                ystate.doc.apply_update(payload)
+        except Exception as e:  # pycrdt reports malformed input in several ways
+            raise ValueError(str(e) or type(e).__name__) from e
+        deltas, update_ = ystate.take()
+        self.updates_in += 1
+        change: List[Op] = []
+        content = before
+        try:
+            for ydelta in deltas:
+                step = delta.from_utf8(_normalized(ydelta), content)
+                content = delta.apply(content, step)
+                change = delta.compose(change, step) if change else step
+        except ValueError as e:
+            # the update is in the Y doc already: undo it so the text equals `before` again
+            undo = self.replace(ystate, before)
+            self.reverted += 1
+            updates = [u for u in (update_, undo) if u is not None]
+            raise Diverged(str(e), updates[0] if len(updates) == 1 else merge_updates(*updates)) from e
+        return None, change, content, update_
+
+    def apply_delta(self, ystate: YState, change: List[Op], before: List[Op]) -> Optional[bytes]:
+        """Apply a Quill change (against `before`) to the Y.Text; returns the update."""
+        text, index = ystate.text, 0
+        with ystate.doc.transaction():
+            for op in delta.to_utf8(change, before):
+                # always pass attributes: without them Yjs inherits the preceding formatting
+                attributes = op.get("attributes") or {}
+                if "retain" in op:
+                    if attributes:
+                        text.format(index, index + op["retain"], attributes)
+                    index += op["retain"]
+                elif "delete" in op:
+                    del text[index:index + op["delete"]]
+                elif isinstance(op["insert"], str):
+                    text.insert(index, op["insert"], attributes)
+                    index += delta._u8len(op["insert"])
+                else:
+                    text.insert_embed(index, op["insert"], attributes)
+                    index += 1
+        return ystate.take()[1]
+
+    def replace(self, ystate: YState, content: List[Op]) -> Optional[bytes]:
+        """Make the Y.Text equal `content` (REST overwrite, out-of-date stored state)."""
+        before = ystate.content()
+        length = delta.document_length(before)
+        change = list(content) + ([{"delete": length}] if length else [])
+        return self.apply_delta(ystate, change, before)
+
+    def broadcast(self, doc_id: int, update_: bytes, skip_sid: Optional[str] = None) -> None:
+        socketio.emit("yjs", {"document_id": doc_id, "message": create_update_message(update_)},
+                      to=f"doc_{doc_id}:yjs", skip_sid=skip_sid)
+        self.updates_out += 1
+
+    def persist(self, doc_id: int, ystate: YState, compact: bool = False) -> Tuple[int, bool]:
+        """
+        Add pending updates to the session without committing; hand the
+        result to written() once the commit went through.
+        """
+        count = len(ystate.pending)
+        compact = compact or not ystate.compacted or ystate.rows >= self.compact_after
+        if compact:
+            db.session.execute(
+                update(Document).where(Document.id == doc_id).values(ydoc_state=ystate.doc.get_update())
+            )
+            db.session.execute(delete(DocumentYjsUpdate).where(DocumentYjsUpdate.document_id == doc_id))
+        elif count:
+            pending = ystate.pending[:count]
+            data = pending[0] if count == 1 else merge_updates(*pending)
+            db.session.add(DocumentYjsUpdate(document_id=doc_id, data=data))
+        return count, compact
+
+    def written(self, ystate: YState, count: int, compacted: bool) -> None:
+        del ystate.pending[:count]
+        if compacted:
+            ystate.rows = 0
+            ystate.compacted = True
+            self.compactions += 1
+        elif count:
+            ystate.rows += 1
+            self.rows_written += 1
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "updates_in": self.updates_in,
+            "updates_out": self.updates_out,
+            "rows_written": self.rows_written,
+            "compactions": self.compactions,
+            "reverted": self.reverted,
+        }
+
+
+crdt_sync = CrdtSync()
@@ -0,0 +1,337 @@
+"""
+Minimal Quill Delta helpers (compose / transform) for the realtime path.
+
+Follows the semantics of the `quill-delta` JS package so that ops produced
+by the editor can be rebased and applied server-side. Lengths are counted
+in UTF-16 code units, like JS strings, so indexes line up with the client.
+"""
+from typing import Any, Dict, List, Optional
+
+Op = Dict[str, Any]
+INF = float("inf")
+
+
+def _u16len(s: str) -> int:
+    if s.isascii():
+        return len(s)
+    return len(s.encode("utf-16-le", "surrogatepass")) // 2
+
+
+def _u16slice(s: str, start: int, end: int) -> str:
+    if s.isascii():
+        return s[start:end]
+    raw = s.encode("utf-16-le", "surrogatepass")
+    return raw[start * 2:end * 2].decode("utf-16-le", "surrogatepass")
+
+
+def _u16join(a: str, b: str) -> str:
+    # re-pair a surrogate half split across two slices
+    if a and b and "\ud800" <= a[-1] <= "\udbff" and "\udc00" <= b[0] <= "\udfff":
+        return (a + b).encode("utf-16-le", "surrogatepass").decode("utf-16-le")
+    return a + b
+
+
+def op_length(op: Op) -> int:
+    if "delete" in op:
+        return op["delete"]
+    if "retain" in op:
+        return op["retain"]
+    ins = op.get("insert")
+    return _u16len(ins) if isinstance(ins, str) else 1
+
+
+def ops_of(content: Any) -> List[Op]:
+    """Accepts stored content ({"ops": [...]}, a bare list or None)."""
+    if isinstance(content, dict):
+        return list(content.get("ops") or [])
+    if isinstance(content, list):
+        return list(content)
+    return []
+
+
+def validate_ops(ops: Any) -> List[Op]:
+    """Reject anything that isn't a well-formed list of delta ops."""
+    if not isinstance(ops, list):
+        raise ValueError("ops must be a list")
+    for op in ops:
+        if not isinstance(op, dict):
+            raise ValueError("op must be an object")
+        kinds = [k for k in ("insert", "delete", "retain") if k in op]
+        if len(kinds) != 1:
+            raise ValueError("op needs exactly one of insert/delete/retain")
+        kind = kinds[0]
+        if kind in ("delete", "retain"):
+            n = op[kind]
+            if not isinstance(n, int) or isinstance(n, bool) or n <= 0:
+                raise ValueError(f"{kind} must be a positive integer")
+        elif not isinstance(op["insert"], (str, dict)):
+            raise ValueError("insert must be a string or embed")
+        attrs = op.get("attributes")
+        if attrs is not None and not isinstance(attrs, dict):
+            raise ValueError("attributes must be an object")
+    return ops
+
+
+def _compose_attributes(a: Optional[dict], b: Optional[dict], keep_null: bool) -> Optional[dict]:
+    a = a or {}
+    b = b or {}
+    attrs = dict(b) if keep_null else {k: v for k, v in b.items() if v is not None}
+    for k, v in a.items():
+        if v is not None and k not in b:
+            attrs[k] = v
+    return attrs or None
+
+
+def _transform_attributes(a: Optional[dict], b: Optional[dict], priority: bool) -> Optional[dict]:
+    if not a:
+        return b or None
+    if not b:
+        return None
+    if not priority:
+        return b
+    attrs = {k: v for k, v in b.items() if k not in a}
+    return attrs or None
+
+
+class _OpIterator:
+    def __init__(self, ops: List[Op]):
+        self.ops = ops
+        self.index = 0
+        self.offset = 0
+
+    def has_next(self) -> bool:
+        return self.peek_length() < INF
+
+    def peek_length(self):
+        if self.index < len(self.ops):
+            return op_length(self.ops[self.index]) - self.offset
+        return INF
+
+    def peek_type(self) -> str:
+        if self.index < len(self.ops):
+            op = self.ops[self.index]
+            if "delete" in op:
+                return "delete"
+            if "retain" in op:
+                return "retain"
+            return "insert"
+        return "retain"
+
+    def next(self, length=INF) -> Op:
+        if self.index >= len(self.ops):
+            return {"retain": INF}
+        op = self.ops[self.index]
+        offset = self.offset
+        remaining = op_length(op) - offset
+        if length >= remaining:
+            length = remaining
+            self.index += 1
+            self.offset = 0
+        else:
+            self.offset += length
+        if "delete" in op:
+            return {"delete": length}
+        out: Op = {}
+        if "retain" in op:
+            out["retain"] = length
+        elif isinstance(op["insert"], str):
+            out["insert"] = _u16slice(op["insert"], offset, offset + length)
+        else:
+            out["insert"] = op["insert"]
+        if op.get("attributes"):
+            out["attributes"] = op["attributes"]
+        return out
+
+    def rest(self) -> List[Op]:
+        if not self.has_next():
+            return []
+        if self.offset == 0:
+            return self.ops[self.index:]
+        index, offset = self.index, self.offset
+        head = self.next()
+        tail = self.ops[self.index:]
+        self.index, self.offset = index, offset
+        return [head] + tail
+
+
+def _push(ops: List[Op], new_op: Op) -> None:
+    new_op = dict(new_op)
+    index = len(ops)
+    if index:
+        last = ops[index - 1]
+        if "delete" in new_op and "delete" in last:
+            ops[index - 1] = {"delete": last["delete"] + new_op["delete"]}
+            return
+        # inserts go before a trailing delete (same result, canonical order)
+        if "delete" in last and "insert" in new_op:
+            index -= 1
+            if index == 0:
+                ops.insert(0, new_op)
+                return
+            last = ops[index - 1]
+        if new_op.get("attributes") == last.get("attributes"):
+            if isinstance(new_op.get("insert"), str) and isinstance(last.get("insert"), str):
+                merged = {"insert": _u16join(last["insert"], new_op["insert"])}
+                if new_op.get("attributes"):
+                    merged["attributes"] = new_op["attributes"]
+                ops[index - 1] = merged
+                return
+            if "retain" in new_op and "retain" in last:
+                merged = {"retain": last["retain"] + new_op["retain"]}
+                if new_op.get("attributes"):
+                    merged["attributes"] = new_op["attributes"]
+                ops[index - 1] = merged
+                return
+    ops.insert(index, new_op)
+
+
+def _retain(ops: List[Op], length: int, attributes: Optional[dict] = None) -> None:
+    if length <= 0:
+        return
+    op: Op = {"retain": length}
+    if attributes:
+        op["attributes"] = attributes
+    _push(ops, op)
+
+
+def _chop(ops: List[Op]) -> List[Op]:
+    if ops and "retain" in ops[-1] and not ops[-1].get("attributes"):
+        ops.pop()
+    return ops
+
+
+def compose(a: List[Op], b: List[Op]) -> List[Op]:
+    """Return the single delta equivalent to applying `a` then `b`."""
+    this_iter = _OpIterator(a)
+    other_iter = _OpIterator(b)
+    ops: List[Op] = []
+
+    first = b[0] if b else None
+    if first and "retain" in first and not first.get("attributes"):
+        first_left = first["retain"]
+        while this_iter.peek_type() == "insert" and this_iter.peek_length() <= first_left:
+            first_left -= this_iter.peek_length()
+            ops.append(this_iter.next())
+        if first["retain"] - first_left > 0:
+            other_iter.next(first["retain"] - first_left)
+
+    while this_iter.has_next() or other_iter.has_next():
+        if other_iter.peek_type() == "insert":
+            _push(ops, other_iter.next())
+        elif this_iter.peek_type() == "delete":
+            _push(ops, this_iter.next())
+        else:
+            length = min(this_iter.peek_length(), other_iter.peek_length())
+            this_op = this_iter.next(length)
+            other_op = other_iter.next(length)
+            if "retain" in other_op:
+                new_op: Op = {}
+                if "retain" in this_op:
+                    new_op["retain"] = length
+                else:
+                    new_op["insert"] = this_op["insert"]
+                attrs = _compose_attributes(
+                    this_op.get("attributes"), other_op.get("attributes"), "retain" in this_op
+                )
+                if attrs:
+                    new_op["attributes"] = attrs
+                _push(ops, new_op)
+                # other is exhausted and the last op is unchanged: copy the rest
+                if not other_iter.has_next() and ops[-1] == new_op:
+                    for op in this_iter.rest():
+                        _push(ops, op)
+                    return _chop(ops)
+            elif "delete" in other_op and "retain" in this_op:
+                _push(ops, other_op)
+    return _chop(ops)
+
+
+def transform(a: List[Op], b: List[Op], priority: bool) -> List[Op]:
+    """
+    Rebase `b` so it applies after `a`. With priority=True, `a` is taken
+    to have happened first, so its inserts win ties at the same index.
+    """
+    this_iter = _OpIterator(a)
+    other_iter = _OpIterator(b)
+    ops: List[Op] = []
+    while this_iter.has_next() or other_iter.has_next():
+        if this_iter.peek_type() == "insert" and (priority or other_iter.peek_type() != "insert"):
+            _retain(ops, op_length(this_iter.next()))
+        elif other_iter.peek_type() == "insert":
+            _push(ops, other_iter.next())
+        else:
+            length = min(this_iter.peek_length(), other_iter.peek_length())
+            this_op = this_iter.next(length)
+            other_op = other_iter.next(length)
+            if "delete" in this_op:
+                continue
+            if "delete" in other_op:
+                _push(ops, other_op)
+            else:
+                _retain(ops, length, _transform_attributes(
+                    this_op.get("attributes"), other_op.get("attributes"), priority
+                ))
+    return _chop(ops)
+
+
+def document_length(ops: List[Op]) -> int:
+    return sum(op_length(op) for op in ops)
+
+
+def apply(document: List[Op], change: List[Op]) -> List[Op]:
+    """Apply `change` to an insert-only document, refusing changes that overrun it."""
+    base_length = sum(op_length(op) for op in change if "insert" not in op)
+    if base_length > document_length(document):
+        raise ValueError("change does not fit the document")
+    return compose(document, change)
+
+
+def _recount(change: List[Op], document: List[Op], src_len, dst_len, split) -> List[Op]:
+    segments = iter([op["insert"] for op in document])
+    current: Any = None  # unconsumed rest of the current document insert
+
+    def consume(n: int) -> int:
+        nonlocal current
+        out = 0
+        while n > 0:
+            if current is None or current == "":
+                current = next(segments, None)
+                if current is None:
+                    return out + n  # past the end: apply() will reject it
+            if not isinstance(current, str):
+                current, n, out = None, n - 1, out + 1
+                continue
+            length = src_len(current)
+            if length <= n:
+                out, n, current = out + dst_len(current), n - length, None
+            else:
+                head, current = split(current, n)
+                out, n = out + dst_len(head), 0
+        return out
+
+    result = []
+    for op in change:
+        if "insert" in op:
+            result.append(op)
+        else:
+            key = "retain" if "retain" in op else "delete"
+            result.append({**op, key: consume(op[key])})
+    return result
+
+
+def _u8len(s: str) -> int:
+    return len(s.encode("utf-8", "surrogatepass"))
+
+
+def to_utf8(change: List[Op], document: List[Op]) -> List[Op]:
+    """Re-count retain/delete lengths of `change` (against `document`) in UTF-8 bytes, as Yjs/pycrdt do."""
+    return _recount(change, document, _u16len, _u8len,
+                    lambda s, n: (_u16slice(s, 0, n), _u16slice(s, n, _u16len(s))))
+
+
+def from_utf8(change: List[Op], document: List[Op]) -> List[Op]:
+    """Inverse of to_utf8(): UTF-8 byte lengths back to UTF-16 units."""
+    def split(s: str, n: int):
+        raw = s.encode("utf-8", "surrogatepass")
+        return raw[:n].decode("utf-8", "surrogatepass"), raw[n:].decode("utf-8", "surrogatepass")
+    return _recount(change, document, _u8len, _u16len, split)
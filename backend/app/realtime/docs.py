@@ -1,8 +1,26 @@
+import base64
+from typing import Dict, List, Optional
+
 from flask import request
 from flask_socketio import join_room, leave_room, emit
 
 from ..extensions import socketio, db
-from ..models import Document
+from ..models import Document, User
+from ..overviews import overview_cache
+from ..permissions import permission_cache
+from . import delta
+from .delta import Op
+from .batcher import room_batcher
+from .buffer import write_buffer
+from .codec import socket_codec
+from .connections import connections
+from .crdt import crdt_sync, Diverged, AWARENESS, STEP1, STEP2
+from .history import op_history
+from .limits import socket_limiter
+from .oplog import op_log
+from .presence import presence
+from .shards import shards
+from .snapshots import snapshot_cache
 from app.decorators.socketio_auth import (
     ws_on_connect_auth,
     ws_on_disconnect_cleanup,
@@ -11,6 +29,197 @@ from app.decorators.socketio_auth import (
 )
 
 
+def snapshot_payload(snap):
+    return {
+        "document_id": snap["id"],
+        "title": snap["title"],
+        "description": snap["description"],
+        "content": snap["content"],
+        "version": snap["version"],
+    }
+
+
+# doc_id -> {sid: worker the socket is connected to}, kept by the owner
+_members: Dict[int, Dict[str, Optional[str]]] = {}
+
+
+def _release(doc_id: int) -> None:
+    """Flush a document's buffered edits once its last client is gone."""
+    with op_history.lock(doc_id):
+        write_buffer.release(doc_id)
+        op_history.reset(doc_id)
+
+
+# Tasks below run on the document's owner (see shards.py); `sid` may be a
+# socket on another worker, so they emit through socketio/socket_codec
+# rather than flask_socketio's request-bound emit().
+
+def _missing(doc_id: int, since: int, current: int) -> Optional[List[dict]]:
+    """Changes after `since` as document_updates items, or None if they are no longer around."""
+    changes = op_history.since(doc_id, since, current)
+    if changes is not None:
+        return [{"version": v, "delta": {"ops": ops}} for v, ops in zip(range(since + 1, current + 1), changes)]
+    if since < 0 or current - since > op_log.retain_ops:
+        return None
+    # older than the in-memory history: the op log has the flushed ones
+    found = dict(op_log.since(doc_id, since, current))
+    live = write_buffer.peek(doc_id)
+    if live is not None:
+        found.update(live.pending_ops)
+    if sorted(found) != list(range(since + 1, current + 1)):
+        return None
+    return [{"version": v, "delta": {"ops": found[v]}} for v in sorted(found)]
+
+
+@shards.task("join")
+def _join(doc_id: int, sid: str, binary: bool = False, origin: Optional[str] = None,
+          protocol: str = "ot", since: Optional[int] = None) -> None:
+    """
+    Send the joining socket the document: a full snapshot, or for a client
+    that reconnects with the version it has, only the changes it missed
+    (an empty frame when it is up to date).
+    """
+    if protocol == "yjs":
+        _join_yjs(doc_id, sid, origin)
+        return
+    items = None
+    with op_history.lock(doc_id):
+        # queued changes are part of what we send below; a composed run must not reach it twice
+        room_batcher.flush(doc_id, skip_sid=sid)
+        _members.setdefault(doc_id, {})[sid] = origin
+        snap = snapshot_cache.get(doc_id)
+        if snap and since is not None and since <= snap["version"]:
+            items = _missing(doc_id, since, snap["version"])
+    if items is not None:
+        socket_codec.send("document_updates", {"document_id": doc_id, "items": items}, sid, binary)
+    elif snap:
+        socket_codec.send("load_document_content", snapshot_payload(snap), sid, binary)
+
+
+def _join_yjs(doc_id: int, sid: str, origin: Optional[str]) -> None:
+    with op_history.lock(doc_id):
+        live = write_buffer.load(doc_id)
+        if not live:
+            socketio.emit("error", {"message": "Document not found"}, to=sid)
+            return
+        _members.setdefault(doc_id, {})[sid] = origin
+        ystate = live.crdt or crdt_sync.attach(doc_id, live, None)
+        message = crdt_sync.sync_step1(ystate)
+    if ystate.dirty:
+        write_buffer.schedule()
+    socketio.emit("yjs", {"document_id": doc_id, "message": message}, to=sid)
+
+
+@shards.task("leave")
+def _leave(doc_id: int, sid: str) -> None:
+    members = _members.get(doc_id)
+    if members:
+        members.pop(sid, None)
+    if not members:
+        _members.pop(doc_id, None)
+        _release(doc_id)
+
+
+@shards.task("change")
+def _change(doc_id: int, sid: str, version: int, ops: List[Op], binary: bool = False,
+            origin: Optional[str] = None) -> None:
+    with op_history.lock(doc_id):
+        _members.setdefault(doc_id, {}).setdefault(sid, origin)
+        live = write_buffer.load(doc_id)
+        if not live:
+            socketio.emit("error", {"message": "Document not found"}, to=sid)
+            return
+
+        concurrent = op_history.since(doc_id, version, live.version)
+        content = None
+        if concurrent is not None:
+            for past in concurrent:
+                ops = delta.transform(past, ops, priority=True)
+            try:
+                content = delta.apply(live.content, ops)
+            except ValueError:
+                pass
+        if content is None:
+            # client is too far behind (or sent garbage); make it start over
+            socket_codec.send("load_document_content", snapshot_payload(snapshot_cache.get(doc_id)), sid, binary)
+            return
+
+        if live.crdt is not None:
+            update = crdt_sync.apply_delta(live.crdt, ops, live.content)
+            if update:
+                crdt_sync.broadcast(doc_id, update)
+
+        # persisted later, in batches, by the write-behind buffer
+        version = write_buffer.apply(doc_id, live, content, ops)
+        op_history.append(doc_id, version, ops)
+        snapshot_cache.apply_edit(doc_id, content, version, ops)
+        # broadcast and ack go out with the room's next batch
+        room_batcher.enqueue(doc_id, version, ops, sid, binary)
+
+
+@shards.task("yjs")
+def _yjs(doc_id: int, sid: str, message: str, origin: Optional[str] = None) -> None:
+    with op_history.lock(doc_id):
+        _members.setdefault(doc_id, {}).setdefault(sid, origin)
+        live = write_buffer.load(doc_id)
+        if not live:
+            socketio.emit("error", {"message": "Document not found"}, to=sid)
+            return
+        ystate = live.crdt or crdt_sync.attach(doc_id, live, None)
+        try:
+            reply, ops, content, update = crdt_sync.receive(ystate, base64.b64decode(message), live.content)
+        except Diverged as e:
+            # the sender has the update the server undid: everyone gets both
+            socketio.emit("error", {"message": "Invalid Yjs message"}, to=sid)
+            write_buffer.schedule()
+            crdt_sync.broadcast(doc_id, e.update)
+            return
+        except ValueError:
+            socketio.emit("error", {"message": "Invalid Yjs message"}, to=sid)
+            return
+
+        if ops:
+            # OT clients see the change like any other, with no one to ack
+            version = write_buffer.apply(doc_id, live, content, ops)
+            op_history.append(doc_id, version, ops)
+            snapshot_cache.apply_edit(doc_id, content, version, ops)
+            room_batcher.enqueue(doc_id, version, ops, None)
+        elif update:
+            write_buffer.schedule()
+        if update:
+            crdt_sync.broadcast(doc_id, update, skip_sid=sid)
+    if reply:
+        socketio.emit("yjs", {"document_id": doc_id, "message": reply}, to=sid)
+
+
+@shards.task("handoff")
+def _handoff(doc_id: int) -> Dict[str, Optional[str]]:
+    """This worker stops owning the document: write it out and forget it."""
+    with op_history.lock(doc_id):
+        room_batcher.flush(doc_id)
+        write_buffer.release(doc_id)
+        write_buffer.discard(doc_id)
+        op_history.reset(doc_id)
+        snapshot_cache.invalidate(doc_id)
+        return _members.pop(doc_id, {})
+
+
+@shards.task("adopt")
+def _adopt(doc_id: int, state: Dict[str, Optional[str]]) -> None:
+    _members.setdefault(doc_id, {}).update(state)
+
+
+@shards.task("workers_gone")
+def _workers_gone(workers: List[str]) -> None:
+    """Forget sockets of workers that died; release documents left empty."""
+    for doc_id, members in list(_members.items()):
+        for sid, origin in list(members.items()):
+            if origin in workers:
+                del members[sid]
+        if not members:
+            _leave(doc_id, "")
+
+
 @socketio.on("connect")
 def handle_connect():
     from flask import request, current_app
@@ -20,52 +229,151 @@ def handle_connect():
         current_app.logger.info("WS connect refused (auth failed)")
         return False
     join_room(f"user_{uid}")
+    socket_codec.negotiate(request.sid, request.args.get("encoding"))
+
+
+@socketio.on("disconnect")
+def handle_disconnect(*args):
+    sid = request.sid
+    for doc_id in ws_on_disconnect_cleanup():
+        presence.leave(doc_id, sid)
+        shards.run(doc_id, "leave", sid=sid)
+    socket_codec.forget(sid)
+    socket_limiter.forget(sid)
 
 
 @socketio.on("join_document")
 @ws_login_required
 @document_access_required(["viewer", "editor", "owner"])
 def handle_join_document(user_id, doc_id, data):
+    """
+    {document_id, version?, protocol?}. A reconnecting OT client sends the
+    last version it has so it only gets what it missed; see _join().
+    """
     room = f"doc_{doc_id}"
-    join_room(room)
+    if data.get("protocol") == "yjs" and not crdt_sync.enabled:
+        emit("error", {"message": "Yjs sync is not enabled"}, room=request.sid)
+        return
+    if not connections.join(request.sid, doc_id):
+        emit("error", {"message": "Too many open documents"}, room=request.sid)
+        return
+    if data.get("protocol") == "yjs":
+        join_room(room)
+        join_room(f"{room}:yjs")
+        # sync step 1 comes from the document's owner; see crdt.py
+        shards.run(doc_id, "join", sid=request.sid, origin=shards.worker_id, protocol="yjs")
+    else:
+        join_room(room)
+        join_room(socket_codec.doc_room(doc_id, request.sid))
+        # the snapshot (or what a reconnecting client missed) comes from the document's owner
+        since = data.get("version")
+        shards.run(doc_id, "join", sid=request.sid, binary=socket_codec.is_binary(request.sid),
+                   origin=shards.worker_id, since=since if isinstance(since, int) else None)
+    emit("user_joined", {"user_id": user_id}, to=room, include_self=False)
 
-    doc = db.session.get(Document, doc_id)
-    if doc:
-        # Send snapshot only to this client
-        emit("load_document_content", {"title": doc.title, "description": getattr(doc, "description", None), "content": doc.content}, room=request.sid)
-        # Notify others in the room
-        emit("user_joined", {"user_id": user_id}, to=room, include_self=False)
+    # the last database read for this socket's presence; see presence.py
+    username = db.session.query(User.username).filter_by(id=user_id).scalar()
+    emit("awareness", presence.join(doc_id, request.sid, user_id, username), room=request.sid)
 
 
 @socketio.on("leave_document")
 @ws_login_required
 def handle_leave_document(user_id, data):
     doc_id = int((data or {}).get("document_id", 0))
-    if doc_id:
+    if doc_id and connections.leave(request.sid, doc_id):
         leave_room(f"doc_{doc_id}")
+        leave_room(socket_codec.doc_room(doc_id, request.sid))
+        leave_room(f"doc_{doc_id}:yjs")
+        presence.leave(doc_id, request.sid)
+        shards.run(doc_id, "leave", sid=request.sid)
+
+
+@socketio.on("awareness_update")
+@ws_login_required
+def handle_awareness_update(user_id, data):
+    """
+    {document_id, cursor?: {index, length}, selection?: {index, length}}.
+    No permission lookup: only sockets that passed join_document are in
+    the presence room, and the broadcast happens on the next tick.
+    """
+    try:
+        doc_id = int((data or {}).get("document_id") or 0)
+    except (TypeError, ValueError):
+        doc_id = 0
+    if not presence.update(doc_id, request.sid, data):
+        emit("error", {"message": "Not in document"}, room=request.sid)
 
 
 @socketio.on("document_change")
 @ws_login_required
 @document_access_required(["editor", "owner"])
 def handle_document_change(user_id, doc_id, data):
-    new_content = (data or {}).get("content")
+    """
+    Clients send {document_id, version, delta: {ops}} where `version` is the
+    last server version they had seen. On the document's owner the ops are
+    rebased over anything applied since then, applied to the live content
+    and queued for the room's next `document_updates` frame (see batcher.py).
+    """
+    data = data or {}
+    base_version = data.get("version")
+    try:
+        ops = delta.validate_ops((data.get("delta") or {}).get("ops"))
+    except ValueError:
+        ops = None
+    if not isinstance(base_version, int) or ops is None:
+        emit("error", {"message": "Invalid change"}, room=request.sid)
+        return
 
-    doc = db.session.get(Document, doc_id)
-    if not doc:
-        emit("error", {"message": "Document not found"}, room=request.sid)
+    shards.run(doc_id, "change", sid=request.sid, version=base_version, ops=ops,
+               binary=socket_codec.is_binary(request.sid), origin=shards.worker_id)
+
+
+@socketio.on("yjs")
+@ws_login_required
+@document_access_required(["viewer", "editor", "owner"])
+def handle_yjs(user_id, doc_id, data):
+    """
+    {document_id, message: bytes} carrying a y-protocols message. Awareness
+    is relayed to the room's other Yjs clients as is; sync messages go to
+    the document's owner. Viewers may ask for state but not send updates.
+    """
+    message = data.get("message")
+    if not crdt_sync.enabled or not isinstance(message, bytes) or len(message) < 2:
+        emit("error", {"message": "Invalid Yjs message"}, room=request.sid)
         return
+    if message[0] == AWARENESS:
+        emit("yjs", {"document_id": doc_id, "message": message}, to=f"doc_{doc_id}:yjs", include_self=False)
+        return
+    if message[1] != STEP1 and permission_cache.level(doc_id, user_id) not in ("editor", "owner"):
+        if message[1] != STEP2:  # a viewer's step 2 is the client's routine reply; just drop it
+            emit("error", {"message": "Access denied"}, room=request.sid)
+        return
+    shards.run(doc_id, "yjs", sid=request.sid, message=base64.b64encode(message).decode(),
+               origin=shards.worker_id)
 
-    doc.content = new_content
-    doc.updated_at = db.func.now()
-    db.session.commit()
 
-    emit(
-        "document_updated",
-        {"document_id": doc_id, "content": new_content, "by_user_id": user_id},
-        to=f"doc_{doc_id}",
-        include_self=False,
-    )
+@socket_limiter.coalesce("document_change")
+def _merge_changes(held: dict, new: dict) -> Optional[dict]:
+    """Two changes to one document against the same server version become one; None leaves them queued apart."""
+    held, new = held or {}, new or {}
+    if held.get("document_id") != new.get("document_id") or held.get("version") != new.get("version"):
+        return None
+    try:
+        ops = delta.compose(delta.validate_ops((held.get("delta") or {}).get("ops")),
+                            delta.validate_ops((new.get("delta") or {}).get("ops")))
+    except ValueError:
+        return None
+    return {**new, "delta": {"ops": ops}}
+
+
+@socket_limiter.coalesce("update_document_metadata")
+@socket_limiter.coalesce("awareness_update")
+def _merge_latest(held: dict, new: dict) -> Optional[dict]:
+    held, new = held or {}, new or {}
+    if held.get("document_id") != new.get("document_id"):
+        return None
+    return {**held, **new}
+
 
 @socketio.on("update_document_metadata")
 @ws_login_required
@@ -86,6 +394,9 @@ def handle_update_document_metadata(user_id, doc_id, data):
 
     doc.updated_at = db.func.now()
     db.session.commit()
+    shards.run(doc_id, "snapshot.update", fields={"title": doc.title, "description": doc.description})
+    # title and updated_at show in every collaborator's overview
+    overview_cache.invalidate_documents([doc_id])
 
     emit(
         "document_metadata_updated",
@@ -0,0 +1,59 @@
+import threading
+import weakref
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from .delta import Op
+
+
+class OpHistory:
+    """
+    Recently applied (already transformed) ops per document, keyed by the
+    version they produced. Used to rebase edits that were made against an
+    older version. Also hands out one lock per document so that the
+    read-transform-write cycle of concurrent edits is serialized; a lock
+    lives as long as someone holds or waits for it.
+    """
+
+    def __init__(self, max_ops: int = 500):
+        self.max_ops = max_ops
+        self._ops: Dict[int, Deque[Tuple[int, List[Op]]]] = {}
+        # weak: reset() can't drop a lock its caller holds and others may wait on
+        self._locks: "weakref.WeakValueDictionary[int, threading.Lock]" = weakref.WeakValueDictionary()
+        self._guard = threading.Lock()
+
+    def init_app(self, app) -> None:
+        self.max_ops = app.config["REALTIME_HISTORY_OPS"]
+
+    def lock(self, doc_id: int) -> threading.Lock:
+        with self._guard:
+            lk = self._locks.get(doc_id)
+            if lk is None:
+                lk = self._locks[doc_id] = threading.Lock()
+            return lk
+
+    def append(self, doc_id: int, version: int, ops: List[Op]) -> None:
+        log = self._ops.get(doc_id)
+        if log is None:
+            log = self._ops[doc_id] = deque(maxlen=self.max_ops)
+        log.append((version, ops))
+
+    def since(self, doc_id: int, base_version: int, current_version: int) -> Optional[List[List[Op]]]:
+        """
+        Ops applied after `base_version`, oldest first. Returns None when the
+        gap can't be bridged (unknown future version or pruned history).
+        """
+        if base_version == current_version:
+            return []
+        if base_version > current_version or base_version < 0:
+            return None
+        log = self._ops.get(doc_id)
+        if not log or log[0][0] > base_version + 1 or log[-1][0] != current_version:
+            return None
+        return [ops for v, ops in log if v > base_version]
+
+    def reset(self, doc_id: int) -> None:
+        self._ops.pop(doc_id, None)
+
+
+op_history = OpHistory()
@@ -0,0 +1,239 @@
+"""
+Flood control for socket events; flask_limiter only covers REST routes.
+
+Every authenticated event (ws_login_required) takes a token from its
+connection's bucket (SOCKET_RATE_PER_SECOND, SOCKET_BURST) and from its
+user's bucket shared by all their tabs (SOCKET_USER_RATE_PER_SECOND,
+SOCKET_USER_BURST). Without a token, events that registered a coalescer
+are held per connection and replayed as tokens come back, in the order
+they were sent: a burst of document_change is composed into one change,
+metadata and cursor updates keep their latest values. Anything sent while
+events are held waits behind them (merged into the last one when it is
+the same event and composes), up to MAX_HELD per connection, so a held
+change is never overtaken by a later leave_document. Past that, and for
+an event without a coalescer when nothing is held, the sender gets a
+"Too many requests" error.
+
+The same loop disconnects slow consumers: sockets whose Engine.IO outbound
+queue holds more than SOCKET_MAX_QUEUED_PACKETS packets.
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from flask import current_app, request
+from flask_socketio import emit
+
+from ..extensions import socketio
+from ..metrics import metrics
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = now
+
+    def refill(self, now: float) -> float:
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        return self.tokens
+
+
+class _Held:
+    """An event waiting for tokens: the handler and the context to replay it in."""
+    __slots__ = ("fn", "user_id", "data", "environ", "event")
+
+    def __init__(self, fn: Callable, user_id: int, data: Any, environ: dict, event: str):
+        self.fn = fn
+        self.user_id = user_id
+        self.data = data
+        self.environ = environ
+        self.event = event
+
+
+class SocketLimiter:
+    """Token buckets, coalescing and slow-consumer checks; see the module docstring."""
+
+    # held events per connection that could not be merged
+    MAX_HELD = 32
+
+    def __init__(self):
+        self.enabled = True
+        self.rate, self.burst = 20.0, 40.0
+        self.user_rate, self.user_burst = 40.0, 80.0
+        self.max_queued = 500
+        self.interval = 0.05
+        self._sids: Dict[str, Tuple[int, TokenBucket]] = {}
+        self._users: Dict[int, TokenBucket] = {}
+        # sid -> held events, oldest first
+        self._held: Dict[str, List[_Held]] = {}
+        self._coalescers: Dict[str, Callable[[Any, Any], Optional[Any]]] = {}
+        self._lock = threading.Lock()
+        self._clock = time.monotonic
+        self._app = None
+        self._worker = None
+        # counters
+        self.allowed = 0
+        self.limited = 0
+        self.coalesced = 0
+        self.replayed = 0
+        self.rejected = 0
+        self.slow_disconnects = 0
+
+    def init_app(self, app) -> None:
+        self.rate = app.config["SOCKET_RATE_PER_SECOND"]
+        self.burst = app.config["SOCKET_BURST"]
+        self.user_rate = app.config["SOCKET_USER_RATE_PER_SECOND"]
+        self.user_burst = app.config["SOCKET_USER_BURST"]
+        self.max_queued = app.config["SOCKET_MAX_QUEUED_PACKETS"]
+        self.enabled = self.rate > 0 and self.user_rate > 0
+        self._app = app
+
+    def coalesce(self, event: str):
+        """
+        Register merge(held_data, new_data) -> data for an event that may be
+        held; None if the two can't be merged and must be replayed in turn.
+        """
+        def deco(fn):
+            self._coalescers[event] = fn
+            return fn
+        return deco
+
+    def admit(self, user_id: int, fn: Callable, data: Any) -> bool:
+        """
+        Called by ws_login_required with the wrapped handler. True: run it
+        now. False: it was held (and will be replayed) or rejected.
+        """
+        self._ensure_worker()
+        if not self.enabled:
+            return True
+        sid, event = request.sid, request.event["message"]
+        with self._lock:
+            queue = self._held.get(sid)
+            if queue:
+                # keep the order: anything behind a held event is merged into the last one or queued
+                merge = self._coalescers.get(event) if queue[-1].event == event else None
+                merged = merge(queue[-1].data, data) if merge else None
+                if merged is not None:
+                    queue[-1].data = merged
+                    self.coalesced += 1
+                    return False
+                self.limited += 1
+                if len(queue) < self.MAX_HELD:
+                    queue.append(_Held(fn, user_id, data, request.environ, event))
+                    return False
+            else:
+                if self._take(sid, user_id):
+                    self.allowed += 1
+                    return True
+                self.limited += 1
+                if event in self._coalescers:
+                    self._held[sid] = [_Held(fn, user_id, data, request.environ, event)]
+                    return False
+            self.rejected += 1
+        emit("error", {"message": "Too many requests", "event": event}, room=sid)
+        return False
+
+    def forget(self, sid: str) -> None:
+        with self._lock:
+            self._sids.pop(sid, None)
+            self._held.pop(sid, None)
+
+    def release(self) -> int:
+        """Replay held events whose connection has tokens again; returns events replayed."""
+        ready = []
+        with self._lock:
+            for sid, queue in list(self._held.items()):
+                while queue and self._take(sid, queue[0].user_id):
+                    ready.append((sid, queue.pop(0)))
+                if not queue:
+                    del self._held[sid]
+        for sid, held in ready:
+            self._replay(sid, held)
+        self.replayed += len(ready)
+        return len(ready)
+
+    def check_consumers(self) -> int:
+        """Disconnect sockets that don't read what we send; returns how many."""
+        eio = socketio.server.eio
+        slow = [eio_sid for eio_sid, sock in list(eio.sockets.items())
+                if getattr(sock, "queue", None) is not None and sock.queue.qsize() > self.max_queued]
+        for eio_sid in slow:
+            current_app.logger.warning("disconnecting slow consumer %s", eio_sid)
+            eio.disconnect(eio_sid)
+        self.slow_disconnects += len(slow)
+        return len(slow)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "connections": len(self._sids),
+            "held": sum(len(queue) for queue in self._held.values()),
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "coalesced": self.coalesced,
+            "replayed": self.replayed,
+            "rejected": self.rejected,
+            "slow_disconnects": self.slow_disconnects,
+        }
+
+    def _take(self, sid: str, user_id: int) -> bool:
+        """One token from both the connection's and the user's bucket, or none."""
+        now = self._clock()
+        entry = self._sids.get(sid)
+        if entry is None:
+            entry = self._sids[sid] = (user_id, TokenBucket(self.rate, self.burst, now))
+        user = self._users.get(user_id)
+        if user is None:
+            user = self._users[user_id] = TokenBucket(self.user_rate, self.user_burst, now)
+        if entry[1].refill(now) < 1 or user.refill(now) < 1:
+            return False
+        entry[1].tokens -= 1
+        user.tokens -= 1
+        return True
+
+    def _replay(self, sid: str, held: _Held) -> None:
+        # the same request context flask_socketio sets up for a live event, timed like one
+        with self._app.request_context(held.environ):
+            request.sid = sid
+            request.namespace = "/"
+            request.event = {"message": held.event, "args": (held.data,)}
+            try:
+                with metrics.timed("socket_event_seconds", event=held.event):
+                    held.fn(held.user_id, held.data)
+            except Exception:
+                current_app.logger.exception("replaying held %s failed", held.event)
+
+    def _prune_users(self) -> None:
+        # full buckets carry no state worth keeping
+        now = self._clock()
+        active = {user_id for user_id, _ in self._sids.values()}
+        with self._lock:
+            for user_id, bucket in list(self._users.items()):
+                if user_id not in active and bucket.refill(now) >= bucket.burst:
+                    del self._users[user_id]
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None and self._app is not None:
+            self._worker = socketio.start_background_task(self._run)
+
+    def _run(self) -> None:
+        ticks = 0
+        while True:
+            socketio.sleep(self.interval)
+            ticks += 1
+            with self._app.app_context():
+                try:
+                    self.release()
+                    if ticks % 20 == 0:
+                        self.check_consumers()
+                        self._prune_users()
+                except Exception:
+                    current_app.logger.exception("socket limiter loop failed")
+
+
+socket_limiter = SocketLimiter()
@@ -0,0 +1,173 @@
+"""
+Append-only log of realtime changes.
+
+The write-behind buffer (buffer.py) appends every applied change to
+document_ops as (document_id, version, ops) and only bumps documents.version
+(and the plain text search reads), instead of rewriting the whole content
+JSONB on each flush. documents.content
+becomes a snapshot at content_version, folded in by the buffer every
+OPLOG_SNAPSHOT_OPS changes and when a document's room empties. Reading a
+document is its snapshot plus the ops after it (materialize()).
+
+A background compactor folds tails that were left behind (a worker died
+mid-session) and prunes ops more than OPLOG_RETAIN_OPS versions behind the
+snapshot; the retained ones are there for clients catching up on reconnect.
+
+A tail that cannot be replayed (a missing version, an op that does not
+apply) is cut where it breaks: what replayed becomes the snapshot at
+documents.version, so new changes never reuse a stored version.
+
+benchmarks/bench_oplog.py measures the write amplification against
+full-row updates.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import delete, update
+
+from ..extensions import db, socketio
+from ..models import Document, DocumentOp
+from ..search import plain_text
+from . import delta
+from .delta import Op
+
+
+class OpLog:
+    """Reads and compacts document_ops; see the module docstring."""
+
+    def __init__(self):
+        self.snapshot_ops = 500
+        self.retain_ops = 1000
+        self.interval = 60.0
+        self._app = None
+        self._worker = None
+        # counters
+        self.replayed_ops = 0
+        self.compactions = 0
+        self.pruned_ops = 0
+        self.repairs = 0
+
+    def init_app(self, app) -> None:
+        self.snapshot_ops = app.config["OPLOG_SNAPSHOT_OPS"]
+        self.retain_ops = app.config["OPLOG_RETAIN_OPS"]
+        self.interval = app.config["OPLOG_COMPACT_INTERVAL_SECONDS"]
+        self._app = app
+
+    def since(self, doc_id: int, version: int, upto: Optional[int] = None) -> List[Tuple[int, List[Op]]]:
+        """Stored (version, ops) after `version` (up to `upto`), oldest first."""
+        query = db.session.query(DocumentOp.version, DocumentOp.ops).filter(
+            DocumentOp.document_id == doc_id, DocumentOp.version > version
+        )
+        if upto is not None:
+            query = query.filter(DocumentOp.version <= upto)
+        return [(v, ops) for v, ops in query.order_by(DocumentOp.version)]
+
+    def materialize(self, doc: Document) -> Tuple[List[Op], int]:
+        """
+        Content of a document row and the version it is at: snapshot + tail.
+        Always documents.version: a tail with a gap or an op that does not
+        apply is repaired first (_repair), so no stored version is reused.
+        """
+        content = delta.ops_of(doc.content)
+        version = doc.content_version
+        if doc.version == version:
+            return content, version
+        for next_version, ops in self.since(doc.id, version, doc.version):
+            if next_version != version + 1:
+                break
+            try:
+                content = delta.apply(content, ops)
+            except ValueError:
+                break
+            version = next_version
+            self.replayed_ops += 1
+        if version != doc.version:
+            current_app.logger.error(
+                "document %s: op log broken after version %d (row says %d)", doc.id, version, doc.version
+            )
+            self._repair(doc.id, content, version, doc.version)
+            version = doc.version
+        return content, version
+
+    def _repair(self, doc_id: int, content: List[Op], good: int, version: int) -> None:
+        """
+        Make what replayed up to `good` the snapshot at `version` and drop
+        the ops after `good` that no longer lead to it (commits). Clients
+        behind `version` get the full document on their next join.
+        """
+        db.session.execute(
+            update(Document)
+            .where(Document.id == doc_id, Document.content_version < version)
+            .values(content={"ops": content}, content_text=plain_text({"ops": content}), content_version=version,
+                    updated_at=Document.updated_at)
+        )
+        db.session.execute(
+            delete(DocumentOp).where(
+                DocumentOp.document_id == doc_id, DocumentOp.version > good, DocumentOp.version <= version
+            )
+        )
+        db.session.commit()
+        self.repairs += 1
+
+    def prune(self, doc_ids: Optional[Iterable[int]] = None) -> int:
+        """Delete ops outside the retention window (no commit); returns rows deleted."""
+        stmt = delete(DocumentOp).where(
+            DocumentOp.document_id == Document.id,
+            DocumentOp.version <= Document.content_version - self.retain_ops,
+        )
+        if doc_ids is not None:
+            stmt = stmt.where(DocumentOp.document_id.in_(list(doc_ids)))
+        deleted = db.session.execute(stmt).rowcount or 0
+        self.pruned_ops += deleted
+        return deleted
+
+    def compact(self, limit: int = 50) -> int:
+        """Fold the tails of documents nobody has edited for a while; returns documents folded."""
+        idle = datetime.now(timezone.utc) - timedelta(seconds=self.interval)
+        docs = (
+            db.session.query(Document)
+            .filter(Document.version > Document.content_version, Document.updated_at < idle)
+            .limit(limit)
+            .all()
+        )
+        for doc in docs:
+            content, version = self.materialize(doc)
+            # never move a snapshot backwards if the owner folded it meanwhile
+            db.session.execute(
+                update(Document)
+                .where(Document.id == doc.id, Document.content_version < version)
+                .values(content={"ops": content}, content_text=plain_text({"ops": content}), content_version=version,
+                        updated_at=Document.updated_at)
+            )
+        self.prune()
+        db.session.commit()
+        self.compactions += len(docs)
+        return len(docs)
+
+    def stats(self) -> dict:
+        return {
+            "snapshot_every_ops": self.snapshot_ops,
+            "retain_ops": self.retain_ops,
+            "replayed_ops": self.replayed_ops,
+            "compactions": self.compactions,
+            "pruned_ops": self.pruned_ops,
+            "repairs": self.repairs,
+        }
+
+    def ensure_worker(self) -> None:
+        if self._worker is None and self.interval > 0:
+            self._worker = socketio.start_background_task(self._run)
+
+    def _run(self) -> None:
+        while True:
+            socketio.sleep(self.interval)
+            with self._app.app_context():
+                try:
+                    self.compact()
+                except Exception:
+                    db.session.rollback()
+                    current_app.logger.exception("op log compaction failed")
+
+
+op_log = OpLog()
@@ -0,0 +1,152 @@
+import itertools
+import secrets
+import threading
+from typing import Dict, List, Optional, Set
+
+from flask import current_app
+
+from ..extensions import socketio
+
+
+def _clean_range(value) -> Optional[dict]:
+    """{index, length} with non-negative ints, or None."""
+    if not isinstance(value, dict):
+        return None
+    index, length = value.get("index"), value.get("length", 0)
+    if not isinstance(index, int) or not isinstance(length, int) or index < 0 or length < 0:
+        return None
+    return {"index": index, "length": length}
+
+
+class _Member:
+    __slots__ = ("client_id", "user_id", "username", "cursor", "selection")
+
+    def __init__(self, client_id: int, user_id: int, username: Optional[str]):
+        self.client_id = client_id
+        self.user_id = user_id
+        self.username = username
+        self.cursor: Optional[dict] = None
+        self.selection: Optional[dict] = None
+
+    def state(self) -> dict:
+        return {
+            "client_id": self.client_id,
+            "user_id": self.user_id,
+            "username": self.username,
+            "cursor": self.cursor,
+            "selection": self.selection,
+        }
+
+
+class PresenceChannel:
+    """
+    Who is in a document room and where their cursor/selection is. Kept
+    purely in memory: membership is established by join_document (which
+    did the permission check), so updates never touch Postgres.
+
+    Updates are coalesced per client and sent every 1/PRESENCE_TICK_HZ
+    seconds as one `awareness` frame per room:
+        {document_id, states: [member state...], removed: [client_id...]}
+
+    With sharding (shards.py) each worker sends frames for its own sockets.
+    """
+
+    def __init__(self):
+        self.interval = 0.05
+        # random start so ids from different workers (shards.py) don't collide
+        self._ids = itertools.count(secrets.randbits(40))
+        self._rooms: Dict[int, Dict[str, _Member]] = {}
+        self._dirty: Dict[int, Set[str]] = {}
+        self._removed: Dict[int, List[int]] = {}
+        self._lock = threading.Lock()
+        self._app = None
+        self._worker = None
+        # counters
+        self.updates = 0
+        self.frames = 0
+
+    def init_app(self, app) -> None:
+        hz = app.config["PRESENCE_TICK_HZ"]
+        self.interval = 1 / hz if hz > 0 else 0
+        self._app = app
+
+    def join(self, doc_id: int, sid: str, user_id: int, username: Optional[str]) -> dict:
+        """Add a socket to the room; returns the full room state for it."""
+        with self._lock:
+            room = self._rooms.setdefault(doc_id, {})
+            member = room.get(sid)
+            if member is None:
+                member = room[sid] = _Member(next(self._ids), user_id, username)
+                self._dirty.setdefault(doc_id, set()).add(sid)
+            states = [m.state() for m in room.values()]
+        self._ensure_worker()
+        return {"document_id": doc_id, "client_id": member.client_id, "states": states, "removed": []}
+
+    def update(self, doc_id: int, sid: str, data: dict) -> bool:
+        """Record the latest cursor/selection; False if the socket isn't in the room."""
+        member = self._rooms.get(doc_id, {}).get(sid)
+        if member is None:
+            return False
+        with self._lock:
+            if "cursor" in data:
+                member.cursor = _clean_range(data["cursor"])
+            if "selection" in data:
+                member.selection = _clean_range(data["selection"])
+            self._dirty.setdefault(doc_id, set()).add(sid)
+            self.updates += 1
+        return True
+
+    def leave(self, doc_id: int, sid: str) -> None:
+        with self._lock:
+            room = self._rooms.get(doc_id)
+            member = room.pop(sid, None) if room else None
+            if member is None:
+                return
+            self._dirty.get(doc_id, set()).discard(sid)
+            self._removed.setdefault(doc_id, []).append(member.client_id)
+            if not room:
+                del self._rooms[doc_id]
+
+    def members(self, doc_id: int) -> List[dict]:
+        return [m.state() for m in self._rooms.get(doc_id, {}).values()]
+
+    def tick(self) -> int:
+        """Send one frame per room that changed since the last tick; returns frames sent."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            removed, self._removed = self._removed, {}
+            frames = []
+            for doc_id in dirty.keys() | removed.keys():
+                room = self._rooms.get(doc_id, {})
+                states = [room[sid].state() for sid in dirty.get(doc_id, ()) if sid in room]
+                gone = removed.get(doc_id, [])
+                if states or gone:
+                    frames.append((doc_id, {"document_id": doc_id, "states": states, "removed": gone}))
+        for doc_id, frame in frames:
+            socketio.emit("awareness", frame, to=f"doc_{doc_id}")
+        self.frames += len(frames)
+        return len(frames)
+
+    def stats(self) -> dict:
+        return {
+            "rooms": len(self._rooms),
+            "members": sum(len(r) for r in self._rooms.values()),
+            "updates": self.updates,
+            "frames": self.frames,
+        }
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None and self.interval > 0:
+            self._worker = socketio.start_background_task(self._run)
+
+    def _run(self) -> None:
+        while True:
+            socketio.sleep(self.interval or 1)
+            try:
+                self.tick()
+            except Exception:
+                with self._app.app_context():
+                    current_app.logger.exception("presence tick failed")
+
+
+presence = PresenceChannel()
@@ -0,0 +1,349 @@
+"""
+Document-affinity sharding, so several workers (eventlet workers or
+containers) can serve realtime editing without last-writer-wins races.
+
+Every document is owned by exactly one worker, picked by consistent
+hashing of its id over the live workers. Work that touches a document's
+live state (edits, joins, snapshots, REST overwrites) runs as a named task
+on the owner: locally when that is us, otherwise forwarded over a bus.
+Socket.IO emits from the owner reach sockets on any worker through the
+Socket.IO message queue (REDIS_URL).
+
+When the set of workers changes, each worker writes out and forgets the
+documents it no longer owns, and a new owner asks the previous one to do
+so before loading a document it just acquired.
+
+With SHARDING_ENABLED off (the default) tasks simply run in-process.
+"""
+import atexit
+import bisect
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from flask import current_app
+
+from ..extensions import socketio
+
+try:
+    import redis
+except ImportError:  # only needed for the Redis bus
+    redis = None
+
+_CHANNEL = "shards:"
+_MEMBERS = "shards:workers"
+
+
+class ShardUnavailable(RuntimeError):
+    """The owning worker did not answer in time."""
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hash ring with `vnodes` points per node."""
+
+    def __init__(self, nodes=(), vnodes: int = 64):
+        self.nodes = sorted(set(nodes))
+        points = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(vnodes))
+        self._keys = [key for key, _ in points]
+        self._owners = [node for _, node in points]
+
+    def owner(self, key) -> Optional[str]:
+        if not self._keys:
+            return None
+        return self._owners[bisect.bisect(self._keys, _hash(str(key))) % len(self._keys)]
+
+
+class LocalBus:
+    """
+    In-process bus for several routers in one process (tests, experiments).
+    Delivery is synchronous and messages go through JSON like on Redis.
+    """
+    inline = True
+
+    def __init__(self):
+        self._subscribers: Dict[str, Callable[[dict], None]] = {}
+
+    def join(self, worker_id: str, callback: Callable[[dict], None]) -> None:
+        self._subscribers[worker_id] = callback
+
+    def leave(self, worker_id: str) -> None:
+        self._subscribers.pop(worker_id, None)
+
+    def heartbeat(self, worker_id: str) -> None:
+        pass
+
+    def members(self) -> List[str]:
+        return list(self._subscribers)
+
+    def publish(self, worker_id: str, message: dict) -> None:
+        callback = self._subscribers.get(worker_id)
+        if callback is not None:
+            callback(json.loads(json.dumps(message)))
+
+    def broadcast(self, message: dict) -> None:
+        for callback in list(self._subscribers.values()):
+            callback(json.loads(json.dumps(message)))
+
+
+class RedisBus:
+    """Pub/sub channel per worker plus a heartbeat sorted set for membership."""
+    inline = False
+
+    def __init__(self, url: str, ttl: float):
+        if redis is None:
+            raise RuntimeError("SHARD_BUS_URL points at Redis but the redis package is not installed")
+        self._redis = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def join(self, worker_id: str, callback: Callable[[dict], None]) -> None:
+        self.heartbeat(worker_id)
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(_CHANNEL + worker_id, _CHANNEL + "all")
+
+        def listen():
+            for item in pubsub.listen():
+                callback(json.loads(item["data"]))
+
+        socketio.start_background_task(listen)
+
+    def leave(self, worker_id: str) -> None:
+        self._redis.zrem(_MEMBERS, worker_id)
+
+    def heartbeat(self, worker_id: str) -> None:
+        self._redis.zadd(_MEMBERS, {worker_id: time.time()})
+
+    def members(self) -> List[str]:
+        return [m.decode() for m in self._redis.zrangebyscore(_MEMBERS, time.time() - self.ttl, "+inf")]
+
+    def publish(self, worker_id: str, message: dict) -> None:
+        self._redis.publish(_CHANNEL + worker_id, json.dumps(message))
+
+    def broadcast(self, message: dict) -> None:
+        self._redis.publish(_CHANNEL + "all", json.dumps(message))
+
+
+class ShardRouter:
+    """Runs document tasks on the document's owner; see the module docstring."""
+
+    def __init__(self):
+        self.enabled = False
+        self.worker_id: Optional[str] = None
+        self.bus = None
+        self.ring = HashRing()
+        self.timeout = 5.0
+        self.heartbeat = 5.0
+        self._previous = HashRing()
+        self._tasks: Dict[str, Callable[..., Any]] = {}
+        self._calls: Dict[str, list] = {}
+        self._acquired: set = set()
+        self._handed_off: Dict[int, Any] = {}
+        self._acquire_lock = threading.Lock()
+        self._app = None
+        # counters
+        self.local = 0
+        self.forwarded = 0
+        self.received = 0
+        self.handoffs = 0
+
+    def init_app(self, app) -> None:
+        self._app = app
+        self.timeout = app.config["SHARD_CALL_TIMEOUT_SECONDS"]
+        self.heartbeat = app.config["SHARD_HEARTBEAT_SECONDS"]
+        if not app.config["SHARDING_ENABLED"] or self.enabled:
+            return
+        url = app.config["SHARD_BUS_URL"]
+        bus = LocalBus() if url.startswith("memory://") else RedisBus(url, ttl=self.heartbeat * 3)
+        self.start(bus)
+        if not bus.inline:
+            socketio.start_background_task(self._heartbeat_loop)
+        atexit.register(self.stop)
+
+    def start(self, bus, worker_id: Optional[str] = None) -> None:
+        self.bus = bus
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.enabled = True
+        bus.join(self.worker_id, self._receive)
+        self._in_app_context(self._refresh)
+        bus.broadcast({"kind": "membership", "from": self.worker_id})
+
+    def stop(self) -> None:
+        """Hand every owned document back to storage and leave the ring."""
+        if not self.enabled:
+            return
+        with self._app.app_context():
+            for doc_id in list(self._acquired):
+                self._handoff(doc_id)
+        self._handed_off.clear()
+        self.bus.leave(self.worker_id)
+        self.bus.broadcast({"kind": "membership", "from": self.worker_id})
+        self.enabled = False
+        self.ring = self._previous = HashRing()
+
+    def task(self, name: str):
+        """Register a task; document tasks are called as fn(doc_id, **kwargs)."""
+        def deco(fn):
+            self._tasks[name] = fn
+            return fn
+        return deco
+
+    def owner(self, doc_id: int) -> Optional[str]:
+        return self.ring.owner(doc_id) if self.enabled else self.worker_id
+
+    def run(self, doc_id: int, name: str, wait: bool = False, **kwargs) -> Any:
+        """
+        Run a document task on the owner. Forwarded tasks return None unless
+        `wait` is set, in which case the owner's return value comes back
+        (ShardUnavailable after SHARD_CALL_TIMEOUT_SECONDS).
+        """
+        owner = self.owner(doc_id)
+        if owner is None or owner == self.worker_id:
+            self.local += 1
+            return self._execute(doc_id, name, kwargs)
+        self.forwarded += 1
+        message = {"kind": "task", "name": name, "doc_id": doc_id, "args": kwargs, "from": self.worker_id}
+        if not wait:
+            self.bus.publish(owner, message)
+            return None
+        return self._call(owner, message)
+
+    def broadcast(self, name: str, **kwargs) -> None:
+        """Run a task here and on every other worker (cache invalidation)."""
+        self._tasks[name](**kwargs)
+        if self.enabled:
+            self.bus.broadcast({"kind": "task", "name": name, "doc_id": None, "args": kwargs,
+                                "from": self.worker_id})
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "worker_id": self.worker_id,
+            "workers": len(self.ring.nodes),
+            "owned_documents": len(self._acquired),
+            "local": self.local,
+            "forwarded": self.forwarded,
+            "received": self.received,
+            "handoffs": self.handoffs,
+        }
+
+    def _execute(self, doc_id: int, name: str, kwargs: dict) -> Any:
+        if self.enabled:
+            self._acquire(doc_id)
+        return self._tasks[name](doc_id, **kwargs)
+
+    def _acquire(self, doc_id: int) -> None:
+        """First task for a document here: make its previous owner let go of it."""
+        if doc_id in self._acquired:
+            return
+        with self._acquire_lock:
+            if doc_id in self._acquired:
+                return
+            previous = self._previous.owner(doc_id)
+            state = None
+            if previous not in (None, self.worker_id) and previous in self.ring.nodes:
+                try:
+                    state = self._call(previous, {"kind": "task", "name": "shard.handoff", "doc_id": doc_id,
+                                                  "args": {}, "from": self.worker_id})
+                except ShardUnavailable:
+                    current_app.logger.warning("no handoff from %s for document %s", previous, doc_id)
+            if state and "adopt" in self._tasks:
+                self._tasks["adopt"](doc_id, state=state)
+            self._acquired.add(doc_id)
+
+    def _handoff(self, doc_id: int) -> Any:
+        if doc_id in self._acquired:
+            self._acquired.discard(doc_id)
+            self._handed_off[doc_id] = self._tasks["handoff"](doc_id)
+            self.handoffs += 1
+        return self._handed_off.pop(doc_id, None)
+
+    def _call(self, worker_id: str, message: dict) -> Any:
+        call_id = uuid.uuid4().hex
+        done = threading.Event()
+        self._calls[call_id] = [done, None]
+        self.bus.publish(worker_id, {**message, "call_id": call_id})
+        if not done.wait(self.timeout):
+            self._calls.pop(call_id, None)
+            raise ShardUnavailable(worker_id)
+        reply = self._calls.pop(call_id)[1]
+        if reply.get("error"):
+            raise RuntimeError(f"task {message['name']} failed on {worker_id}: {reply['error']}")
+        return reply.get("result")
+
+    def _receive(self, message: dict) -> None:
+        kind = message.get("kind")
+        if kind == "reply":
+            waiter = self._calls.get(message["call_id"])
+            if waiter is not None:
+                waiter[1] = message
+                waiter[0].set()
+        elif message.get("from") == self.worker_id and message.get("doc_id") is None:
+            return  # our own broadcast, already applied locally
+        elif kind == "membership":
+            self._in_app_context(self._refresh)
+        elif kind == "task":
+            self.received += 1
+            if self.bus.inline:
+                self._in_app_context(self._handle, message)
+            else:
+                socketio.start_background_task(self._in_app_context, self._handle, message)
+
+    def _handle(self, message: dict) -> None:
+        name, doc_id, args = message["name"], message["doc_id"], message["args"]
+        result, error = None, None
+        try:
+            if name == "shard.handoff":
+                result = self._handoff(doc_id)
+            elif doc_id is None:
+                self._tasks[name](**args)
+            elif self.owner(doc_id) != self.worker_id and message.get("hops", 0) < 3:
+                # the ring moved while the task was in flight
+                forwarded = {**message, "hops": message.get("hops", 0) + 1}
+                self.bus.publish(self.owner(doc_id), forwarded)
+                return
+            else:
+                result = self._execute(doc_id, name, args)
+        except Exception as e:
+            current_app.logger.exception("shard task %s failed for document %s", name, doc_id)
+            error = str(e) or type(e).__name__
+        if message.get("call_id"):
+            self.bus.publish(message["from"], {"kind": "reply", "call_id": message["call_id"],
+                                               "result": result, "error": error})
+
+    def _refresh(self) -> None:
+        members = sorted(self.bus.members())
+        if members == self.ring.nodes:
+            return
+        gone = set(self.ring.nodes) - set(members)
+        self._previous, self.ring = self.ring, HashRing(members)
+        self._handed_off.clear()
+        for doc_id in list(self._acquired):
+            if self.ring.owner(doc_id) != self.worker_id:
+                self._handoff(doc_id)
+        if gone and "workers_gone" in self._tasks:
+            self._tasks["workers_gone"](workers=sorted(gone))
+        current_app.logger.info("shard ring: %d workers (%s)", len(members), ", ".join(members))
+
+    def _heartbeat_loop(self) -> None:
+        while self.enabled:
+            socketio.sleep(self.heartbeat)
+            try:
+                self.bus.heartbeat(self.worker_id)
+                self._in_app_context(self._refresh)
+            except Exception:
+                self._in_app_context(current_app.logger.exception, "shard heartbeat failed")
+
+    def _in_app_context(self, fn, *args) -> Any:
+        with self._app.app_context():
+            return fn(*args)
+
+
+shards = ShardRouter()
@@ -0,0 +1,138 @@
+import hashlib
+import json
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from ..cache import LRUCache
+from ..extensions import db
+from ..models import Document
+from .buffer import write_buffer
+from .delta import Op
+from .oplog import op_log
+from .shards import shards
+
+
+class SnapshotCache:
+    """
+    Decoded document rows (content included) shared by join_document and
+    GET /documents/<id>, so a room filling up costs one read, not forty.
+    Bounded by DOC_CACHE_MAX_BYTES of serialized content.
+
+    Cached dicts are shared: callers must not mutate them. The realtime
+    path updates entries in place via apply_edit(); REST writes call
+    update() or invalidate().
+    """
+
+    def __init__(self):
+        self._cache = LRUCache()
+
+    def init_app(self, app) -> None:
+        self._cache.max_bytes = app.config["DOC_CACHE_MAX_BYTES"]
+
+    def get(self, doc_id: int) -> Optional[dict]:
+        snap = self._cache.get(doc_id)
+        if snap is not None:
+            return snap
+        doc = db.session.get(Document, doc_id)
+        if not doc:
+            return None
+        snap = {
+            "id": doc.id,
+            "title": doc.title,
+            "description": doc.description,
+            "summary": doc.summary,
+            "owner_id": doc.owner_id,
+            "sharing_version": doc.sharing_version,
+            "updated_at": doc.updated_at.isoformat(),
+        }
+        # unflushed realtime edits are newer than the row
+        live = write_buffer.peek(doc_id)
+        if live is not None:
+            snap["content"] = {"ops": live.content}
+            snap["version"] = live.version
+        elif doc.version == doc.content_version:
+            snap["content"] = doc.content
+            snap["version"] = doc.version
+        else:
+            content, snap["version"] = op_log.materialize(doc)
+            snap["content"] = {"ops": content}
+        self._cache.put(doc_id, snap, len(json.dumps(snap, default=str)))
+        return snap
+
+    def tag(self, doc_id: int) -> Optional[str]:
+        """
+        ETag of the document's state: content version, metadata and sharing
+        version. From the cached snapshot, or one query without content.
+        """
+        snap = self._cache.peek(doc_id)
+        if snap is not None:
+            version = snap["version"]
+            fields = [snap[k] for k in ("title", "description", "summary", "owner_id", "sharing_version")]
+        else:
+            row = (
+                db.session.query(Document.version, Document.title, Document.description, Document.summary,
+                                 Document.owner_id, Document.sharing_version)
+                .filter_by(id=doc_id)
+                .first()
+            )
+            if row is None:
+                return None
+            live = write_buffer.peek(doc_id)
+            version = live.version if live is not None else row.version
+            fields = list(row[1:])
+        digest = hashlib.blake2b(json.dumps(fields).encode(), digest_size=6).hexdigest()
+        return f"d{doc_id}.{version}.{digest}"
+
+    def apply_edit(self, doc_id: int, content: List[Op], version: int, change: List[Op]) -> None:
+        snap = self._cache.peek(doc_id)
+        if snap is None:
+            return
+        snap["content"] = {"ops": content}
+        snap["version"] = version
+        snap["updated_at"] = datetime.now(timezone.utc).isoformat()
+        # approximate: deletes still count, which keeps the estimate on the safe side
+        self._cache.resize(doc_id, self._cache.size_of(doc_id) + len(json.dumps(change)))
+
+    def update(self, doc_id: int, **fields) -> None:
+        snap = self._cache.peek(doc_id)
+        if snap is not None:
+            snap.update(fields)
+
+    def invalidate(self, doc_id: int) -> None:
+        self._cache.pop(doc_id)
+
+    def stats(self) -> dict:
+        return self._cache.stats()
+
+
+snapshot_cache = SnapshotCache()
+
+
+# Only the owner's cache sees live edits, so with sharding enabled reads and
+# updates from other workers go through these tasks (see shards.py).
+
+@shards.task("snapshot")
+def _snapshot(doc_id: int) -> Optional[dict]:
+    return snapshot_cache.get(doc_id)
+
+
+@shards.task("snapshot.tag")
+def _snapshot_tag(doc_id: int) -> Optional[str]:
+    return snapshot_cache.tag(doc_id)
+
+
+@shards.task("snapshot.update")
+def _update_snapshot(doc_id: int, fields: dict) -> None:
+    snapshot_cache.update(doc_id, **fields)
+
+
+@shards.task("snapshot.sharing_versions")
+def _update_sharing_versions(versions: List[List[int]]) -> None:
+    # broadcast: one message for many documents, whichever worker owns them
+    for doc_id, sharing_version in versions:
+        snapshot_cache.update(doc_id, sharing_version=sharing_version)
+
+
+@shards.task("snapshot.invalidate")
+def _invalidate_snapshot(doc_id: int) -> None:
+    snapshot_cache.invalidate(doc_id)
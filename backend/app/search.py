@@ -0,0 +1,77 @@
+"""
+Full-text search over document titles and content.
+
+documents.content_text holds the plain text of the document's content and
+is written with every content write: on create, REST overwrite, every
+write-behind flush of realtime edits (realtime/buffer.py, even those that
+only append to the op log) and op-log compaction (realtime/oplog.py). A
+realtime edit is searchable once it is flushed, i.e. within
+REALTIME_FLUSH_INTERVAL_MS. documents.search_vector is generated from title (weight A) and
+content_text (weight B) by Postgres and GIN-indexed.
+
+The 'simple' configuration does no stemming or stop words: documents are
+written in several languages and a wrong stemmer is worse than none.
+
+A search only ranks documents the user collaborates on, so its cost
+follows the user's matching documents, not the size of the table.
+Headlines are computed for the returned page only.
+"""
+import html
+from typing import Any, List, Optional, Tuple
+
+from sqlalchemy import Float, cast, func, literal_column, tuple_
+
+from .extensions import db
+from .llm import _extract_plain_text
+from .models import Document, DocumentCollaborator
+
+SEARCH_CONFIG = "simple"
+# keeps to_tsvector well under its 1 MB limit
+MAX_TEXT_CHARS = 200_000
+# markers ts_headline puts around matches; replaced by <mark> after escaping
+_START, _STOP = "\x02", "\x03"
+HEADLINE_OPTIONS = f"StartSel={_START}, StopSel={_STOP}, MaxWords=30, MinWords=10, MaxFragments=2"
+
+
+def plain_text(content: Any) -> str:
+    """Searchable text of stored editor content (Quill Delta or string)."""
+    if content is None or (isinstance(content, dict) and "ops" not in content):
+        return ""
+    return _extract_plain_text(content)[:MAX_TEXT_CHARS]
+
+
+def search(user_id: int, text: str, limit: int, cursor: Optional[Tuple[float, int]] = None) -> List[Any]:
+    """
+    One page of the user's documents matching `text` (web search syntax:
+    words, "phrases", -exclusions, or), best first by (rank, id). Rows have
+    id, title, updated_at, permission_level, rank and headline; limit + 1
+    rows are returned so the caller can tell whether there is a next page.
+    """
+    dc = DocumentCollaborator
+    query = func.websearch_to_tsquery(literal_column(f"'{SEARCH_CONFIG}'"), text)
+    # double precision, so the value survives the cursor round trip exactly
+    rank = cast(func.ts_rank(Document.search_vector, query), Float).label("rank")
+    page = (
+        db.session.query(Document.id, Document.title, Document.updated_at, dc.permission_level, rank)
+        .join(dc, dc.document_id == Document.id)
+        .filter(dc.user_id == user_id, Document.search_vector.op("@@")(query))
+    )
+    if cursor is not None:
+        page = page.filter(tuple_(rank, Document.id) < tuple_(*cursor))
+    page = page.order_by(rank.desc(), Document.id.desc()).limit(limit + 1).subquery()
+
+    text_of = db.aliased(Document)
+    headline = func.ts_headline(
+        literal_column(f"'{SEARCH_CONFIG}'"), text_of.content_text, query, HEADLINE_OPTIONS
+    ).label("headline")
+    return (
+        db.session.query(page.c.id, page.c.title, page.c.updated_at, page.c.permission_level, page.c.rank, headline)
+        .join(text_of, text_of.id == page.c.id)
+        .order_by(page.c.rank.desc(), page.c.id.desc())
+        .all()
+    )
+
+
+def highlight(headline: str) -> str:
+    """HTML-escaped headline with matches wrapped in <mark>."""
+    return html.escape(headline).replace(_START, "<mark>").replace(_STOP, "</mark>")
@@ -0,0 +1,185 @@
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+import jwt
+from flask import current_app
+from sqlalchemy import delete, select
+
+from .cache import TTLCache
+from .extensions import db, socketio
+from .models import TokenBlocklist
+from .realtime.shards import shards
+
+
+class TokenVerifier:
+    """
+    JWT checks shared by REST (flask_jwt_extended's blocklist loader) and
+    the socket handshake (ws_on_connect_auth).
+
+    Verified claims are cached until the token expires (at most
+    JWT_CLAIMS_CACHE_MAX tokens), keyed by the token's signature, so a
+    reconnecting socket skips the HMAC and claim validation. REST requests
+    are still decoded by flask_jwt_extended.
+
+    Revocation is a set of revoked JTIs kept in memory instead of a
+    token_blocklist query per request. It is loaded from the rows whose
+    token hasn't expired yet, then refreshed incrementally by created_at
+    at most every TOKEN_REVOCATION_REFRESH_SECONDS, with some overlap for
+    rows committed late. A JTI is forgotten once its token has expired:
+    the signature check rejects it from then on. revoke() updates this
+    worker's set at once and tells the others over the shard bus
+    (shards.py). The periodic refresh bounds the delay when there is no
+    bus or a message is lost.
+
+    Rows of expired tokens are deleted every
+    TOKEN_BLOCKLIST_PURGE_INTERVAL_SECONDS, TOKEN_BLOCKLIST_PURGE_BATCH at
+    a time, so the table only holds tokens that could still be presented.
+    """
+
+    # rows whose transaction started before a refresh but committed after it
+    OVERLAP = timedelta(seconds=30)
+
+    def __init__(self):
+        self.refresh_interval = 5.0
+        self.max_lifetime = timedelta(days=30)
+        self.purge_interval = 3600.0
+        self.purge_batch = 5000
+        self._claims = TTLCache(max_entries=10_000)
+        # jti -> when the revoked token expires
+        self._revoked: Dict[str, datetime] = {}
+        self._since: Optional[datetime] = None
+        self._refreshed = 0.0
+        self._app = None
+        self._worker = None
+        # counters
+        self.verified = 0
+        self.cached = 0
+        self.rejected = 0
+        self.refreshes = 0
+        self.purged = 0
+
+    def init_app(self, app) -> None:
+        self.refresh_interval = app.config["TOKEN_REVOCATION_REFRESH_SECONDS"]
+        self.max_lifetime = max(app.config["JWT_ACCESS_TOKEN_EXPIRES"], app.config["JWT_REFRESH_TOKEN_EXPIRES"])
+        self._claims.max_entries = app.config["JWT_CLAIMS_CACHE_MAX"]
+        self.purge_interval = app.config["TOKEN_BLOCKLIST_PURGE_INTERVAL_SECONDS"]
+        self.purge_batch = app.config["TOKEN_BLOCKLIST_PURGE_BATCH"]
+        self._app = app
+        self._claims.clear()
+        self._revoked.clear()
+        self._since = None
+        self._refreshed = 0.0
+
+    def verify(self, token: str, token_type: str = "access") -> Optional[dict]:
+        """Claims of a valid, unexpired, unrevoked token of that type, else None."""
+        key = token.rpartition(".")[2]
+        claims = self._claims.get(key)
+        if claims is not None and claims["exp"] > time.time():
+            self.cached += 1
+        else:
+            try:
+                claims = jwt.decode(
+                    token,
+                    current_app.config["JWT_SECRET_KEY"],
+                    algorithms=["HS256"],
+                    options={"verify_aud": False},
+                )
+            except jwt.PyJWTError as e:
+                current_app.logger.debug("JWT rejected: %s", e)
+                self.rejected += 1
+                return None
+            self.verified += 1
+            if "exp" in claims:
+                self._claims.put(key, claims, ttl=claims["exp"] - time.time())
+        if claims.get("type") != token_type or self.is_revoked(claims.get("jti")):
+            self.rejected += 1
+            return None
+        return claims
+
+    def is_revoked(self, jti: Optional[str]) -> bool:
+        if jti is None:
+            return True
+        self._refresh()
+        return jti in self._revoked
+
+    def revoke(self, jti: str, expires_at: datetime) -> None:
+        """Call after committing the TokenBlocklist row."""
+        shards.broadcast("tokens.revoke", jti=jti, exp=expires_at.timestamp())
+
+    def purge(self) -> int:
+        """Delete the blocklist rows of expired tokens, a batch per transaction; returns how many."""
+        now = datetime.now(timezone.utc)
+        purged = 0
+        while True:
+            # other workers purge too: skip the rows they are deleting
+            expired = (
+                select(TokenBlocklist.id)
+                .where(TokenBlocklist.expires_at < now)
+                .limit(self.purge_batch)
+                .with_for_update(skip_locked=True)
+            )
+            deleted = db.session.execute(delete(TokenBlocklist).where(TokenBlocklist.id.in_(expired))).rowcount
+            db.session.commit()
+            purged += deleted
+            if deleted < self.purge_batch:
+                break
+            socketio.sleep(0)
+        self.purged += purged
+        return purged
+
+    def stats(self) -> dict:
+        return {
+            "cached_claims": len(self._claims),
+            "revoked": len(self._revoked),
+            "verified": self.verified,
+            "cached": self.cached,
+            "rejected": self.rejected,
+            "refreshes": self.refreshes,
+            "purged": self.purged,
+        }
+
+    def _refresh(self) -> None:
+        if time.monotonic() - self._refreshed < self.refresh_interval:
+            return
+        self._ensure_worker()
+        now = datetime.now(timezone.utc)
+        query = db.session.query(TokenBlocklist.jti, TokenBlocklist.expires_at)
+        if self._since is None:
+            query = query.filter(TokenBlocklist.expires_at > now)
+        else:
+            query = query.filter(TokenBlocklist.created_at >= self._since)
+        for jti, expires_at in query:
+            self._revoked[jti] = expires_at
+        for jti, expires_at in list(self._revoked.items()):
+            if expires_at <= now:
+                del self._revoked[jti]
+        self._since = now - self.OVERLAP
+        self._refreshed = time.monotonic()
+        self.refreshes += 1
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None and self.purge_interval > 0 and self._app is not None:
+            self._worker = socketio.start_background_task(self._run)
+
+    def _run(self) -> None:
+        while True:
+            socketio.sleep(self.purge_interval)
+            with self._app.app_context():
+                try:
+                    self.purge()
+                except Exception:
+                    db.session.rollback()
+                    current_app.logger.exception("token blocklist purge failed")
+
+
+token_verifier = TokenVerifier()
+
+
+@shards.task("tokens.revoke")
+def _revoke(jti: str, exp: Optional[float] = None) -> None:
+    if exp is None:  # sent by a worker predating TokenBlocklist.expires_at
+        expires_at = datetime.now(timezone.utc) + token_verifier.max_lifetime
+    else:
+        expires_at = datetime.fromtimestamp(exp, timezone.utc)
+    token_verifier._revoked[jti] = expires_at
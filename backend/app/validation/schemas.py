@@ -1,5 +1,8 @@
-from pydantic import BaseModel, EmailStr, field_validator
-from typing import Optional, Dict, Any
+from pydantic import BaseModel, EmailStr, Field, field_validator
+from typing import Optional, Dict, Any, List, Literal
+
+# items per bulk request (api/documents.py, api/sharing.py)
+MAX_BULK_ITEMS = 1000
 
 class RegisterSchema(BaseModel):
     username: str
@@ -28,4 +31,22 @@ class UpdateDocSchema(BaseModel):
     title: Optional[str] = None
     description: Optional[str] = None
     summary: Optional[str] = None
-    content: Optional[Dict[str, Any]] = None
\ No newline at end of file
+    content: Optional[Dict[str, Any]] = None
+
+class BulkCreateDocSchema(BaseModel):
+    documents: List[CreateDocSchema] = Field(min_length=1, max_length=MAX_BULK_ITEMS)
+
+class BulkShareSchema(BaseModel):
+    """One document, many users."""
+    user_ids: List[int] = Field(default_factory=list, max_length=MAX_BULK_ITEMS)
+    emails: List[EmailStr] = Field(default_factory=list, max_length=MAX_BULK_ITEMS)
+    permission_level: Literal["viewer", "editor"] = "viewer"
+    notify: bool = True  # socket notification and email per invitee
+
+class BulkShareDocsSchema(BaseModel):
+    """Many documents, one user."""
+    document_ids: List[int] = Field(min_length=1, max_length=MAX_BULK_ITEMS)
+    user_id: Optional[int] = None
+    email: Optional[EmailStr] = None
+    permission_level: Literal["viewer", "editor"] = "viewer"
+    notify: bool = True
@@ -0,0 +1,114 @@
+"""
+Fan-out of realtime edits with and without the per-room batching window
+from app/realtime/batcher.py.
+
+    python -m benchmarks.bench_broadcast [--editors 10] [--viewers 100] [--windows 0,5,10,20,50]
+
+Simulates one document room on a virtual clock: every editor types at
+--rate keystrokes per second (Poisson arrivals) for --seconds. Window 0 is
+the old behaviour: one broadcast plus one ack per change. The Socket.IO
+transport is replaced by counters, so the numbers are emits and messages
+(deliveries to individual sockets) rather than bytes on a real network.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.realtime import batcher as batcher_mod  # noqa: E402
+from app.realtime.codec import socket_codec  # noqa: E402
+
+DOC_ID = 1
+
+
+def simulate(window_ms: float, editors: int, viewers: int, rate: float, seconds: float, seed: int) -> dict:
+    rnd = random.Random(seed)
+    room_size = editors + viewers
+    counts = {"emits": 0, "messages": 0}
+
+    def broadcast(event, payload, doc_id, skip_sid=None):
+        skipped = len(skip_sid) if isinstance(skip_sid, list) else int(skip_sid is not None)
+        counts["emits"] += 1
+        counts["messages"] += room_size - skipped
+
+    def send(event, payload, sid):
+        counts["emits"] += 1
+        counts["messages"] += 1
+
+    socket_codec.broadcast, socket_codec.send = broadcast, send
+
+    events = []
+    for editor in range(editors):
+        t = rnd.expovariate(rate)
+        while t < seconds:
+            events.append((t, f"editor-{editor}"))
+            t += rnd.expovariate(rate)
+    events.sort()
+
+    now = [0.0]
+    b = batcher_mod.RoomBatcher()
+    b.window = window_ms / 1000
+    b._clock = lambda: now[0]
+    b._worker = True  # flushes are driven by the loop below, not a background task
+
+    length = 1
+    next_flush = b.window
+    cpu = 0.0
+    for version, (t, sid) in enumerate(events, start=1):
+        while b.window > 0 and next_flush <= t:
+            now[0] = next_flush
+            started = time.perf_counter()
+            b.flush()
+            cpu += time.perf_counter() - started
+            next_flush += b.window
+        now[0] = t
+        ops = [{"retain": rnd.randrange(length)}, {"insert": "x"}] if length > 1 else [{"insert": "x"}]
+        length += 1
+        started = time.perf_counter()
+        b.enqueue(DOC_ID, version, ops, sid)
+        cpu += time.perf_counter() - started
+    now[0] = next_flush
+    b.flush()
+
+    stats = b.stats()
+    return {
+        "window_ms": window_ms,
+        "changes_per_s": round(len(events) / seconds, 1),
+        "emits_per_s": round(counts["emits"] / seconds, 1),
+        "messages_per_s": round(counts["messages"] / seconds, 1),
+        "added_latency_ms_avg": stats["added_latency_ms_avg"],
+        "added_latency_ms_max": stats["added_latency_ms_max"],
+        "cpu_ms_per_s": round(cpu / seconds * 1000, 2),
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--editors", type=int, default=10)
+    ap.add_argument("--viewers", type=int, default=100)
+    ap.add_argument("--rate", type=float, default=5.0, help="keystrokes per second per editor")
+    ap.add_argument("--seconds", type=float, default=60.0)
+    ap.add_argument("--windows", default="0,5,10,20,50", help="batching windows in ms")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--json", action="store_true", help="print raw JSON results")
+    args = ap.parse_args()
+
+    rows = [
+        simulate(float(w), args.editors, args.viewers, args.rate, args.seconds, args.seed)
+        for w in args.windows.split(",")
+    ]
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    header = list(rows[0])
+    print("  ".join(f"{h:>20}" for h in header))
+    for r in rows:
+        print("  ".join(f"{r[h]!s:>20}" for h in header))
+
+
+if __name__ == "__main__":
+    main()
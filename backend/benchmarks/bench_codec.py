@@ -0,0 +1,115 @@
+"""
+Bytes on the wire and encode/decode CPU of the JSON payloads we send today
+versus the opt-in MessagePack (+ zlib) encoding from app/realtime/codec.py.
+
+    python -m benchmarks.bench_codec [--sizes 50,200] [--repeat 200]
+
+Documents are synthetic Quill Deltas shaped like real ones: paragraphs of
+prose with bold/italic runs, headers, list items and the odd link.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.realtime import codec  # noqa: E402
+
+WORDS = (
+    "the quarterly roadmap meeting covers budget hiring launch metrics customer "
+    "feedback latency editor release notes migration owner deadline review draft "
+    "Müller café naïve résumé 😀 ✅"
+).split()
+
+
+def make_document(target_kb: int, seed: int = 1) -> dict:
+    rnd = random.Random(seed)
+    ops = []
+    size = 0
+    while size < target_kb * 1024:
+        for _ in range(rnd.randint(3, 8)):
+            words = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(3, 15))) + " "
+            r = rnd.random()
+            if r < 0.15:
+                op = {"insert": words, "attributes": {"bold": True}}
+            elif r < 0.25:
+                op = {"insert": words, "attributes": {"italic": True}}
+            elif r < 0.28:
+                op = {"insert": words, "attributes": {"link": "https://example.com/" + rnd.choice(WORDS)}}
+            else:
+                op = {"insert": words}
+            ops.append(op)
+            size += len(words)
+        r = rnd.random()
+        if r < 0.1:
+            ops.append({"insert": "\n", "attributes": {"header": rnd.choice([1, 2, 3])}})
+        elif r < 0.3:
+            ops.append({"insert": "\n", "attributes": {"list": rnd.choice(["bullet", "ordered"])}})
+        else:
+            ops.append({"insert": "\n"})
+    return {"ops": ops}
+
+
+def _time(fn, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1e6  # µs per call
+
+
+def bench(name: str, payload: dict, repeat: int, threshold: int) -> dict:
+    as_json = json.dumps(payload, separators=(",", ":"))
+    as_bin = codec.encode(payload, threshold)
+    return {
+        "payload": name,
+        "json_bytes": len(as_json.encode()),
+        "binary_bytes": len(as_bin),
+        "compressed": as_bin[0] == codec.FLAG_DEFLATE,
+        "ratio": round(len(as_bin) / len(as_json.encode()), 3),
+        "json_encode_us": round(_time(lambda: json.dumps(payload, separators=(",", ":")), repeat), 1),
+        "json_decode_us": round(_time(lambda: json.loads(as_json), repeat), 1),
+        "binary_encode_us": round(_time(lambda: codec.encode(payload, threshold), repeat), 1),
+        "binary_decode_us": round(_time(lambda: codec.decode(as_bin), repeat), 1),
+    }
+
+
+def main() -> None:
+    if codec.msgpack is None:
+        sys.exit("msgpack is not installed")
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="10,50,200", help="document sizes in KB")
+    ap.add_argument("--repeat", type=int, default=100)
+    ap.add_argument("--threshold", type=int, default=codec.DEFAULT_THRESHOLD)
+    ap.add_argument("--json", action="store_true", help="print raw JSON results")
+    args = ap.parse_args()
+
+    rows = []
+    for kb in (int(s) for s in args.sizes.split(",")):
+        doc = make_document(kb)
+        rows.append(bench(f"load_document_content {kb}KB", {
+            "document_id": 1, "title": "Bench", "description": "", "content": doc, "version": 1234,
+        }, args.repeat, args.threshold))
+    # typical per-keystroke and paste-sized document_updates frames
+    rows.append(bench("document_updates keystroke", {
+        "document_id": 1, "items": [{"version": 1235, "delta": {"ops": [{"retain": 5120}, {"insert": "a"}]}}],
+    }, args.repeat * 20, args.threshold))
+    rows.append(bench("document_updates paste 4KB", {
+        "document_id": 1,
+        "items": [{"version": 1236, "delta": {"ops": [{"retain": 5120}] + make_document(4, seed=2)["ops"]}}],
+    }, args.repeat * 5, args.threshold))
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    header = ("payload", "json_bytes", "binary_bytes", "ratio", "json_encode_us",
+              "binary_encode_us", "json_decode_us", "binary_decode_us")
+    print("  ".join(f"{h:>16}" if i else f"{h:<30}" for i, h in enumerate(header)))
+    for r in rows:
+        print("  ".join(f"{r[h]!s:>16}" if i else f"{r[h]:<30}" for i, h in enumerate(header)))
+
+
+if __name__ == "__main__":
+    main()
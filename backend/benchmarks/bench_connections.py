@@ -0,0 +1,118 @@
+"""
+Memory footprint of the connection registry (app/realtime/connections.py)
+against the plain dicts of sets one would write first.
+
+    python -m benchmarks.bench_connections [--connections 10000,20000,50000] [--tabs 1.2] [--room-size 3]
+
+Every user has --tabs sockets on average and every socket joins one
+document; documents get --room-size sockets on average. Memory is what
+tracemalloc sees allocated by the structure itself (sid strings are
+created beforehand and shared, as they are with Socket.IO). Timings are
+per connect + join + disconnect.
+"""
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Dict, Set
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.realtime.connections import ConnectionRegistry  # noqa: E402
+
+
+class NaiveRegistry:
+    """sid -> user plus dicts of sets, with a set of documents per socket."""
+
+    def __init__(self):
+        self.sid_user: Dict[str, int] = {}
+        self.sid_docs: Dict[str, Set[int]] = {}
+        self.user_sids: Dict[int, Set[str]] = {}
+        self.doc_sids: Dict[int, Set[str]] = {}
+
+    def connect(self, sid, user_id):
+        self.sid_user[sid] = user_id
+        self.sid_docs[sid] = set()
+        self.user_sids.setdefault(user_id, set()).add(sid)
+        return True
+
+    def join(self, sid, doc_id):
+        self.sid_docs[sid].add(doc_id)
+        self.doc_sids.setdefault(doc_id, set()).add(sid)
+        return True
+
+    def disconnect(self, sid):
+        user_id = self.sid_user.pop(sid)
+        sids = self.user_sids[user_id]
+        sids.discard(sid)
+        if not sids:
+            del self.user_sids[user_id]
+        for doc_id in self.sid_docs.pop(sid):
+            sids = self.doc_sids[doc_id]
+            sids.discard(sid)
+            if not sids:
+                del self.doc_sids[doc_id]
+        return ()
+
+
+def _population(count: int, tabs: float, room_size: float, seed: int):
+    rnd = random.Random(seed)
+    users = max(1, int(count / tabs))
+    docs = max(1, int(count / room_size))
+    return [(f"{i:020x}", rnd.randrange(users), rnd.randrange(docs)) for i in range(count)]
+
+
+def run(name: str, factory, population) -> dict:
+    tracemalloc.start()
+    registry = factory()
+    before = tracemalloc.get_traced_memory()[0]
+    for sid, user_id, doc_id in population:
+        registry.connect(sid, user_id)
+        registry.join(sid, doc_id)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    for sid, _, _ in population:
+        registry.disconnect(sid)
+    for sid, user_id, doc_id in population:
+        registry.connect(sid, user_id)
+        registry.join(sid, doc_id)
+    elapsed = time.perf_counter() - started
+    return {
+        "registry": name,
+        "connections": len(population),
+        "mb": round(used / 2**20, 2),
+        "bytes_per_conn": round(used / len(population)),
+        "cycle_us": round(elapsed / len(population) * 1e6, 2),
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--connections", default="10000,20000,50000")
+    ap.add_argument("--tabs", type=float, default=1.2, help="sockets per user")
+    ap.add_argument("--room-size", type=float, default=3, help="sockets per document")
+    ap.add_argument("--json", action="store_true", help="print raw JSON results")
+    args = ap.parse_args()
+
+    rows = []
+    for count in (int(c) for c in args.connections.split(",")):
+        population = _population(count, args.tabs, args.room_size, seed=count)
+        rows.append(run("dict of sets", NaiveRegistry, population))
+        rows.append(run("registry", ConnectionRegistry, population))
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    header = ("registry", "connections", "mb", "bytes_per_conn", "cycle_us")
+    print("  ".join(f"{h:>16}" if i else f"{h:<14}" for i, h in enumerate(header)))
+    for r in rows:
+        print("  ".join(f"{r[h]!s:>16}" if i else f"{r[h]:<14}" for i, h in enumerate(header)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Socket latency of a running backend while it is flooded with logins
+(app/passwords.py).
+
+    python -m benchmarks.bench_login_storm --url http://localhost:8000 [--clients 50] [--documents 5]
+        [--rate 3] [--seconds 15] [--logins 16] [--out results.json]
+
+Sets up editors as benchmarks/load_ws.py does (same loadtest_<i>
+accounts) and has them type for --seconds, then for another --seconds
+while --logins threads log in back to back. Reports the ack and
+propagation latency of each phase, and the logins' throughput, latency
+and status codes.
+
+Start the server with RATELIMIT_ENABLED=false. Compare
+PASSWORD_HASH_THREADS=0 (Argon2 on the hub) with the default. Shed
+logins wait for Retry-After before trying again.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+from benchmarks.load_ws import LoadClient, Recorder, percentiles, setup
+
+
+def _phase(clients, rate: float, seconds: float, seed: int) -> None:
+    stop = threading.Event()
+
+    def typist(client: LoadClient, i: int) -> None:
+        rnd = random.Random(seed + i)
+        while not stop.wait(rnd.expovariate(rate)):
+            client.type()
+
+    threads = [threading.Thread(target=typist, args=(c, i), daemon=True) for i, c in enumerate(clients)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    time.sleep(1)  # in-flight changes land in this phase
+
+
+def _storm(url: str, logins: int, stop: threading.Event, out: list, lock: threading.Lock) -> None:
+    """--logins threads logging in back to back until `stop`; appends (status, seconds) to `out`."""
+    def login(i: int) -> None:
+        session = requests.Session()
+        body = {"email": f"loadtest_{i}@example.com", "password": "loadtest-password"}
+        while not stop.is_set():
+            started = time.perf_counter()
+            retry_after = 0.0
+            try:
+                r = session.post(f"{url}/api/login", json=body, timeout=30)
+                status = r.status_code
+                if status == 503:  # shed: back off as a client would
+                    retry_after = float(r.headers.get("Retry-After", 1))
+            except requests.RequestException as e:
+                status = type(e).__name__
+            with lock:
+                out.append((status, time.perf_counter() - started))
+            stop.wait(retry_after)
+
+    for i in range(logins):
+        threading.Thread(target=login, args=(i,), daemon=True).start()
+
+
+def run(args) -> dict:
+    plan = setup(args.url, args.clients, args.documents, args.parallel)
+    recorders = {"baseline": Recorder(), "login_storm": Recorder()}
+    clients = [LoadClient(args.url, token, doc_id, recorders["baseline"]) for token, doc_id in plan]
+    with ThreadPoolExecutor(args.parallel) as pool:
+        list(pool.map(LoadClient.connect, clients))
+    time.sleep(1)
+
+    result = {"config": {k: getattr(args, k) for k in ("url", "clients", "documents", "rate", "seconds", "logins")}}
+    logins, lock, stop = [], threading.Lock(), threading.Event()
+    for phase, recorder in recorders.items():
+        for c in clients:
+            c.recorder = recorder
+        if phase == "login_storm":
+            started = time.perf_counter()
+            _storm(args.url, args.logins, stop, logins, lock)
+        _phase(clients, args.rate, args.seconds, seed=len(result))
+        result[phase] = {"ack_ms": percentiles(recorder.acks), "propagation_ms": percentiles(recorder.latencies()),
+                         "errors": recorder.errors}
+    stop.set()
+    elapsed = time.perf_counter() - started
+    result["login_storm"]["still_connected"] = sum(1 for c in clients if c.sio.connected)
+    for c in clients:
+        c.sio.disconnect()
+
+    ok = [seconds for status, seconds in logins if status == 200]
+    result["logins"] = {
+        "per_second": round(len(ok) / elapsed, 1),
+        "latency_ms": percentiles(ok),
+        "status": dict(Counter(status for status, _ in logins)),
+    }
+    return result
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default="http://localhost:8000")
+    ap.add_argument("--clients", type=int, default=50)
+    ap.add_argument("--documents", type=int, default=5)
+    ap.add_argument("--rate", type=float, default=3, help="keystrokes per second per client")
+    ap.add_argument("--seconds", type=float, default=15, help="length of each phase")
+    ap.add_argument("--logins", type=int, default=16, help="concurrent login loops during the storm")
+    ap.add_argument("--parallel", type=int, default=20, help="concurrent setup requests and connects")
+    ap.add_argument("--out", help="write the JSON here as well as to stdout")
+    args = ap.parse_args()
+
+    result = run(args)
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.out:
+        Path(args.out).write_text(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Write amplification of a write-behind flush: rewriting documents.content
+(the old behaviour) versus appending to document_ops with a snapshot every
+OPLOG_SNAPSHOT_OPS changes (app/realtime/oplog.py).
+
+    DATABASE_URL=postgresql://... python -m benchmarks.bench_oplog [--sizes 10,50,200] [--edits 300]
+
+Runs against a real Postgres in scratch tables shaped like the real ones
+(dropped afterwards) and measures WAL bytes per flush, which is what the
+disk and any replica actually pay. Each flush carries --per-flush
+keystroke-sized changes at random positions of a synthetic document.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.realtime import delta  # noqa: E402
+from benchmarks.bench_codec import make_document  # noqa: E402
+
+try:
+    import psycopg
+    from psycopg.types.json import Jsonb
+except ImportError:
+    psycopg = None
+
+SCHEMA = """
+CREATE TABLE bench_documents (
+    id BIGINT PRIMARY KEY, content JSONB, version BIGINT NOT NULL,
+    content_version BIGINT NOT NULL, updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE TABLE bench_document_ops (
+    document_id BIGINT NOT NULL REFERENCES bench_documents(id) ON DELETE CASCADE,
+    version BIGINT NOT NULL, ops JSONB NOT NULL, created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (document_id, version)
+);
+"""
+
+
+def _changes(document: list, count: int, seed: int):
+    """Keystroke-sized changes, each against the document left by the previous one."""
+    rnd = random.Random(seed)
+    produced = 0
+    while produced < count:
+        position = rnd.randrange(delta.document_length(document) - 1)
+        change = [{"retain": position}, {"insert": rnd.choice("abcdefghij ")}] if position else [{"insert": "x"}]
+        edited = delta.apply(document, change)
+        try:
+            json.dumps(edited, ensure_ascii=False).encode()
+        except UnicodeEncodeError:
+            continue  # landed inside a surrogate pair, which an editor wouldn't do
+        document = edited
+        produced += 1
+        yield change, document
+
+
+def _wal(cur) -> int:
+    cur.execute("SELECT pg_current_wal_insert_lsn() - '0/0'::pg_lsn")
+    return int(cur.fetchone()[0])
+
+
+def run(conn, strategy: str, kb: int, edits: int, per_flush: int, snapshot_ops: int) -> dict:
+    document = make_document(kb)["ops"]
+    with conn.cursor() as cur:
+        cur.execute("TRUNCATE bench_documents CASCADE")
+        cur.execute("INSERT INTO bench_documents (id, content, version, content_version) VALUES (1, %s, 0, 0)",
+                    (Jsonb({"ops": document}),))
+        conn.commit()
+        version = snapshot_version = 0
+        change_bytes = wal_bytes = 0
+        elapsed = 0.0
+        pending = []
+        for change, document in _changes(document, edits, seed=kb):
+            version += 1
+            pending.append((version, change))
+            change_bytes += len(json.dumps(change))
+            if len(pending) < per_flush:
+                continue
+            before = _wal(cur)
+            started = time.perf_counter()
+            if strategy == "full row":
+                cur.execute("UPDATE bench_documents SET content = %s, version = %s, updated_at = now() WHERE id = 1",
+                            (Jsonb({"ops": document}), version))
+            else:
+                cur.executemany("INSERT INTO bench_document_ops (document_id, version, ops) VALUES (1, %s, %s)",
+                                [(v, Jsonb(ops)) for v, ops in pending])
+                if version - snapshot_version >= snapshot_ops:
+                    cur.execute("UPDATE bench_documents SET content = %s, content_version = %s, version = %s, "
+                                "updated_at = now() WHERE id = 1", (Jsonb({"ops": document}), version, version))
+                    snapshot_version = version
+                else:
+                    cur.execute("UPDATE bench_documents SET version = %s, updated_at = now() WHERE id = 1",
+                                (version,))
+            conn.commit()
+            elapsed += time.perf_counter() - started
+            wal_bytes += _wal(cur) - before
+            pending.clear()
+        flushes = edits // per_flush
+    return {
+        "strategy": strategy,
+        "doc_kb": kb,
+        "flushes": flushes,
+        "wal_kb_per_flush": round(wal_bytes / flushes / 1024, 2),
+        "amplification": round(wal_bytes / change_bytes, 1),
+        "flush_ms": round(elapsed / flushes * 1000, 3),
+    }
+
+
+def main() -> None:
+    if psycopg is None:
+        sys.exit("psycopg is not installed")
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="10,50,200", help="document sizes in KB")
+    ap.add_argument("--edits", type=int, default=300)
+    ap.add_argument("--per-flush", type=int, default=1, help="changes coalesced into one flush")
+    ap.add_argument("--snapshot-ops", type=int, default=500)
+    ap.add_argument("--json", action="store_true", help="print raw JSON results")
+    args = ap.parse_args()
+
+    url = os.getenv("DATABASE_URL", "").replace("+psycopg", "")
+    if not url:
+        sys.exit("set DATABASE_URL")
+    rows = []
+    with psycopg.connect(url) as conn:
+        with conn.cursor() as cur:
+            cur.execute("DROP TABLE IF EXISTS bench_document_ops, bench_documents")
+            cur.execute(SCHEMA)
+        conn.commit()
+        try:
+            for kb in (int(s) for s in args.sizes.split(",")):
+                for strategy in ("full row", "op log"):
+                    rows.append(run(conn, strategy, kb, args.edits, args.per_flush, args.snapshot_ops))
+        finally:
+            conn.rollback()
+            with conn.cursor() as cur:
+                cur.execute("DROP TABLE IF EXISTS bench_document_ops, bench_documents")
+            conn.commit()
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    header = ("strategy", "doc_kb", "flushes", "wal_kb_per_flush", "amplification", "flush_ms")
+    print("  ".join(f"{h:>16}" if i else f"{h:<10}" for i, h in enumerate(header)))
+    for r in rows:
+        print("  ".join(f"{r[h]!s:>16}" if i else f"{r[h]:<10}" for i, h in enumerate(header)))
+
+
+if __name__ == "__main__":
+    main()
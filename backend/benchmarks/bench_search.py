@@ -0,0 +1,131 @@
+"""
+Latency of GET /documents/search (app/search.py) on a large table.
+
+    DATABASE_URL=postgresql://.../scratch python -m benchmarks.bench_search [--documents 1000000] [--repeat 20]
+
+Point DATABASE_URL at a scratch database: it is migrated to head and
+seeded once with --documents documents of ~80 random words from a 5000
+word vocabulary, owned by 10k users. Three users are added on top: one
+with 100 documents, one with 5000 and one with 5000 more shared with them.
+Each query is timed --repeat times through search() with a first page of
+20 hits and headlines, as the endpoint runs it.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+SEED_USERS = 10_000
+VOCABULARY = 5_000
+
+SEED = [
+    """
+INSERT INTO users (username, email, password_hash)
+SELECT 'search_bench_' || g, 'search_bench_' || g || '@example.com', 'x' FROM generate_series(0, %(users)s - 1) g
+""",
+    """
+INSERT INTO documents (title, description, content, content_text, owner_id)
+SELECT 'Document ' || g || ' w' || (g %% %(vocabulary)s), '', NULL,
+       (SELECT string_agg('w' || floor(power(random(), 2) * %(vocabulary)s)::int, ' ')
+        FROM generate_series(1, 80) WHERE g > 0),
+       (SELECT min(id) FROM users WHERE username LIKE 'search_bench_%%') + g %% %(users)s
+FROM generate_series(1, %(documents)s) g
+""",
+    "INSERT INTO document_collaborators (document_id, user_id, permission_level) "
+    "SELECT id, owner_id, 'owner' FROM documents",
+]
+
+# (label, owned documents, shared documents)
+PROFILES = [("light", 100, 0), ("heavy", 5000, 0), ("heavy+shared", 5000, 5000)]
+QUERIES = ["w4999", "w10", "w10 w20", '"w10 w20"', "w1 -w2"]
+
+
+def seed(conn, documents: int) -> None:
+    """Seed unless already done, then attach the profile users to existing documents."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT count(*) FROM users WHERE username LIKE 'search_bench_%'")
+        if cur.fetchone()[0]:
+            return
+        started = time.perf_counter()
+        params = {"users": SEED_USERS, "documents": documents, "vocabulary": VOCABULARY}
+        for statement in SEED:
+            cur.execute(statement, params if "%(" in statement else None)
+        offset = 0
+        for label, owned, shared in PROFILES:
+            cur.execute("INSERT INTO users (username, email, password_hash) VALUES (%s, %s, 'x') RETURNING id",
+                        (f"search_profile_{label}", f"search_profile_{label}@example.com"))
+            user_id = cur.fetchone()[0]
+            cur.execute("UPDATE documents SET owner_id = %s WHERE id IN "
+                        "(SELECT id FROM documents ORDER BY id OFFSET %s LIMIT %s)", (user_id, offset, owned))
+            cur.execute("UPDATE document_collaborators dc SET user_id = d.owner_id FROM documents d "
+                        "WHERE d.id = dc.document_id AND dc.permission_level = 'owner' AND d.owner_id = %s",
+                        (user_id,))
+            cur.execute("INSERT INTO document_collaborators (document_id, user_id, permission_level) "
+                        "SELECT id, %s, 'viewer' FROM documents ORDER BY id DESC OFFSET %s LIMIT %s",
+                        (user_id, offset, shared))
+            offset += owned + shared
+        cur.execute("ANALYZE")
+    conn.commit()
+    print(f"seeded {documents} documents in {time.perf_counter() - started:.0f}s", file=sys.stderr)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--documents", type=int, default=1_000_000)
+    ap.add_argument("--repeat", type=int, default=20)
+    ap.add_argument("--json", action="store_true", help="print raw JSON results")
+    args = ap.parse_args()
+
+    url = os.getenv("DATABASE_URL", "")
+    if not url:
+        sys.exit("set DATABASE_URL to a scratch database")
+    import psycopg
+    from alembic import command
+    from alembic.config import Config
+
+    base = Path(__file__).resolve().parents[1]
+    cfg = Config(str(base / "alembic.ini"))
+    cfg.set_main_option("script_location", str(base / "migrations"))
+    cfg.set_main_option("sqlalchemy.url", url)
+    command.upgrade(cfg, "head")
+    with psycopg.connect(url.replace("+psycopg", "")) as conn:
+        seed(conn, args.documents)
+
+    from app import create_app
+    from app.extensions import db
+    from app.models import User
+    from app.search import search
+
+    rows = []
+    app = create_app()
+    with app.app_context():
+        for label, _, _ in PROFILES:
+            user_id = db.session.query(User.id).filter_by(username=f"search_profile_{label}").scalar()
+            for q in QUERIES:
+                timings, hits = [], 0
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    hits = len(search(user_id, q, 20))
+                    timings.append((time.perf_counter() - started) * 1000)
+                    db.session.rollback()
+                timings.sort()
+                rows.append({"user": label, "query": q, "hits": hits,
+                             "p50_ms": round(statistics.median(timings), 2),
+                             "p95_ms": round(timings[int(0.95 * (len(timings) - 1))], 2)})
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    header = ("user", "query", "hits", "p50_ms", "p95_ms")
+    print("  ".join(f"{h:>12}" for h in header))
+    for r in rows:
+        print("  ".join(f"{r[h]!s:>12}" for h in header))
+
+
+if __name__ == "__main__":
+    main()
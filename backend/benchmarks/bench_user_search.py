@@ -0,0 +1,146 @@
+"""
+Latency of GET /users/search (app/contacts.py) on a large users table,
+against the substring ILIKE it replaces.
+
+    DATABASE_URL=postgresql://.../scratch python -m benchmarks.bench_user_search [--users 1000000] [--repeat 50]
+
+Point DATABASE_URL at a scratch database: it is migrated to head and
+seeded once with --users users (person<n>@example<n % 50>.com, usb_<n>)
+plus one user who shares 20 documents with 40 of them. Each query is
+timed --repeat times through search_users() with that user's recent
+collaborators already loaded, as on every keystroke after the first.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+SEED = [
+    """
+INSERT INTO users (username, email, password_hash)
+SELECT 'usb_' || g, 'person' || g || '@example' || (g %% 50) || '.com', 'x' FROM generate_series(1, %(users)s) g
+""",
+    """
+INSERT INTO users (username, email, password_hash)
+VALUES ('usb_profile', 'usb_profile@example.com', 'x')
+""",
+    """
+INSERT INTO documents (title, description, content, owner_id)
+SELECT 'Shared ' || g, '', NULL, (SELECT id FROM users WHERE username = 'usb_profile')
+FROM generate_series(1, 20) g
+""",
+    """
+INSERT INTO document_collaborators (document_id, user_id, permission_level)
+SELECT id, owner_id, 'owner' FROM documents WHERE owner_id = (SELECT id FROM users WHERE username = 'usb_profile')
+""",
+    """
+INSERT INTO document_collaborators (document_id, user_id, permission_level)
+SELECT d.id, u.id, 'editor'
+FROM documents d
+JOIN users u ON u.username IN ('usb_' || (d.id * 1000), 'usb_' || (d.id * 1000 + 1))
+WHERE d.owner_id = (SELECT id FROM users WHERE username = 'usb_profile')
+""",
+]
+
+# (label, query): short queries are answered from recent collaborators only
+QUERIES = [
+    ("recent collaborators", "per"),
+    ("rare prefix", "person123456"),
+    ("common prefix", "person9"),
+    ("username prefix", "usb_99999"),
+    ("no match", "nobody"),
+]
+
+
+def seed(conn, users: int) -> None:
+    with conn.cursor() as cur:
+        cur.execute("SELECT count(*) FROM users WHERE username = 'usb_profile'")
+        if cur.fetchone()[0]:
+            return
+        started = time.perf_counter()
+        for statement in SEED:
+            cur.execute(statement, {"users": users} if "%(" in statement else None)
+        cur.execute("ANALYZE")
+    conn.commit()
+    print(f"seeded {users} users in {time.perf_counter() - started:.0f}s", file=sys.stderr)
+
+
+def _time(fn, repeat: int):
+    timings, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return result, round(statistics.median(timings), 2), round(timings[int(0.95 * (len(timings) - 1))], 2)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=1_000_000)
+    ap.add_argument("--repeat", type=int, default=50)
+    ap.add_argument("--json", action="store_true", help="print raw JSON results")
+    args = ap.parse_args()
+
+    url = os.getenv("DATABASE_URL", "")
+    if not url:
+        sys.exit("set DATABASE_URL to a scratch database")
+    import psycopg
+    from alembic import command
+    from alembic.config import Config
+
+    base = Path(__file__).resolve().parents[1]
+    cfg = Config(str(base / "alembic.ini"))
+    cfg.set_main_option("script_location", str(base / "migrations"))
+    cfg.set_main_option("sqlalchemy.url", url)
+    command.upgrade(cfg, "head")
+    with psycopg.connect(url.replace("+psycopg", "")) as conn:
+        seed(conn, args.users)
+
+    from app import create_app
+    from app.contacts import recent_collaborators, search_users
+    from app.extensions import db
+    from app.models import User
+
+    rows = []
+    app = create_app()
+    with app.app_context():
+        user_id = db.session.query(User.id).filter_by(username="usb_profile").scalar()
+        recent_collaborators._drop([user_id])
+        _, cold, _ = _time(lambda: recent_collaborators.get(user_id), 1)
+        print(f"loading recent collaborators: {cold} ms", file=sys.stderr)
+
+        def substring(q):
+            # the previous implementation
+            return (
+                db.session.query(User.id, User.username, User.email)
+                .filter(User.email.ilike(f"%{q}%"), User.id != user_id)
+                .order_by(User.email.asc())
+                .limit(10)
+                .all()
+            )
+
+        for label, q in QUERIES:
+            hits, p50, p95 = _time(lambda: search_users(user_id, q), args.repeat)
+            db.session.rollback()
+            row = {"case": label, "query": q, "hits": len(hits), "p50_ms": p50, "p95_ms": p95}
+            _, row["ilike_p50_ms"], _ = _time(lambda: substring(q), max(1, args.repeat // 10))
+            db.session.rollback()
+            rows.append(row)
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+    header = ("case", "query", "hits", "p50_ms", "p95_ms", "ilike_p50_ms")
+    print("  ".join(f"{h:>20}" for h in header))
+    for r in rows:
+        print("  ".join(f"{r[h]!s:>20}" for h in header))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+Load test of the realtime path against a running backend.
+
+    python -m benchmarks.load_ws --url http://localhost:8000 [--clients 200] [--documents 20]
+        [--rate 3] [--seconds 30] [--server-pid PID] [--out results.json]
+
+Registers --clients users (loadtest_<i>, reused across runs), creates
+--documents documents owned by the first user of each and shares them with
+the rest as editors, then connects one Socket.IO client per user over
+websocket. Every client joins its document and types single characters
+at --rate per second (Poisson arrivals), one change in flight at a time
+like the editor.
+
+Reported as JSON:
+  - latency_ms: end-to-end edit propagation, from a client's emit until
+    each other client in the room has the change (p50/p95/p99), and the
+    same for the sender's ack;
+  - server: CPU use and RSS per connection of --server-pid (needs
+    psutil; with several gunicorn workers pass the master and they are
+    summed);
+  - database: commits per second from pg_stat_database (needs psycopg
+    and DATABASE_URL pointing at the server's database).
+
+Start the server with RATELIMIT_ENABLED=false, since registering the
+users trips the REST rate limits, and raise or disable the SOCKET_* rates
+if --rate exceeds them, or the numbers include coalescing.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import requests
+import socketio
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import psycopg
+except ImportError:
+    psycopg = None
+
+
+def percentiles(samples: List[float]) -> dict:
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def at(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+
+    return {"count": len(ordered), "p50": at(0.50), "p95": at(0.95), "p99": at(0.99),
+            "max": round(ordered[-1] * 1000, 2)}
+
+
+class Recorder:
+    """Timestamps from all clients, joined up after the run."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sent: Dict[Tuple[int, int], float] = {}       # (doc, version) -> emit time
+        self.received: List[Tuple[int, int, float]] = []   # (doc, version, time)
+        self.acks: List[float] = []
+        self.errors: Dict[str, int] = {}
+
+    def error(self, message: str) -> None:
+        with self.lock:
+            self.errors[message] = self.errors.get(message, 0) + 1
+
+    def latencies(self) -> List[float]:
+        return [t - self.sent[(doc, v)] for doc, v, t in self.received if (doc, v) in self.sent]
+
+
+class LoadClient:
+    """One simulated editor: a websocket Socket.IO client typing into one document."""
+
+    def __init__(self, url: str, token: str, doc_id: int, recorder: Recorder):
+        self.url = url
+        self.token = token
+        self.doc_id = doc_id
+        self.recorder = recorder
+        self.version: Optional[int] = None
+        self.inflight: Optional[float] = None
+        self.sent = self.deferred = 0
+        self.lock = threading.Lock()
+        self.sio = socketio.Client(reconnection=False)
+        self.sio.on("load_document_content", self._on_load)
+        self.sio.on("document_updates", self._on_updates)
+        self.sio.on("error", lambda data: recorder.error(str((data or {}).get("message"))))
+
+    def connect(self) -> None:
+        self.sio.connect(f"{self.url}?token={self.token}", transports=["websocket"])
+        self.sio.emit("join_document", {"document_id": self.doc_id})
+
+    def type(self) -> None:
+        with self.lock:
+            if self.version is None or self.inflight is not None:
+                self.deferred += 1
+                return
+            self.inflight = time.perf_counter()
+            self.sent += 1
+            version = self.version
+        self.sio.emit("document_change", {"document_id": self.doc_id, "version": version,
+                                          "delta": {"ops": [{"insert": random.choice("abcdef ")}]}})
+
+    def _on_load(self, data) -> None:
+        with self.lock:
+            self.version = data["version"]
+            self.inflight = None
+
+    def _on_updates(self, frame) -> None:
+        now = time.perf_counter()
+        with self.lock:
+            for item in frame["items"]:
+                self.version = item["version"]
+                if item.get("ack") and self.inflight is not None:
+                    with self.recorder.lock:
+                        self.recorder.sent[(self.doc_id, item["version"])] = self.inflight
+                        self.recorder.acks.append(now - self.inflight)
+                    self.inflight = None
+                elif "delta" in item:
+                    with self.recorder.lock:
+                        self.recorder.received.append((self.doc_id, item["version"], now))
+
+
+def _account(url: str, i: int) -> Tuple[int, str]:
+    email, password = f"loadtest_{i}@example.com", "loadtest-password"
+    r = requests.post(f"{url}/api/login", json={"email": email, "password": password})
+    if r.status_code != 200:
+        requests.post(f"{url}/api/register",
+                      json={"username": f"loadtest_{i}", "email": email, "password": password})
+        r = requests.post(f"{url}/api/login", json={"email": email, "password": password})
+    r.raise_for_status()
+    return r.json()["user_id"], r.json()["access_token"]
+
+
+def setup(url: str, clients: int, documents: int, parallel: int) -> List[Tuple[str, int]]:
+    """(token, document id) per client; client i edits document i % documents."""
+    with ThreadPoolExecutor(parallel) as pool:
+        accounts = list(pool.map(lambda i: _account(url, i), range(clients)))
+
+    def make_document(d: int) -> int:
+        _, owner_token = accounts[d]
+        auth = {"Authorization": f"Bearer {owner_token}"}
+        r = requests.post(f"{url}/api/documents", headers=auth,
+                          json={"title": f"load test {d}", "content": {"ops": [{"insert": "\n"}]}})
+        r.raise_for_status()
+        doc_id = r.json()["id"]
+        for user_id, _ in accounts[d + documents::documents]:
+            requests.post(f"{url}/api/documents/{doc_id}/collaborators", headers=auth,
+                          json={"user_id": user_id, "permission_level": "editor"}).raise_for_status()
+        return doc_id
+
+    with ThreadPoolExecutor(parallel) as pool:
+        doc_ids = list(pool.map(make_document, range(documents)))
+    return [(token, doc_ids[i % documents]) for i, (_, token) in enumerate(accounts)]
+
+
+class ServerProbe:
+    """CPU and memory of the server process tree, if we know its pid."""
+
+    def __init__(self, pid: Optional[int]):
+        self.procs = []
+        if pid and psutil is not None:
+            root = psutil.Process(pid)
+            self.procs = [root] + root.children(recursive=True)
+
+    def rss(self) -> int:
+        return sum(p.memory_info().rss for p in self.procs)
+
+    def cpu_seconds(self) -> float:
+        return sum(p.cpu_times().user + p.cpu_times().system for p in self.procs)
+
+
+def _commits(database_url: str) -> Optional[int]:
+    if psycopg is None or not database_url:
+        return None
+    with psycopg.connect(database_url.replace("+psycopg", "")) as conn:
+        return conn.execute("SELECT xact_commit FROM pg_stat_database WHERE datname = current_database()"
+                            ).fetchone()[0]
+
+
+def run(args) -> dict:
+    plan = setup(args.url, args.clients, args.documents, args.parallel)
+    recorder = Recorder()
+    probe = ServerProbe(args.server_pid)
+    database_url = os.getenv("DATABASE_URL", "")
+
+    rss_before = probe.rss() if probe.procs else None
+    clients = [LoadClient(args.url, token, doc_id, recorder) for token, doc_id in plan]
+    with ThreadPoolExecutor(args.parallel) as pool:
+        list(pool.map(LoadClient.connect, clients))
+    time.sleep(1)  # joins answered
+    rss_connected = probe.rss() if probe.procs else None
+
+    commits_before, cpu_before = _commits(database_url), probe.cpu_seconds() if probe.procs else None
+    started = time.perf_counter()
+    stop = threading.Event()
+
+    def typist(client: LoadClient, seed: int) -> None:
+        rnd = random.Random(seed)
+        while not stop.wait(rnd.expovariate(args.rate)):
+            client.type()
+
+    typists = [threading.Thread(target=typist, args=(c, i), daemon=True) for i, c in enumerate(clients)]
+    for t in typists:
+        t.start()
+    time.sleep(args.seconds)
+    stop.set()
+    time.sleep(2)  # let the last changes propagate and flush
+    elapsed = time.perf_counter() - started
+    commits_after, cpu_after = _commits(database_url), probe.cpu_seconds() if probe.procs else None
+
+    for c in clients:
+        c.sio.disconnect()
+
+    sent = sum(c.sent for c in clients)
+    result = {
+        "config": {k: getattr(args, k) for k in ("url", "clients", "documents", "rate", "seconds")},
+        "changes": {"sent": sent, "per_second": round(sent / args.seconds, 1),
+                    "deferred": sum(c.deferred for c in clients),
+                    "unacked": sum(1 for c in clients if c.inflight is not None)},
+        "latency_ms": {"propagation": percentiles(recorder.latencies()), "ack": percentiles(recorder.acks)},
+        "errors": recorder.errors,
+    }
+    if probe.procs:
+        result["server"] = {
+            "cpu_percent": round((cpu_after - cpu_before) / elapsed * 100, 1),
+            "rss_mb": round(rss_connected / 2**20, 1),
+            "rss_per_connection_kb": round((rss_connected - rss_before) / len(clients) / 1024, 1),
+        }
+    if commits_before is not None:
+        result["database"] = {"commits_per_second": round((commits_after - commits_before) / elapsed, 1)}
+    return result
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default="http://localhost:8000")
+    ap.add_argument("--clients", type=int, default=200)
+    ap.add_argument("--documents", type=int, default=20)
+    ap.add_argument("--rate", type=float, default=3, help="keystrokes per second per client")
+    ap.add_argument("--seconds", type=float, default=30)
+    ap.add_argument("--parallel", type=int, default=20, help="concurrent setup requests and connects")
+    ap.add_argument("--server-pid", type=int, help="server process for CPU/memory (needs psutil)")
+    ap.add_argument("--out", help="write the JSON here as well as to stdout")
+    args = ap.parse_args()
+    if args.documents > args.clients:
+        sys.exit("--documents must not exceed --clients")
+
+    result = run(args)
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.out:
+        Path(args.out).write_text(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
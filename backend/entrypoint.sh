@@ -1,6 +1,8 @@
 #!/usr/bin/env bash
 set -euo pipefail
 alembic upgrade head
+# WORKERS>1 needs SHARDING_ENABLED=true and REDIS_URL (see .env.example);
+# don't add --preload, each worker must pick its own shard id after the fork
 exec gunicorn \
   --worker-class eventlet \
   --workers "${WORKERS:-1}" \
@@ -0,0 +1,28 @@
+"""add sharing version to documents
+
+Revision ID: 0b7e3f5a9c12
+Revises: f2a6d4c8b913
+Create Date: 2026-10-17 20:05:31.902214
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0b7e3f5a9c12'
+down_revision: Union[str, Sequence[str], None] = 'f2a6d4c8b913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('documents', sa.Column('sharing_version', sa.BigInteger(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('documents', 'sharing_version')
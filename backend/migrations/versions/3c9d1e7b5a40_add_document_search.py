@@ -0,0 +1,55 @@
+"""add document search
+
+Revision ID: 3c9d1e7b5a40
+Revises: 0b7e3f5a9c12
+Create Date: 2026-10-17 21:12:44.310586
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c9d1e7b5a40'
+down_revision: Union[str, Sequence[str], None] = '0b7e3f5a9c12'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('documents', sa.Column('content_text', sa.Text(), server_default='', nullable=False))
+    # same flattening as app/search.py: the string inserts of a Quill Delta
+    op.execute("""
+        UPDATE documents SET content_text = CASE jsonb_typeof(content)
+            WHEN 'string' THEN content #>> '{}'
+            WHEN 'object' THEN coalesce((
+                SELECT string_agg(o.op ->> 'insert', '' ORDER BY o.n)
+                FROM jsonb_array_elements(CASE jsonb_typeof(content -> 'ops')
+                                          WHEN 'array' THEN content -> 'ops' ELSE '[]' END)
+                     WITH ORDINALITY AS o(op, n)
+                WHERE jsonb_typeof(o.op -> 'insert') = 'string'
+            ), '')
+            ELSE '' END
+        WHERE content IS NOT NULL
+    """)
+    op.add_column('documents', sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed(
+        "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+        "setweight(to_tsvector('simple', content_text), 'B')",
+        persisted=True,
+    ), nullable=True))
+    with op.get_context().autocommit_block():
+        op.create_index('idx_documents_search', 'documents', ['search_vector'], unique=False,
+                        postgresql_using='gin', postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('idx_documents_search', table_name='documents', postgresql_using='gin',
+                      postgresql_concurrently=True, if_exists=True)
+    op.drop_column('documents', 'search_vector')
+    op.drop_column('documents', 'content_text')
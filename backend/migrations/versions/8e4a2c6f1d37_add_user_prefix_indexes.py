@@ -0,0 +1,38 @@
+"""add user prefix indexes
+
+Revision ID: 8e4a2c6f1d37
+Revises: 3c9d1e7b5a40
+Create Date: 2026-10-17 22:05:31.842716
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8e4a2c6f1d37'
+down_revision: Union[str, Sequence[str], None] = '3c9d1e7b5a40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # /users/search matches prefixes of lower(email) and lower(username); in
+    # the C collation a plain btree serves both LIKE 'abc%' and the ORDER BY
+    with op.get_context().autocommit_block():
+        op.create_index('idx_users_email_prefix', 'users', [sa.text('(lower(email) COLLATE "C")')],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('idx_users_username_prefix', 'users', [sa.text('(lower(username) COLLATE "C")')],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('idx_users_username_prefix', table_name='users',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('idx_users_email_prefix', table_name='users',
+                      postgresql_concurrently=True, if_exists=True)
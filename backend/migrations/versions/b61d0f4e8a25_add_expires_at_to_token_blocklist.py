@@ -0,0 +1,42 @@
+"""add expires_at to token_blocklist
+
+Revision ID: b61d0f4e8a25
+Revises: 8e4a2c6f1d37
+Create Date: 2026-10-17 22:48:09.117624
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b61d0f4e8a25'
+down_revision: Union[str, Sequence[str], None] = '8e4a2c6f1d37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('token_blocklist', sa.Column('expires_at', sa.DateTime(timezone=True), nullable=True))
+    # the tokens' exp wasn't kept: assume the longest default lifetime
+    # (JWT_REFRESH_TOKEN_EXPIRES_DAYS), so nothing is purged too early
+    op.execute("UPDATE token_blocklist SET expires_at = created_at + interval '30 days'")
+    op.alter_column('token_blocklist', 'expires_at', nullable=False)
+    with op.get_context().autocommit_block():
+        op.create_index('idx_token_blocklist_created_at', 'token_blocklist', ['created_at'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('idx_token_blocklist_expires_at', 'token_blocklist', ['expires_at'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('idx_token_blocklist_expires_at', table_name='token_blocklist',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('idx_token_blocklist_created_at', table_name='token_blocklist',
+                      postgresql_concurrently=True, if_exists=True)
+    op.drop_column('token_blocklist', 'expires_at')
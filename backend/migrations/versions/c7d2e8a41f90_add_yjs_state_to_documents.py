@@ -0,0 +1,39 @@
+"""add yjs state to documents
+
+Revision ID: c7d2e8a41f90
+Revises: a3f1c9e2b7d4
+Create Date: 2026-10-17 14:36:02.518830
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7d2e8a41f90'
+down_revision: Union[str, Sequence[str], None] = 'a3f1c9e2b7d4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('documents', sa.Column('ydoc_state', sa.LargeBinary(), nullable=True))
+    op.create_table('document_yjs_updates',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('document_id', sa.BigInteger(), nullable=False),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['document_id'], ['documents.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_document_yjs_updates_document_id', 'document_yjs_updates', ['document_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_document_yjs_updates_document_id', table_name='document_yjs_updates')
+    op.drop_table('document_yjs_updates')
+    op.drop_column('documents', 'ydoc_state')
@@ -0,0 +1,39 @@
+"""add document ops
+
+Revision ID: e5b81f3c9a27
+Revises: c7d2e8a41f90
+Create Date: 2026-10-17 16:12:45.204117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b81f3c9a27'
+down_revision: Union[str, Sequence[str], None] = 'c7d2e8a41f90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('document_ops',
+    sa.Column('document_id', sa.BigInteger(), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.Column('ops', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['document_id'], ['documents.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('document_id', 'version')
+    )
+    op.add_column('documents', sa.Column('content_version', sa.BigInteger(), server_default='0', nullable=False))
+    # existing rows: content is up to date with version
+    op.execute('UPDATE documents SET content_version = version')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('documents', 'content_version')
+    op.drop_table('document_ops')
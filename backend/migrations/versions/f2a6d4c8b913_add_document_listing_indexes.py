@@ -0,0 +1,44 @@
+"""add document listing indexes
+
+Revision ID: f2a6d4c8b913
+Revises: e5b81f3c9a27
+Create Date: 2026-10-17 18:40:12.518302
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2a6d4c8b913'
+down_revision: Union[str, Sequence[str], None] = 'e5b81f3c9a27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # concurrently: documents may be large and is written all the time
+    with op.get_context().autocommit_block():
+        op.create_index('idx_documents_owner_updated', 'documents',
+                        ['owner_id', sa.text('updated_at DESC'), sa.text('id DESC')],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('idx_documents_updated', 'documents',
+                        [sa.text('updated_at DESC'), sa.text('id DESC')],
+                        unique=False, postgresql_concurrently=True, if_not_exists=True)
+        # the leading column of idx_documents_owner_updated covers it
+        op.drop_index('idx_documents_owner_id', table_name='documents',
+                      postgresql_concurrently=True, if_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index('idx_documents_owner_id', 'documents', ['owner_id'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.drop_index('idx_documents_updated', table_name='documents',
+                      postgresql_concurrently=True, if_exists=True)
+        op.drop_index('idx_documents_owner_updated', table_name='documents',
+                      postgresql_concurrently=True, if_exists=True)
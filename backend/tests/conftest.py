@@ -131,3 +131,66 @@ def second_user_tokens(client):
     r = client.post("/api/login", json={"email":"u2@example.com","password":"secret"})
     j = r.get_json()
     return j["user_id"], j["access_token"], j["refresh_token"]
+
+class QueryRecorder:
+    """Statements (with their parameters) sent to the database while recording."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append((statement, parameters))
+
+    def __enter__(self):
+        from sqlalchemy import event
+        event.listen(self.engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc):
+        from sqlalchemy import event
+        event.remove(self.engine, "before_cursor_execute", self._record)
+
+    def __len__(self):
+        return len(self.statements)
+
+    def selects(self, table: str):
+        """Recorded SELECTs reading `table`."""
+        return [(s, p) for s, p in self.statements
+                if s.lstrip(" \n(").upper().startswith("SELECT") and (f"FROM {table}" in s or f"JOIN {table} " in s)]
+
+    def report(self) -> str:
+        return "\n".join(s.split("\n")[0] for s, _ in self.statements)
+
+@pytest.fixture()
+def queries(app):
+    """`with queries() as q:` records every statement run inside the block; len(q) counts them."""
+    from app.extensions import db
+
+    def recorder():
+        return QueryRecorder(db.engine)
+    with app.app_context():
+        yield recorder
+
+def _plan_nodes(node):
+    yield node
+    for child in node.get("Plans", ()):
+        yield from _plan_nodes(child)
+
+@pytest.fixture()
+def explain(app):
+    """
+    explain(statement, parameters) -> the plan's nodes, flattened.
+    Sequential scans are disabled (test tables are tiny), so a Seq Scan in
+    the plan means no index can serve the query at all.
+    """
+    from app.extensions import db
+
+    def run(statement, parameters=None):
+        with db.engine.connect() as conn:
+            conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+            plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters or {}).scalar()
+            conn.rollback()
+        return list(_plan_nodes(plan[0]["Plan"]))
+    with app.app_context():
+        yield run
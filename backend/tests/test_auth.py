@@ -1,3 +1,5 @@
+from datetime import datetime, timedelta, timezone
+
 def test_register_and_login_flow(client):
     # fresh user
     r = client.post("/api/register", json={"username":"alice","email":"alice@example.com","password":"pw"})
@@ -47,3 +49,112 @@ def test_logout_revokes_access_token(client):
     r = client.get("/api/me", headers=_auth_headers(access))
     assert r.status_code == 401
     assert "revoked" in r.get_json().get("message", "").lower()
+
+
+def test_socket_handshake_uses_cached_claims_and_revocations(app, client):
+    from app.extensions import socketio
+    from app.tokens import token_verifier
+
+    _, access, refresh = _register_and_login(client, "dave", "dave@example.com")
+
+    def connects(token):
+        s = socketio.test_client(app, flask_test_client=client, query_string=f"token={token}")
+        ok = s.is_connected()
+        if ok:
+            s.disconnect()
+        return ok
+
+    assert connects(access) and connects(access)
+    assert token_verifier.cached >= 1
+    assert not connects(refresh)  # wrong token type
+
+    r = client.post("/api/logout", headers=_auth_headers(access))
+    assert r.status_code == 200
+    assert not connects(access)  # same process: at once, cached claims or not
+
+
+def test_revocations_by_other_workers_arrive_on_refresh(app, client, monkeypatch):
+    import jwt as pyjwt
+    from app.extensions import db
+    from app.models import TokenBlocklist
+    from app.tokens import token_verifier
+
+    uid, access, _ = _register_and_login(client, "erin", "erin@example.com")
+    assert client.get("/api/me", headers=_auth_headers(access)).status_code == 200
+
+    # another worker logs the token out; this one hasn't heard about it yet
+    with app.app_context():
+        claims = pyjwt.decode(access, options={"verify_signature": False})
+        expires_at = datetime.fromtimestamp(claims["exp"], timezone.utc)
+        db.session.add(TokenBlocklist(jti=claims["jti"], token_type="access", expires_at=expires_at, user_id=uid))
+        db.session.commit()
+    monkeypatch.setattr(token_verifier, "refresh_interval", 3600)
+    assert client.get("/api/me", headers=_auth_headers(access)).status_code == 200
+
+    monkeypatch.setattr(token_verifier, "refresh_interval", 0)
+    r = client.get("/api/me", headers=_auth_headers(access))
+    assert r.status_code == 401
+    assert "revoked" in r.get_json().get("message", "").lower()
+
+
+def test_expired_blocklist_rows_are_purged(app, client, monkeypatch):
+    from app.extensions import db
+    from app.models import TokenBlocklist
+    from app.tokens import token_verifier
+
+    uid, access, _ = _register_and_login(client, "frank", "frank@example.com")
+    assert client.post("/api/logout", headers=_auth_headers(access)).status_code == 200
+    now = datetime.now(timezone.utc)
+    with app.app_context():
+        row = db.session.query(TokenBlocklist).filter_by(user_id=uid).one()
+        assert now < row.expires_at <= now + app.config["JWT_ACCESS_TOKEN_EXPIRES"]
+
+        for i in range(5):
+            db.session.add(TokenBlocklist(jti=f"expired-{i}", token_type="refresh",
+                                          expires_at=now - timedelta(minutes=i + 1), user_id=uid))
+        db.session.commit()
+        monkeypatch.setattr(token_verifier, "purge_batch", 2)
+        assert token_verifier.purge() >= 5
+        assert [r.jti for r in db.session.query(TokenBlocklist).filter_by(user_id=uid)] == [row.jti]
+
+    # the purge doesn't bring a revoked, unexpired token back
+    monkeypatch.setattr(token_verifier, "refresh_interval", 0)
+    assert client.get("/api/me", headers=_auth_headers(access)).status_code == 401
+
+
+def test_login_rehashes_with_new_argon2_parameters(app, client, monkeypatch):
+    from argon2 import PasswordHasher
+    from app.extensions import db
+    from app.models import User
+    from app.passwords import password_pool
+
+    uid, _, _ = _register_and_login(client, "grace", "grace@example.com")
+    with app.app_context():
+        before = db.session.get(User, uid).password_hash
+
+    monkeypatch.setattr(password_pool, "hasher", PasswordHasher(time_cost=1, memory_cost=8192, parallelism=1))
+    _register_and_login(client, "grace", "grace@example.com")
+    with app.app_context():
+        after = db.session.get(User, uid).password_hash
+    assert after != before and "m=8192,t=1,p=1" in after
+
+    # upgraded once; the new hash verifies
+    _register_and_login(client, "grace", "grace@example.com")
+    with app.app_context():
+        assert db.session.get(User, uid).password_hash == after
+    r = client.post("/api/login", json={"email": "grace@example.com", "password": "wrong"})
+    assert r.status_code == 401
+
+
+def test_logins_are_shed_when_the_hash_queue_is_full(client, monkeypatch):
+    from app.passwords import password_pool
+
+    _register_and_login(client, "heidi", "heidi@example.com")
+    monkeypatch.setattr(password_pool, "max_queue", 0)
+    monkeypatch.setattr(password_pool, "_running", password_pool.threads)  # every slot taken
+    r = client.post("/api/login", json={"email": "heidi@example.com", "password": "pw"})
+    assert r.status_code == 503
+    assert "Retry-After" in r.headers  # flask-limiter may push it out to its own window
+
+    monkeypatch.setattr(password_pool, "_running", 0)
+    assert client.post("/api/login", json={"email": "heidi@example.com", "password": "pw"}).status_code == 200
@@ -0,0 +1,26 @@
+from app.cache import LRUCache
+
+
+def test_lru_evicts_by_bytes_in_recency_order():
+    c = LRUCache(max_bytes=100)
+    c.put("a", 1, size=40)
+    c.put("b", 2, size=40)
+    assert c.get("a") == 1  # a is now most recent
+    c.put("c", 3, size=40)
+    assert c.get("b") is None
+    assert c.get("a") == 1 and c.get("c") == 3
+    s = c.stats()
+    assert s["evictions"] == 1
+    assert s["bytes"] == 80
+    assert s["hits"] == 3 and s["misses"] == 1
+
+
+def test_lru_resize_and_oversized_entries():
+    c = LRUCache(max_bytes=100)
+    c.put("a", {"x": 1}, size=10)
+    c.put("big", "x" * 500, size=500)
+    assert c.peek("big") is None
+    c.resize("a", 90)
+    assert c.stats()["bytes"] == 90
+    assert c.pop("a") == {"x": 1}
+    assert c.stats()["bytes"] == 0
@@ -0,0 +1,171 @@
+import pytest
+
+from app.extensions import db, socketio
+from app.models import Document, DocumentYjsUpdate
+from app.realtime.buffer import write_buffer
+from app.realtime.crdt import crdt_sync
+
+from test_realtime import _register_and_login, _create_doc, _events, _items
+
+pycrdt = pytest.importorskip("pycrdt")
+
+
+class YClient:
+    """A Yjs peer over the socket test client, the way y-quill + a provider would talk."""
+
+    def __init__(self, app, client, token, doc_id, ydoc=None):
+        self.doc_id = doc_id
+        self.ydoc = ydoc or pycrdt.Doc()
+        self.text = self.ydoc.get("quill", type=pycrdt.Text)
+        self.sio = socketio.test_client(app, flask_test_client=client, query_string=f"token={token}")
+        self.sio.emit("join_document", {"document_id": doc_id, "protocol": "yjs"})
+        self.send(pycrdt.create_sync_message(self.ydoc))
+
+    def send(self, message: bytes) -> None:
+        self.sio.emit("yjs", {"document_id": self.doc_id, "message": message})
+
+    def edit(self, fn) -> None:
+        updates = []
+        sub = self.ydoc.observe(lambda e: updates.append(e.update))
+        fn(self.text)
+        self.ydoc.unobserve(sub)
+        for update in updates:
+            self.send(pycrdt.create_update_message(update))
+
+    def pump(self, received=None) -> list:
+        """Apply everything the server sent; returns the raw messages."""
+        messages = [e["message"] for e in _events(self.sio, "yjs", received)]
+        for message in messages:
+            reply = pycrdt.handle_sync_message(message[1:], self.ydoc)
+            if reply is not None:
+                self.send(reply)
+        return messages
+
+
+def test_yjs_and_ot_clients_edit_together(app, client):
+    _, tok = _register_and_login(client, "y_mixed", "y_mixed@example.com")
+    doc_id = _create_doc(client, tok, {"ops": [{"insert": "abc\n"}]})
+
+    ot = socketio.test_client(app, flask_test_client=client, query_string=f"token={tok}")
+    ot.emit("join_document", {"document_id": doc_id})
+    ot.get_received()
+    y = YClient(app, client, tok, doc_id)
+    y.pump()
+    assert str(y.text) == "abc\n"
+
+    # Yjs -> OT: offsets come out in UTF-16 units, and nobody is acked
+    y.edit(lambda t: t.insert(1, "X", {"bold": True}))
+    assert _items(ot) == [{"version": 1, "delta": {"ops": [
+        {"retain": 1}, {"insert": "X", "attributes": {"bold": True}}]}}]
+
+    # OT -> Yjs, with non-BMP text so UTF-16 and UTF-8 offsets differ
+    ot.emit("document_change", {"document_id": doc_id, "version": 1,
+                                "delta": {"ops": [{"insert": "😀é"}, {"retain": 2}, {"insert": "Z"}]}})
+    assert _items(ot) == [{"version": 2, "ack": True}]
+    y.pump()
+    assert y.text.diff() == [("😀éa", None), ("X", {"bold": True}), ("Zbc\n", None)]
+
+    with app.app_context():
+        write_buffer.flush()
+    r = client.get(f"/api/documents/{doc_id}", headers={"Authorization": f"Bearer {tok}"})
+    assert r.get_json()["content"] == {"ops": [
+        {"insert": "😀éa"}, {"insert": "X", "attributes": {"bold": True}}, {"insert": "Zbc\n"}]}
+
+    for s in (ot, y.sio):
+        s.disconnect()
+
+
+def test_reconnecting_client_only_gets_missing_updates(app, client):
+    _, tok = _register_and_login(client, "y_resync", "y_resync@example.com")
+    doc_id = _create_doc(client, tok, {"ops": [{"insert": "lorem ipsum " * 100 + "\n"}]})
+
+    y = YClient(app, client, tok, doc_id)
+    y.pump()
+    y.sio.disconnect()
+
+    ot = socketio.test_client(app, flask_test_client=client, query_string=f"token={tok}")
+    ot.emit("join_document", {"document_id": doc_id})
+    version = _events(ot, "load_document_content")[0]["version"]
+    ot.emit("document_change", {"document_id": doc_id, "version": version,
+                                "delta": {"ops": [{"insert": "new "}]}})
+
+    again = YClient(app, client, tok, doc_id, ydoc=y.ydoc)
+    messages = again.pump()
+    step2 = next(m for m in messages if m[1] == pycrdt.YSyncMessageType.SYNC_STEP2)
+    assert len(step2) < 100
+    assert str(again.text).startswith("new lorem ipsum")
+
+    for s in (ot, again.sio):
+        s.disconnect()
+
+
+def test_updates_are_appended_then_compacted(app, client, monkeypatch):
+    _, tok = _register_and_login(client, "y_store", "y_store@example.com")
+    doc_id = _create_doc(client, tok, {"ops": [{"insert": "\n"}]})
+    monkeypatch.setattr(crdt_sync, "compact_after", 2)
+
+    def stored():
+        with app.app_context():
+            rows = db.session.query(DocumentYjsUpdate).filter_by(document_id=doc_id).count()
+            return db.session.get(Document, doc_id).ydoc_state is not None, rows
+
+    y = YClient(app, client, tok, doc_id)
+    y.pump()
+    with app.app_context():
+        write_buffer.flush()
+    assert stored() == (True, 0)  # seeded from the content
+
+    for expected_rows in (1, 2, 0):
+        y.edit(lambda t: t.insert(0, "a"))
+        with app.app_context():
+            write_buffer.flush()
+        assert stored() == (True, expected_rows)
+    y.edit(lambda t: t.insert(0, "b"))
+    y.sio.disconnect()  # last one out: flushed and unloaded
+    assert stored() == (True, 1)
+
+    fresh = YClient(app, client, tok, doc_id)
+    fresh.pump()
+    assert str(fresh.text) == "baaa\n"
+    fresh.sio.disconnect()
+
+
+def test_update_the_content_cannot_follow_is_undone(app, client, monkeypatch):
+    from app.realtime import delta
+
+    _, tok = _register_and_login(client, "y_undo", "y_undo@example.com")
+    doc_id = _create_doc(client, tok, {"ops": [{"insert": "abc\n"}]})
+    ot = socketio.test_client(app, flask_test_client=client, query_string=f"token={tok}")
+    ot.emit("join_document", {"document_id": doc_id})
+    ot.get_received()
+    y, other = YClient(app, client, tok, doc_id), YClient(app, client, tok, doc_id)
+    y.pump(), other.pump()
+
+    # a Yjs change the Quill content can't take (as if the two had drifted apart)
+    apply = delta.apply
+
+    def refuse(content, change):
+        if any(op.get("insert") == "!" for op in change):
+            raise ValueError("does not apply")
+        return apply(content, change)
+
+    monkeypatch.setattr(delta, "apply", refuse)
+    y.edit(lambda t: t.insert(1, "!"))
+    received = y.sio.get_received()
+    assert {"message": "Invalid Yjs message"} in _events(y.sio, "error", received)
+    monkeypatch.setattr(delta, "apply", apply)
+    y.pump(received), other.pump()
+    assert str(y.text) == str(other.text) == "abc\n"
+    assert _items(ot) == []
+
+    # both sides carry on from the same text
+    y.edit(lambda t: t.insert(0, "Y"))
+    other.pump()
+    with app.app_context():
+        live = write_buffer.peek(doc_id)
+        assert live.content == [{"insert": "Yabc\n"}] and live.crdt.content() == live.content
+    assert str(other.text) == "Yabc\n"
+    assert _items(ot) == [{"version": 1, "delta": {"ops": [{"insert": "Y"}]}}]
+
+    for s in (ot, y.sio, other.sio):
+        s.disconnect()
@@ -0,0 +1,42 @@
+from app.realtime import delta
+
+
+def test_compose_applies_insert_and_delete():
+    doc = [{"insert": "hello world\n"}]
+    change = [{"retain": 5}, {"delete": 6}, {"insert": "!"}]
+    assert delta.apply(doc, change) == [{"insert": "hello!\n"}]
+
+
+def test_compose_keeps_formatting():
+    doc = [{"insert": "abc\n"}]
+    change = [{"retain": 1, "attributes": {"bold": True}}]
+    assert delta.compose(doc, change) == [
+        {"insert": "a", "attributes": {"bold": True}},
+        {"insert": "bc\n"},
+    ]
+
+
+def test_transform_converges():
+    doc = [{"insert": "abc\n"}]
+    a = [{"retain": 1}, {"insert": "X"}]
+    b = [{"retain": 1}, {"delete": 1}, {"insert": "Y"}]
+    left = delta.apply(delta.apply(doc, a), delta.transform(a, b, priority=True))
+    right = delta.apply(delta.apply(doc, b), delta.transform(b, a, priority=False))
+    assert left == right == [{"insert": "aXYc\n"}]
+
+
+def test_lengths_count_utf16_units():
+    doc = [{"insert": "a\U0001F600b\n"}]
+    assert delta.document_length(doc) == 5
+    assert delta.apply(doc, [{"retain": 3}, {"delete": 1}]) == [{"insert": "a\U0001F600\n"}]
+
+
+def test_apply_rejects_overrun_and_bad_ops():
+    import pytest
+
+    with pytest.raises(ValueError):
+        delta.apply([{"insert": "ab"}], [{"retain": 5}, {"delete": 1}])
+    with pytest.raises(ValueError):
+        delta.validate_ops([{"retain": 0}])
+    with pytest.raises(ValueError):
+        delta.validate_ops([{"insert": "a", "delete": 1}])
@@ -69,4 +69,212 @@ def test_permission_enforced(client, auth_tokens, second_user_tokens, db_session
     # But cannot update as viewer
     r = client.put(f"/api/documents/{doc_id}", json={"title":"hack"},
                    headers=_auth_headers(other_token))
-    assert r.status_code == 403
\ No newline at end of file
+    assert r.status_code == 403
+
+
+def _fresh_user(client, name):
+    client.post("/api/register", json={"username": name, "email": f"{name}@example.com", "password": "secret"})
+    j = client.post("/api/login", json={"email": f"{name}@example.com", "password": "secret"}).get_json()
+    return j["user_id"], j["access_token"]
+
+
+def test_listing_pages_by_updated_at_and_id(client, db_session):
+    owner_id, owner_token = _fresh_user(client, "pager")
+    other_id, other_token = _fresh_user(client, "pager_reader")
+
+    ids = []
+    for i in range(5):
+        r = client.post("/api/documents", json={"title": f"P{i}", "content": {}}, headers=_auth_headers(owner_token))
+        ids.append(r.get_json()["id"])
+        db_session.add(DocumentCollaborator(document_id=ids[-1], user_id=other_id, permission_level="viewer"))
+    # ties on updated_at are broken by id
+    db_session.query(Document).filter(Document.id.in_(ids)).update(
+        {Document.updated_at: db_session.query(Document.updated_at).filter_by(id=ids[0]).scalar_subquery()},
+        synchronize_session=False,
+    )
+    db_session.commit()
+    newest_first = sorted(ids, reverse=True)
+
+    seen, cursor = [], None
+    while True:
+        r = client.get("/api/documents", query_string={"limit": 2, **({"cursor": cursor} if cursor else {})},
+                       headers=_auth_headers(owner_token))
+        assert r.status_code == 200
+        seen += [d["id"] for d in r.get_json()]
+        cursor = r.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert seen == newest_first
+
+    r = client.get("/api/documents/overview", query_string={"limit": 3}, headers=_auth_headers(owner_token))
+    body = r.get_json()
+    assert [d["id"] for d in body["mine"]] == newest_first[:3]
+    assert all(d["shared_count"] == 1 for d in body["mine"])
+    r = client.get("/api/documents/overview",
+                   query_string={"limit": 3, "section": "mine", "mine_cursor": body["next_cursor"]["mine"]},
+                   headers=_auth_headers(owner_token))
+    body = r.get_json()
+    assert [d["id"] for d in body["mine"]] == newest_first[3:]
+    assert body["next_cursor"] == {"mine": None} and "shared_with_me" not in body
+
+    r = client.get("/api/documents/overview", query_string={"limit": 4}, headers=_auth_headers(other_token))
+    body = r.get_json()
+    assert [d["id"] for d in body["shared_with_me"]] == newest_first[:4]
+    assert body["shared_with_me"][0]["owner"]["id"] == owner_id
+    assert body["next_cursor"]["shared_with_me"] and body["mine"] == []
+
+    r = client.get("/api/documents", query_string={"cursor": "not-a-cursor"}, headers=_auth_headers(owner_token))
+    assert r.status_code == 400
+
+def test_conditional_requests(client, db_session, queries):
+    from app.realtime.snapshots import snapshot_cache
+    owner_id, owner_token = _fresh_user(client, "etag_owner")
+    other_id, other_token = _fresh_user(client, "etag_reader")
+    auth = _auth_headers(owner_token)
+    doc_id = client.post("/api/documents", json={"title": "E", "content": {}}, headers=auth).get_json()["id"]
+
+    urls = [f"/api/documents/{doc_id}", f"/api/documents/{doc_id}/collaborators", "/api/documents/overview"]
+    tags = {}
+    for url in urls:
+        r = client.get(url, headers=auth)
+        assert r.status_code == 200 and r.headers["Cache-Control"] == "private, no-cache"
+        tags[url] = r.headers["ETag"]
+        assert tags[url].startswith('W/"')
+
+    # revalidation answers from the permission and snapshot caches or one light query
+    snapshot_cache.invalidate(doc_id)
+    for url in urls:
+        with queries() as q:
+            r = client.get(url, headers={**auth, "If-None-Match": tags[url]})
+        assert r.status_code == 304 and r.headers["ETag"] == tags[url]
+        assert len(q) <= 1, q.report()
+        assert not any("content" in s for s, _ in q.statements)
+
+    # sharing changes every tag, without touching updated_at
+    r = client.post(f"/api/documents/{doc_id}/collaborators", json={"user_id": other_id, "permission_level": "viewer"},
+                    headers=auth)
+    assert r.status_code == 200
+    for url in urls:
+        r = client.get(url, headers={**auth, "If-None-Match": tags[url]})
+        assert r.status_code == 200 and r.headers["ETag"] != tags[url]
+        tags[url] = r.headers["ETag"]
+
+    # so does the owner's new name, shown in the document body
+    assert client.patch("/api/me", json={"username": "etag_owner_2"}, headers=auth).status_code == 200
+    r = client.get(urls[0], headers={**auth, "If-None-Match": tags[urls[0]]})
+    assert r.status_code == 200 and r.get_json()["owner"]["username"] == "etag_owner_2"
+    tags[urls[0]] = r.headers["ETag"]
+
+    # If-Match on PUT: stale tags are refused, the current one goes through
+    r = client.put(urls[0], json={"title": "E2"}, headers={**auth, "If-Match": tags[urls[0]]})
+    assert r.status_code == 200
+    fresh = r.headers["ETag"]
+    r = client.put(urls[0], json={"title": "E3"}, headers={**auth, "If-Match": tags[urls[0]]})
+    assert r.status_code == 412
+    assert client.get(urls[0], headers=auth).get_json()["title"] == "E2"
+    r = client.get(urls[0], headers={**auth, "If-None-Match": fresh})
+    assert r.status_code == 304
+    assert client.put(urls[0], json={"title": "E3"}, headers={**auth, "If-Match": "*"}).status_code == 200
+
+    # the viewer sees a different tag: it includes their role
+    owner_tag = client.get(urls[0], headers=auth).headers["ETag"]
+    r = client.get(urls[0], headers={**_auth_headers(other_token), "If-None-Match": owner_tag})
+    assert r.status_code == 200 and r.headers["ETag"] != owner_tag
+
+def test_overview_cache_invalidation(client, db_session, queries):
+    from app.overviews import overview_cache
+    owner_id, owner_token = _fresh_user(client, "ov_owner")
+    reader_id, reader_token = _fresh_user(client, "ov_reader")
+    bystander_id, bystander_token = _fresh_user(client, "ov_bystander")
+    owner, reader, bystander = (_auth_headers(t) for t in (owner_token, reader_token, bystander_token))
+
+    def overview(headers):
+        return client.get("/api/documents/overview", headers=headers).get_json()
+
+    doc_id = client.post("/api/documents", json={"title": "O", "content": {}}, headers=owner).get_json()["id"]
+    assert [d["id"] for d in overview(owner)["mine"]] == [doc_id]
+    assert overview(reader)["shared_with_me"] == []
+    overview(bystander)
+
+    hits = overview_cache.hits
+    with queries() as q:
+        body = overview(owner)
+    assert len(q) == 0 and overview_cache.hits == hits + 1
+    assert body["mine"][0]["shared_count"] == 0
+
+    # sharing invalidates the owner (share count) and the new reader only
+    client.post(f"/api/documents/{doc_id}/collaborators", json={"user_id": reader_id, "permission_level": "viewer"},
+                headers=owner)
+    assert overview(owner)["mine"][0]["shared_count"] == 1
+    assert overview(reader)["shared_with_me"][0]["permission_level"] == "viewer"
+    assert overview_cache.get(bystander_id, "|50||") is not None
+
+    client.patch(f"/api/documents/{doc_id}/collaborators/{reader_id}", json={"permission_level": "editor"},
+                 headers=owner)
+    assert overview_cache.get(owner_id, "|50||") is not None
+    assert overview(reader)["shared_with_me"][0]["permission_level"] == "editor"
+
+    # document writes invalidate every collaborator
+    client.put(f"/api/documents/{doc_id}", json={"title": "O2"}, headers=owner)
+    assert overview(owner)["mine"][0]["title"] == "O2"
+    assert overview(reader)["shared_with_me"][0]["title"] == "O2"
+
+    client.delete(f"/api/documents/{doc_id}/collaborators/{reader_id}", headers=owner)
+    assert overview(reader)["shared_with_me"] == []
+    assert overview(owner)["mine"][0]["shared_count"] == 0
+
+    client.delete(f"/api/documents/{doc_id}", headers=owner)
+    assert overview(owner)["mine"] == []
+    assert overview_cache.stats()["hit_rate"] > 0
+
+def test_search_ranks_filters_and_highlights(client, db_session):
+    owner_id, owner_token = _fresh_user(client, "search_owner")
+    other_id, other_token = _fresh_user(client, "search_other")
+    auth = _auth_headers(owner_token)
+
+    def create(title, text, headers=auth):
+        r = client.post("/api/documents", json={"title": title, "content": {"ops": [{"insert": text}]}}, headers=headers)
+        return r.get_json()["id"]
+
+    in_title = create("Quarterly zebra report", "numbers and more numbers\n")
+    in_body = create("Notes", "the <b>zebra</b> crossing & bridge are closed\n")
+    twice = create("Misc", "zebra zebra, and a giraffe\n")
+    create("Secret", "zebra\n", headers=_auth_headers(other_token))
+    create("Unrelated", "nothing to see\n")
+
+    r = client.get("/api/documents/search", query_string={"q": "zebra"}, headers=auth)
+    assert r.status_code == 200
+    hits = r.get_json()
+    assert [h["id"] for h in hits][0] == in_title  # title weighs more than body
+    assert {h["id"] for h in hits} == {in_title, in_body, twice}
+    body_hit = next(h for h in hits if h["id"] == in_body)
+    assert "<mark>zebra</mark>" in body_hit["headline"] and "&amp;" in body_hit["headline"]
+    assert "<" not in body_hit["headline"].replace("<mark>", "").replace("</mark>", "")
+    assert body_hit["permission_level"] == "owner"
+
+    # keyset pages cover the same hits in the same order
+    seen, cursor = [], None
+    for _ in range(len(hits)):
+        r = client.get("/api/documents/search", query_string={"q": "zebra", "limit": 1, **({"cursor": cursor} if cursor else {})},
+                       headers=auth)
+        seen += [h["id"] for h in r.get_json()]
+        cursor = r.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert seen == [h["id"] for h in hits]
+
+    # web search syntax, and the text follows content writes
+    r = client.get("/api/documents/search", query_string={"q": "zebra -giraffe"}, headers=auth)
+    assert twice not in [h["id"] for h in r.get_json()]
+    client.put(f"/api/documents/{in_body}", json={"content": {"ops": [{"insert": "an okapi now\n"}]}}, headers=auth)
+    r = client.get("/api/documents/search", query_string={"q": "okapi"}, headers=auth)
+    assert [h["id"] for h in r.get_json()] == [in_body]
+
+    # shared documents are searchable by their collaborators
+    client.post(f"/api/documents/{twice}/collaborators", json={"user_id": other_id, "permission_level": "viewer"},
+                headers=auth)
+    r = client.get("/api/documents/search", query_string={"q": "giraffe"}, headers=_auth_headers(other_token))
+    assert [(h["id"], h["permission_level"]) for h in r.get_json()] == [(twice, "viewer")]
+
+    assert client.get("/api/documents/search", headers=auth).status_code == 400
+    assert client.get("/api/documents/search", query_string={"q": "x", "cursor": "bad"}, headers=auth).status_code == 400
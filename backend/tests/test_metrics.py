@@ -0,0 +1,31 @@
+from app.extensions import socketio
+
+from test_realtime import _register_and_login, _create_doc, _items
+
+
+def _value(text, prefix):
+    return float(next(line for line in text.splitlines() if line.startswith(prefix)).rsplit(" ", 1)[1])
+
+
+def test_metrics_cover_socket_events_permissions_and_commits(app, client):
+    _, tok = _register_and_login(client, "m_user", "m_user@example.com")
+    doc_id = _create_doc(client, tok, {"ops": [{"insert": "\n"}]})
+
+    s = socketio.test_client(app, flask_test_client=client, query_string=f"token={tok}")
+    s.emit("join_document", {"document_id": doc_id})
+    s.emit("document_change", {"document_id": doc_id, "version": 0, "delta": {"ops": [{"insert": "a"}]}})
+    assert _items(s) == [{"version": 1, "ack": True}]
+
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    text = r.get_data(as_text=True)
+    assert "# TYPE collab_socket_event_seconds histogram" in text
+    assert _value(text, 'collab_socket_event_seconds_count{worker="') >= 1
+    assert 'event="document_change"} ' in text and 'event="join_document"} ' in text
+    assert _value(text, "collab_permission_check_seconds_count{") >= 2
+    assert _value(text, "collab_db_commit_seconds_count{") >= 1
+    assert 'collab_socket_room_sockets_bucket{worker="' in text
+    assert _value(text, "collab_socket_connections{") >= 1
+    assert _value(text, "collab_socket_limiter_allowed{") >= 2
+    s.disconnect()
@@ -0,0 +1,162 @@
+from app.extensions import db, socketio
+from app.models import Document, DocumentOp
+from app.realtime.buffer import write_buffer
+from app.realtime.oplog import op_log
+from app.realtime.snapshots import snapshot_cache
+
+from test_realtime import _register_and_login, _create_doc, _events, _items
+
+
+def _row(app, doc_id):
+    with app.app_context():
+        d = db.session.get(Document, doc_id)
+        ops = [v for (v,) in db.session.query(DocumentOp.version).filter_by(document_id=doc_id)
+               .order_by(DocumentOp.version)]
+        return d.content, d.content_version, d.version, ops
+
+
+def _type(s, doc_id, text):
+    version = _events(s, "load_document_content")[0]["version"]
+    for i, ch in enumerate(text):
+        s.emit("document_change", {"document_id": doc_id, "version": version + i,
+                                   "delta": {"ops": [{"retain": i}, {"insert": ch}] if i else [{"insert": ch}]}})
+
+
+def test_flush_appends_ops_and_snapshots_periodically(app, client, monkeypatch):
+    _, tok = _register_and_login(client, "ol_append", "ol_append@example.com")
+    doc_id = _create_doc(client, tok, {"ops": [{"insert": "\n"}]})
+    monkeypatch.setattr(op_log, "snapshot_ops", 4)
+
+    s = socketio.test_client(app, flask_test_client=client, query_string=f"token={tok}")
+    s.emit("join_document", {"document_id": doc_id})
+    _type(s, doc_id, "abc")
+    with app.app_context():
+        write_buffer.flush()
+    # only the ops and the version were written
+    assert _row(app, doc_id) == ({"ops": [{"insert": "\n"}]}, 0, 3, [1, 2, 3])
+
+    s.emit("document_change", {"document_id": doc_id, "version": 3, "delta": {"ops": [{"insert": "d"}]}})
+    with app.app_context():
+        write_buffer.flush()
+    assert _row(app, doc_id) == ({"ops": [{"insert": "dabc\n"}]}, 4, 4, [1, 2, 3, 4])
+
+    s.emit("document_change", {"document_id": doc_id, "version": 4, "delta": {"ops": [{"insert": "e"}]}})
+    s.disconnect()  # room empties: snapshot regardless of the tail length
+    assert _row(app, doc_id)[:3] == ({"ops": [{"insert": "edabc\n"}]}, 5, 5)
+
+
+def test_unfolded_tail_is_replayed_then_compacted(app, client, monkeypatch):
+    _, tok = _register_and_login(client, "ol_crash", "ol_crash@example.com")
+    doc_id = _create_doc(client, tok, {"ops": [{"insert": "\n"}]})
+
+    s = socketio.test_client(app, flask_test_client=client, query_string=f"token={tok}")
+    s.emit("join_document", {"document_id": doc_id})
+    _type(s, doc_id, "xyz")
+    with app.app_context():
+        write_buffer.flush()
+        # the worker dies: its memory is gone, only the op log has the edits
+        write_buffer.discard(doc_id)
+        snapshot_cache.invalidate(doc_id)
+    s.disconnect()
+    assert _row(app, doc_id)[:3] == ({"ops": [{"insert": "\n"}]}, 0, 3)
+
+    r = client.get(f"/api/documents/{doc_id}", headers={"Authorization": f"Bearer {tok}"})
+    assert r.get_json()["content"] == {"ops": [{"insert": "xyz\n"}]}
+
+    monkeypatch.setattr(op_log, "interval", 0)
+    monkeypatch.setattr(op_log, "retain_ops", 1)
+    with app.app_context():
+        assert op_log.compact() >= 1
+    assert _row(app, doc_id) == ({"ops": [{"insert": "xyz\n"}]}, 3, 3, [3])
+
+
+def test_broken_tail_is_cut_and_versions_carry_on(app, client):
+    _, tok = _register_and_login(client, "ol_gap", "ol_gap@example.com")
+    doc_id = _create_doc(client, tok, {"ops": [{"insert": "\n"}]})
+
+    s = socketio.test_client(app, flask_test_client=client, query_string=f"token={tok}")
+    s.emit("join_document", {"document_id": doc_id})
+    _type(s, doc_id, "abc")
+    with app.app_context():
+        write_buffer.flush()
+        write_buffer.discard(doc_id)
+        snapshot_cache.invalidate(doc_id)
+        # version 2 goes missing
+        db.session.query(DocumentOp).filter_by(document_id=doc_id, version=2).delete()
+        db.session.commit()
+    s.disconnect()
+    assert _row(app, doc_id) == ({"ops": [{"insert": "\n"}]}, 0, 3, [1, 3])
+
+    repairs = op_log.repairs
+    s = socketio.test_client(app, flask_test_client=client, query_string=f"token={tok}")
+    s.emit("join_document", {"document_id": doc_id})
+    loaded = _events(s, "load_document_content")[0]
+    # what replayed, at the row's version; op 3 no longer leads there
+    assert (loaded["content"], loaded["version"]) == ({"ops": [{"insert": "a\n"}]}, 3)
+    assert op_log.repairs == repairs + 1
+    assert _row(app, doc_id) == ({"ops": [{"insert": "a\n"}]}, 3, 3, [1])
+
+    s.emit("document_change", {"document_id": doc_id, "version": 3, "delta": {"ops": [{"insert": "z"}]}})
+    assert _items(s) == [{"version": 4, "ack": True}]
+    with app.app_context():
+        write_buffer.flush()
+    assert _row(app, doc_id)[2:] == (4, [1, 4])
+    s.disconnect()
+    assert _row(app, doc_id)[:3] == ({"ops": [{"insert": "za\n"}]}, 4, 4)
+
+
+def test_flushed_edits_are_searchable_before_the_fold(app, client):
+    _, tok = _register_and_login(client, "ol_search", "ol_search@example.com")
+    doc_id = _create_doc(client, tok, {"ops": [{"insert": "\n"}]})
+    s = socketio.test_client(app, flask_test_client=client, query_string=f"token={tok}")
+    s.emit("join_document", {"document_id": doc_id})
+    version = _events(s, "load_document_content")[0]["version"]
+    s.emit("document_change", {"document_id": doc_id, "version": version,
+                               "delta": {"ops": [{"insert": "zanzibar "}]}})
+
+    def found():
+        r = client.get("/api/documents/search?q=zanzibar", headers={"Authorization": f"Bearer {tok}"})
+        return [d["id"] for d in r.get_json()]
+
+    assert found() == []
+    with app.app_context():
+        write_buffer.flush()
+    # appended to the op log, not folded, and already searchable
+    assert _row(app, doc_id)[1:3] == (0, 1)
+    assert found() == [doc_id]
+    s.disconnect()
+
+
+def test_release_waits_for_a_periodic_flush_in_progress(app, client, monkeypatch, caplog):
+    import threading
+    from app.realtime import buffer
+
+    _, tok = _register_and_login(client, "ol_race", "ol_race@example.com")
+    doc_id = _create_doc(client, tok, {"ops": [{"insert": "\n"}]})
+    s = socketio.test_client(app, flask_test_client=client, query_string=f"token={tok}")
+    s.emit("join_document", {"document_id": doc_id})
+    _type(s, doc_id, "ab")
+
+    # the room empties while the periodic flush is writing the same ops
+    released = []
+    plain_text = buffer.plain_text
+
+    def release_meanwhile(content):
+        if not released:
+            def release():
+                with app.app_context():
+                    write_buffer.release(doc_id)
+            released.append(threading.Thread(target=release))
+            released[0].start()
+            released[0].join(0.2)
+            assert released[0].is_alive()  # waiting for this flush
+        return plain_text(content)
+
+    monkeypatch.setattr(buffer, "plain_text", release_meanwhile)
+    with app.app_context():
+        assert write_buffer.flush() == 1
+    released[0].join(5)
+    assert "flush failed" not in caplog.text
+    assert _row(app, doc_id) == ({"ops": [{"insert": "ab\n"}]}, 2, 2, [1, 2])
+    assert write_buffer.peek(doc_id) is None
+    s.disconnect()
@@ -0,0 +1,105 @@
+"""
+Statements per request and the plans of the hot queries. A budget failing
+means an endpoint started issuing more queries (often an N+1); an index
+assertion failing means a query can no longer be served by its index.
+"""
+import pytest
+
+from app.models import DocumentCollaborator
+
+from test_document import _fresh_user
+
+def _auth_headers(token: str):
+    return {"Authorization": f"Bearer {token}"}
+
+@pytest.fixture()
+def shared_docs(client, db_session):
+    """Three documents of one owner, each shared with a reader; returns (owner, reader, doc ids)."""
+    owner = _fresh_user(client, "budget_owner")
+    reader = _fresh_user(client, "budget_reader")
+    ids = []
+    for i in range(3):
+        r = client.post("/api/documents", json={"title": f"B{i}", "content": {}}, headers=_auth_headers(owner[1]))
+        ids.append(r.get_json()["id"])
+        db_session.add(DocumentCollaborator(document_id=ids[-1], user_id=reader[0], permission_level="viewer"))
+    db_session.commit()
+    return owner, reader, ids
+
+# cold caches: every permission, snapshot and owner lookup hits the database
+BUDGETS = [
+    ("get", "/api/documents/{doc}", None, 4),
+    ("get", "/api/documents", None, 1),
+    ("get", "/api/documents/overview", None, 4),
+    ("get", "/api/documents/{doc}/collaborators", None, 2),
+    ("put", "/api/documents/{doc}", {"title": "renamed"}, 4),
+    ("post", "/api/documents", {"title": "new", "content": {}}, 3),
+]
+
+@pytest.mark.parametrize("method,url,body,budget", BUDGETS, ids=[f"{m} {u}" for m, u, _, _ in BUDGETS])
+def test_request_query_budget(client, shared_docs, queries, method, url, body, budget):
+    from app.permissions import permission_cache
+    from app.realtime.snapshots import snapshot_cache
+    (_, token), _, ids = shared_docs
+    for doc_id in ids:
+        permission_cache._drop(doc_id, None)
+        snapshot_cache.invalidate(doc_id)
+
+    with queries() as q:
+        r = getattr(client, method)(url.format(doc=ids[0]), json=body, headers=_auth_headers(token))
+    assert r.status_code < 300
+    assert len(q) <= budget, q.report()
+
+def test_sharing_query_budgets(client, shared_docs, queries):
+    (_, token), _, ids = shared_docs
+    other_id, _ = _fresh_user(client, "budget_other")
+    auth = _auth_headers(token)
+    steps = [
+        (client.post, f"/api/documents/{ids[0]}/collaborators", {"user_id": other_id, "permission_level": "viewer"}, 5),
+        (client.patch, f"/api/documents/{ids[0]}/collaborators/{other_id}", {"permission_level": "editor"}, 4),
+        (client.delete, f"/api/documents/{ids[0]}/collaborators/{other_id}", None, 4),
+    ]
+    for send, url, body, budget in steps:
+        with queries() as q:
+            r = send(url, json=body, headers=auth)
+        assert r.status_code < 300
+        assert len(q) <= budget, q.report()
+        # none of them needs the document's content
+        assert not any("documents.content" in s for s, _ in q.statements), q.report()
+
+def _scans(nodes, table):
+    return [n for n in nodes if n.get("Relation Name") == table]
+
+def test_hot_queries_use_indexes(client, shared_docs, queries, explain):
+    (owner_id, owner_token), (_, reader_token), ids = shared_docs
+    with queries() as q:
+        r = client.get("/api/documents", query_string={"limit": 1}, headers=_auth_headers(owner_token))
+        client.get("/api/documents", query_string={"limit": 1, "cursor": r.headers["X-Next-Cursor"]},
+                   headers=_auth_headers(owner_token))
+        client.get("/api/documents/overview", headers=_auth_headers(reader_token))
+        client.get(f"/api/documents/{ids[0]}/collaborators", headers=_auth_headers(reader_token))
+
+    hot = dict(q.selects("documents") + q.selects("document_collaborators"))
+    indexes = set()
+    for statement, parameters in hot.items():
+        nodes = explain(statement, parameters)
+        for table in ("documents", "document_collaborators", "users"):
+            assert not any(n["Node Type"] == "Seq Scan" for n in _scans(nodes, table)), statement
+        indexes.update(n["Index Name"] for n in nodes if "Index Name" in n)
+    assert {
+        "idx_documents_owner_updated",          # overview: my documents, newest first
+        "idx_document_collaborators_user_id",   # lists and overview: documents shared with me
+        "document_collaborators_pkey",          # permission checks, collaborator list
+    } <= indexes
+
+def test_user_search_uses_prefix_indexes(client, shared_docs, queries, explain):
+    (_, token), _, _ = shared_docs
+    with queries() as q:
+        r = client.get("/api/users/search", query_string={"q": "budget_"}, headers=_auth_headers(token))
+    assert r.get_json()[0]["username"] == "budget_reader"  # a recent collaborator
+
+    indexes = set()
+    for statement, parameters in q.selects("users"):
+        nodes = explain(statement, parameters)
+        assert not any(n["Node Type"] == "Seq Scan" for n in _scans(nodes, "users")), statement
+        indexes.update(n["Index Name"] for n in nodes if "Index Name" in n)
+    assert {"idx_users_email_prefix", "idx_users_username_prefix"} <= indexes
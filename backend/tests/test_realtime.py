@@ -0,0 +1,539 @@
+from app.extensions import socketio
+from app.realtime.batcher import room_batcher
+from app.realtime.history import OpHistory
+
+
+def _register_and_login(client, username, email, password="pw"):
+    client.post("/api/register", json={"username": username, "email": email, "password": password})
+    r = client.post("/api/login", json={"email": email, "password": password})
+    j = r.get_json()
+    return j["user_id"], j["access_token"]
+
+
+def _create_doc(client, token, content):
+    r = client.post("/api/documents", json={"title": "RT", "content": content},
+                    headers={"Authorization": f"Bearer {token}"})
+    assert r.status_code == 201
+    return r.get_json()["id"]
+
+
+def _events(sio_client, name, received=None):
+    received = sio_client.get_received() if received is None else received
+    return [e["args"][0] for e in received if e["name"] == name]
+
+
+def _items(sio_client, received=None):
+    """Flattened document_updates items; flushes the room batcher first."""
+    if received is None:
+        room_batcher.flush()
+        received = sio_client.get_received()
+    return [item for frame in _events(sio_client, "document_updates", received) for item in frame["items"]]
+
+
+def test_concurrent_changes_are_rebased(app, client):
+    owner_id, owner_tok = _register_and_login(client, "rt_owner", "rt_owner@example.com")
+    doc_id = _create_doc(client, owner_tok, {"ops": [{"insert": "abc\n"}]})
+
+    a = socketio.test_client(app, flask_test_client=client, query_string=f"token={owner_tok}")
+    b = socketio.test_client(app, flask_test_client=client, query_string=f"token={owner_tok}")
+    a.emit("join_document", {"document_id": doc_id})
+    b.emit("join_document", {"document_id": doc_id})
+    snap = _events(a, "load_document_content")[0]
+    assert snap["version"] == 0
+    b.get_received()
+
+    # both clients edit against version 0
+    a.emit("document_change", {"document_id": doc_id, "version": 0,
+                               "delta": {"ops": [{"retain": 1}, {"insert": "X"}]}})
+    b.emit("document_change", {"document_id": doc_id, "version": 0,
+                               "delta": {"ops": [{"retain": 2}, {"insert": "Y"}]}})
+
+    # each side gets its own ack in order with the other's change;
+    # b's op arrives rebased past a's insert
+    assert _items(a) == [{"version": 1, "ack": True},
+                         {"version": 2, "delta": {"ops": [{"retain": 3}, {"insert": "Y"}]}}]
+    assert _items(b) == [{"version": 1, "delta": {"ops": [{"retain": 1}, {"insert": "X"}]}},
+                         {"version": 2, "ack": True}]
+
+    c = socketio.test_client(app, flask_test_client=client, query_string=f"token={owner_tok}")
+    c.emit("join_document", {"document_id": doc_id})
+    snap = _events(c, "load_document_content")[0]
+    assert snap["version"] == 2
+    assert snap["content"] == {"ops": [{"insert": "aXbYc\n"}]}
+
+    for s in (a, b, c):
+        s.disconnect()
+
+
+def test_stale_base_version_gets_snapshot(app, client):
+    _, tok = _register_and_login(client, "rt_stale", "rt_stale@example.com")
+    doc_id = _create_doc(client, tok, {"ops": [{"insert": "abc\n"}]})
+
+    s = socketio.test_client(app, flask_test_client=client, query_string=f"token={tok}")
+    s.emit("join_document", {"document_id": doc_id})
+    s.get_received()
+    s.emit("document_change", {"document_id": doc_id, "version": 7,
+                               "delta": {"ops": [{"insert": "Z"}]}})
+    snap = _events(s, "load_document_content")
+    assert snap and snap[0]["version"] == 0
+    s.disconnect()
+
+
+def test_edits_are_buffered_until_room_empties(app, client, db_session):
+    from app.models import Document
+    from app.realtime.buffer import write_buffer
+
+    _, tok = _register_and_login(client, "rt_buf", "rt_buf@example.com")
+    doc_id = _create_doc(client, tok, {"ops": [{"insert": "\n"}]})
+
+    s = socketio.test_client(app, flask_test_client=client, query_string=f"token={tok}")
+    s.emit("join_document", {"document_id": doc_id})
+    for version, ch in enumerate("abc"):
+        ops = [{"retain": version}] if version else []
+        s.emit("document_change", {"document_id": doc_id, "version": version,
+                                   "delta": {"ops": ops + [{"insert": ch}]}})
+    edits_before = write_buffer.edits
+
+    # nothing written yet
+    db_session.expire_all()
+    assert db_session.get(Document, doc_id).version == 0
+
+    rows_before = write_buffer.rows_written
+    s.emit("leave_document", {"document_id": doc_id})
+    assert write_buffer.rows_written == rows_before + 1
+    assert write_buffer.peek(doc_id) is None
+    assert write_buffer.edits == edits_before
+
+    db_session.expire_all()
+    d = db_session.get(Document, doc_id)
+    assert d.version == 3
+    assert d.content == {"ops": [{"insert": "abc\n"}]}
+    s.disconnect()
+
+
+def test_join_reuses_cached_snapshot(app, client):
+    from app.realtime.snapshots import snapshot_cache
+
+    _, tok = _register_and_login(client, "rt_cache", "rt_cache@example.com")
+    doc_id = _create_doc(client, tok, {"ops": [{"insert": "cached\n"}]})
+
+    clients = [socketio.test_client(app, flask_test_client=client, query_string=f"token={tok}")
+               for _ in range(3)]
+    hits = snapshot_cache.stats()["hits"]
+    for s in clients:
+        s.emit("join_document", {"document_id": doc_id})
+        assert _events(s, "load_document_content")[0]["content"] == {"ops": [{"insert": "cached\n"}]}
+    assert snapshot_cache.stats()["hits"] >= hits + 2
+
+    # REST reads see realtime edits that are not flushed yet
+    clients[0].emit("document_change", {"document_id": doc_id, "version": 0,
+                                         "delta": {"ops": [{"insert": "!"}]}})
+    r = client.get(f"/api/documents/{doc_id}", headers={"Authorization": f"Bearer {tok}"})
+    assert r.get_json()["content"] == {"ops": [{"insert": "!cached\n"}]}
+    assert r.get_json()["version"] == 1
+
+    for s in clients:
+        s.disconnect()
+
+
+def test_revoked_editor_loses_write_access_immediately(app, client):
+    _, owner_tok = _register_and_login(client, "rt_rev_owner", "rt_rev_owner@example.com")
+    editor_id, editor_tok = _register_and_login(client, "rt_rev_editor", "rt_rev_editor@example.com")
+    doc_id = _create_doc(client, owner_tok, {"ops": [{"insert": "\n"}]})
+    owner_headers = {"Authorization": f"Bearer {owner_tok}"}
+    client.post(f"/api/documents/{doc_id}/collaborators",
+                json={"user_id": editor_id, "permission_level": "editor"}, headers=owner_headers)
+
+    s = socketio.test_client(app, flask_test_client=client, query_string=f"token={editor_tok}")
+    s.emit("join_document", {"document_id": doc_id})
+    s.emit("document_change", {"document_id": doc_id, "version": 0, "delta": {"ops": [{"insert": "a"}]}})
+    assert _items(s) == [{"version": 1, "ack": True}]
+
+    r = client.delete(f"/api/documents/{doc_id}/collaborators/{editor_id}", headers=owner_headers)
+    assert r.status_code == 204
+
+    s.emit("document_change", {"document_id": doc_id, "version": 1, "delta": {"ops": [{"insert": "b"}]}})
+    room_batcher.flush()
+    received = s.get_received()
+    assert not _items(s, received)
+    assert _events(s, "error", received)[0]["message"] == "Access denied"
+    s.disconnect()
+
+
+def test_changes_in_one_window_go_out_as_one_frame(app, client, monkeypatch):
+    import time
+    from app.realtime import delta
+
+    monkeypatch.setattr(room_batcher, "window", 10)
+    time.sleep(0.1)  # let a running flush loop pick up the long window
+
+    _, tok = _register_and_login(client, "rt_batch", "rt_batch@example.com")
+    doc_id = _create_doc(client, tok, {"ops": [{"insert": "abc\n"}]})
+    a, b, viewer = (
+        socketio.test_client(app, flask_test_client=client, query_string=f"token={tok}") for _ in range(3)
+    )
+    for s in (a, b, viewer):
+        s.emit("join_document", {"document_id": doc_id})
+        s.get_received()
+
+    a.emit("document_change", {"document_id": doc_id, "version": 0, "delta": {"ops": [{"insert": "1"}]}})
+    b.emit("document_change", {"document_id": doc_id, "version": 1, "delta": {"ops": [{"insert": "2"}]}})
+    a.emit("document_change", {"document_id": doc_id, "version": 2, "delta": {"ops": [{"insert": "3"}]}})
+    assert viewer.get_received() == []
+
+    sent = room_batcher.flush(doc_id)
+    assert sent == 3  # the room plus one frame per sender
+    frames = _events(viewer, "document_updates")
+    assert len(frames) == 1 and len(frames[0]["items"]) == 1
+    item = frames[0]["items"][0]
+    assert item["version"] == 3
+    assert delta.apply([{"insert": "abc\n"}], item["delta"]["ops"]) == [{"insert": "321abc\n"}]
+
+    assert _items(a) == [{"version": 1, "ack": True},
+                         {"version": 2, "delta": {"ops": [{"insert": "2"}]}},
+                         {"version": 3, "ack": True}]
+    for s in (a, b, viewer):
+        s.disconnect()
+
+
+def test_msgpack_clients_get_compact_payloads(app, client):
+    from app.realtime import codec
+
+    _, tok = _register_and_login(client, "rt_bin", "rt_bin@example.com")
+    text = "lorem ipsum " * 200
+    doc_id = _create_doc(client, tok, {"ops": [{"insert": text + "\n"}]})
+
+    binary = socketio.test_client(app, flask_test_client=client,
+                                  query_string=f"token={tok}&encoding=msgpack")
+    plain = socketio.test_client(app, flask_test_client=client, query_string=f"token={tok}")
+    binary.emit("join_document", {"document_id": doc_id})
+    plain.emit("join_document", {"document_id": doc_id})
+
+    raw = _events(binary, "load_document_content")[0]
+    assert isinstance(raw, bytes) and raw[0] == codec.FLAG_DEFLATE
+    assert len(raw) < len(text)
+    assert codec.decode(raw)["content"] == {"ops": [{"insert": text + "\n"}]}
+    plain.get_received()
+
+    plain.emit("document_change", {"document_id": doc_id, "version": 0,
+                                   "delta": {"ops": [{"insert": "Hi "}]}})
+    room_batcher.flush()
+    frame = codec.decode(_events(binary, "document_updates")[0])
+    assert frame["items"] == [{"version": 1, "delta": {"ops": [{"insert": "Hi "}]}}]
+
+    for s in (binary, plain):
+        s.disconnect()
+
+
+def test_awareness_is_coalesced_and_stays_off_the_database(app, client, monkeypatch):
+    import time
+    from sqlalchemy import event
+    from app.extensions import db
+    from app.realtime.limits import socket_limiter
+    from app.realtime.presence import presence
+
+    _, tok = _register_and_login(client, "rt_cursor", "rt_cursor@example.com")
+    doc_id = _create_doc(client, tok, {"ops": [{"insert": "hello world\n"}]})
+
+    a = socketio.test_client(app, flask_test_client=client, query_string=f"token={tok}")
+    b = socketio.test_client(app, flask_test_client=client, query_string=f"token={tok}")
+    a.emit("join_document", {"document_id": doc_id})
+    joined = _events(a, "awareness")[0]
+    b.emit("join_document", {"document_id": doc_id})
+    assert len(_events(b, "awareness")[0]["states"]) == 2
+    presence.tick()
+    a.get_received()
+
+    statements = []
+    with app.app_context():
+        engine = db.engine
+    listener = lambda *args: statements.append(args[2])  # noqa: E731
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        for i in range(50):
+            b.emit("awareness_update", {"document_id": doc_id, "cursor": {"index": i % 12, "length": 0}})
+        b.emit("awareness_update", {"document_id": doc_id, "selection": {"index": 0, "length": 5}})
+        # past the socket's burst the rest was merged; it is replayed once tokens refill
+        monkeypatch.setattr(socket_limiter, "_clock", lambda: time.monotonic() + 60)
+        socket_limiter.release()
+        presence.tick()
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert statements == []
+
+    # a background tick may have split the burst, but never one frame per move
+    frames = _events(a, "awareness")
+    assert 1 <= len(frames) <= 3
+    last = frames[-1]["states"][0]
+    assert last["client_id"] != joined["client_id"]
+    assert last["cursor"] == {"index": 49 % 12, "length": 0}
+    assert last["selection"] == {"index": 0, "length": 5}
+
+    b.disconnect()
+    presence.tick()
+    assert _events(a, "awareness")[-1]["removed"] == [last["client_id"]]
+    a.disconnect()
+
+
+def test_awareness_requires_joining_first(app, client):
+    _, tok = _register_and_login(client, "rt_nojoin", "rt_nojoin@example.com")
+    doc_id = _create_doc(client, tok, {"ops": [{"insert": "\n"}]})
+    s = socketio.test_client(app, flask_test_client=client, query_string=f"token={tok}")
+    s.emit("awareness_update", {"document_id": doc_id, "cursor": {"index": 0}})
+    assert _events(s, "error")[0]["message"] == "Not in document"
+    s.disconnect()
+
+
+def test_reconnect_gets_only_missed_changes(app, client, monkeypatch):
+    from app.realtime.oplog import op_log
+
+    _, tok = _register_and_login(client, "rt_resume", "rt_resume@example.com")
+    doc_id = _create_doc(client, tok, {"ops": [{"insert": "abc\n"}]})
+
+    def join(version=None):
+        s = socketio.test_client(app, flask_test_client=client, query_string=f"token={tok}")
+        payload = {"document_id": doc_id}
+        if version is not None:
+            payload["version"] = version
+        s.emit("join_document", payload)
+        return s
+
+    editor = join()
+    for version, ops in enumerate(([{"insert": "X"}], [{"retain": 2}, {"insert": "Y"}])):
+        editor.emit("document_change", {"document_id": doc_id, "version": version, "delta": {"ops": ops}})
+    room_batcher.flush()
+    editor.get_received()
+
+    back = join(version=0)
+    received = back.get_received()
+    assert not _events(back, "load_document_content", received)
+    assert _items(back, received) == [{"version": 1, "delta": {"ops": [{"insert": "X"}]}},
+                                      {"version": 2, "delta": {"ops": [{"retain": 2}, {"insert": "Y"}]}}]
+    current = join(version=2)
+    assert _events(current, "document_updates") == [{"document_id": doc_id, "items": []}]
+
+    # once the room is gone the changes come from the op log
+    for s in (editor, back, current):
+        s.disconnect()
+    later = join(version=1)
+    assert _items(later, later.get_received()) == [{"version": 2, "delta": {"ops": [{"retain": 2}, {"insert": "Y"}]}}]
+    later.disconnect()
+
+    # further back than the retained history: full snapshot
+    monkeypatch.setattr(op_log, "retain_ops", 1)
+    old = join(version=0)
+    assert _events(old, "load_document_content")[0]["version"] == 2
+    old.disconnect()
+
+
+def test_socket_floods_are_coalesced_or_rejected(app, client, monkeypatch):
+    import time
+    from app.realtime.limits import socket_limiter
+
+    _, tok = _register_and_login(client, "rt_flood", "rt_flood@example.com")
+    doc_id = _create_doc(client, tok, {"ops": [{"insert": "\n"}]})
+    s = socketio.test_client(app, flask_test_client=client, query_string=f"token={tok}")
+    s.emit("join_document", {"document_id": doc_id})
+    s.get_received()
+
+    now = [time.monotonic()]
+    monkeypatch.setattr(socket_limiter, "_clock", lambda: now[0])
+    for name, value in (("rate", 1), ("burst", 2), ("user_rate", 100), ("user_burst", 100)):
+        monkeypatch.setattr(socket_limiter, name, value)
+    monkeypatch.setattr(socket_limiter, "_sids", {})
+    monkeypatch.setattr(socket_limiter, "_users", {})
+    before = socket_limiter.stats()
+
+    # a client that doesn't wait for acks: every change is against version 0
+    for ch in "abcde":
+        s.emit("document_change", {"document_id": doc_id, "version": 0, "delta": {"ops": [{"insert": ch}]}})
+    # sent behind held changes: waits its turn rather than overtaking them
+    s.emit("join_document", {"document_id": doc_id})
+    received = s.get_received()
+    assert _events(s, "error", received) == []
+
+    from app.metrics import metrics
+
+    def timed():
+        histogram = metrics._histograms.get(("socket_event_seconds", (("event", "document_change"),)))
+        return histogram.count if histogram else 0
+
+    live = timed()
+    now[0] += 1
+    assert socket_limiter.release() == 1
+    assert timed() == live + 1  # replays are timed like live events
+    # a, b as sent; c-e held, composed and applied as one change
+    assert [item["version"] for item in _items(s, received) + _items(s)] == [1, 2, 3]
+    now[0] += 1
+    assert socket_limiter.release() == 1
+    assert _events(s, "load_document_content")[0]["version"] == 3
+
+    # nothing held and no token: an event without a coalescer is rejected
+    s.emit("join_document", {"document_id": doc_id})
+    assert _events(s, "error") == [{"message": "Too many requests", "event": "join_document"}]
+    after = socket_limiter.stats()
+    assert after["limited"] - before["limited"] == 3  # the third change and both joins
+    assert after["coalesced"] - before["coalesced"] == 2
+    assert after["rejected"] - before["rejected"] == 1
+    r = client.get(f"/api/documents/{doc_id}", headers={"Authorization": f"Bearer {tok}"})
+    # concurrent inserts at 0 land after the ones applied before them; "edc" is composed
+    assert r.get_json()["content"] == {"ops": [{"insert": "abedc\n"}]}
+    s.disconnect()
+
+
+def test_slow_consumers_are_disconnected(app, monkeypatch):
+    from app.realtime.limits import socket_limiter
+
+    class Queue:
+        def __init__(self, size):
+            self.size = size
+
+        def qsize(self):
+            return self.size
+
+    class Sock:
+        def __init__(self, size):
+            self.queue = Queue(size)
+
+    eio = socketio.server.eio
+    closed = []
+    monkeypatch.setattr(eio, "sockets", {"fast": Sock(3), "slow": Sock(socket_limiter.max_queued + 1)})
+    monkeypatch.setattr(eio, "disconnect", closed.append)
+    with app.app_context():
+        assert socket_limiter.check_consumers() == 1
+    assert closed == ["slow"]
+
+
+def test_connection_registry_tracks_users_and_documents(app, client, monkeypatch):
+    from app.realtime.connections import connections
+
+    uid, tok = _register_and_login(client, "rt_registry", "rt_registry@example.com")
+    doc_a = _create_doc(client, tok, {"ops": [{"insert": "\n"}]})
+    doc_b = _create_doc(client, tok, {"ops": [{"insert": "\n"}]})
+    monkeypatch.setattr(connections, "max_documents", 1)
+
+    tabs = [socketio.test_client(app, flask_test_client=client, query_string=f"token={tok}") for _ in range(2)]
+    assert len(list(connections.user_sids(uid))) == 2
+    for tab in tabs:
+        tab.emit("join_document", {"document_id": doc_a})
+    tabs[0].emit("join_document", {"document_id": doc_b})
+    assert {"message": "Too many open documents"} in _events(tabs[0], "error")
+    assert connections.count(doc_a) == 2 and connections.users(doc_a) == {uid}
+    assert connections.count(doc_b) == 0
+
+    tabs[0].emit("leave_document", {"document_id": doc_a})
+    assert connections.count(doc_a) == 1
+    tabs[1].disconnect()
+    assert connections.count(doc_a) == 0
+    assert len(list(connections.user_sids(uid))) == 1
+
+    monkeypatch.setattr(connections, "max_connections", len(connections._sids))
+    refused = socketio.test_client(app, flask_test_client=client, query_string=f"token={tok}")
+    assert not refused.is_connected()
+    tabs[0].disconnect()
+    assert list(connections.user_sids(uid)) == []
+
+
+def test_socket_rename_refreshes_overviews(app, client):
+    _, tok = _register_and_login(client, "rt_rename", "rt_rename@example.com")
+    auth = {"Authorization": f"Bearer {tok}"}
+    r = client.post("/api/documents", json={"title": "Old", "content": {}}, headers=auth)
+    doc_id = r.get_json()["id"]
+    r = client.get("/api/documents/overview", headers=auth)
+    assert [d["title"] for d in r.get_json()["mine"] if d["id"] == doc_id] == ["Old"]
+    tag = r.headers["ETag"]
+
+    s = socketio.test_client(app, flask_test_client=client, query_string=f"token={tok}")
+    s.emit("join_document", {"document_id": doc_id})
+    s.emit("update_document_metadata", {"document_id": doc_id, "title": "New"})
+    s.disconnect()
+
+    r = client.get("/api/documents/overview", headers={**auth, "If-None-Match": tag})
+    assert r.status_code == 200
+    assert [d["title"] for d in r.get_json()["mine"] if d["id"] == doc_id] == ["New"]
+
+
+def test_held_changes_that_dont_compose_are_queued(app, client, monkeypatch):
+    import time
+    from app.realtime.limits import socket_limiter
+
+    _, tok = _register_and_login(client, "rt_queue", "rt_queue@example.com")
+    doc_id = _create_doc(client, tok, {"ops": [{"insert": "\n"}]})
+    s = socketio.test_client(app, flask_test_client=client, query_string=f"token={tok}")
+    s.emit("join_document", {"document_id": doc_id})
+    s.get_received()
+
+    now = [time.monotonic()]
+    monkeypatch.setattr(socket_limiter, "_clock", lambda: now[0])
+    for name, value in (("rate", 1), ("burst", 1), ("user_rate", 100), ("user_burst", 100)):
+        monkeypatch.setattr(socket_limiter, name, value)
+    monkeypatch.setattr(socket_limiter, "_sids", {})
+    monkeypatch.setattr(socket_limiter, "_users", {})
+
+    # a is applied; b is held; c has another base version, so it can't be composed
+    # into b and waits behind it; d composes into c; e doesn't compose (bad delta)
+    s.emit("document_change", {"document_id": doc_id, "version": 0, "delta": {"ops": [{"insert": "a"}]}})
+    s.emit("document_change", {"document_id": doc_id, "version": 0, "delta": {"ops": [{"insert": "b"}]}})
+    s.emit("document_change", {"document_id": doc_id, "version": 1, "delta": {"ops": [{"insert": "c"}]}})
+    s.emit("document_change", {"document_id": doc_id, "version": 1, "delta": {"ops": [{"insert": "d"}]}})
+    s.emit("document_change", {"document_id": doc_id, "version": 1, "delta": {"ops": [{"retain": -1}]}})
+    assert socket_limiter.stats()["held"] == 3
+
+    replayed = 0
+    for _ in range(3):
+        now[0] += 1
+        replayed += socket_limiter.release()
+    assert replayed == 3 and socket_limiter.stats()["held"] == 0
+    items = _items(s)
+    # every valid change was applied and acked: a, b, then c+d as one change
+    assert [item["version"] for item in items if item.get("ack")] == [1, 2, 3]
+    r = client.get(f"/api/documents/{doc_id}", headers={"Authorization": f"Bearer {tok}"})
+    assert sorted(r.get_json()["content"]["ops"][0]["insert"]) == sorted("abdc\n")
+    s.disconnect()
+
+
+def test_document_locks_are_dropped_once_unused():
+    h = OpHistory()
+    with h.lock(1):
+        h.append(1, 1, [{"insert": "x"}])
+        h.reset(1)
+        # still held: everyone gets the same lock
+        assert h.lock(1) is h.lock(1) and h.lock(1).locked()
+    assert len(h._locks) == 0 and len(h._ops) == 0
+
+
+def test_held_events_for_different_documents_are_not_merged(app, client, monkeypatch):
+    import time
+    from app.realtime.limits import socket_limiter
+
+    _, tok = _register_and_login(client, "rt_two_docs", "rt_two_docs@example.com")
+    doc_a = _create_doc(client, tok, {"ops": [{"insert": "\n"}]})
+    doc_b = _create_doc(client, tok, {"ops": [{"insert": "\n"}]})
+    s = socketio.test_client(app, flask_test_client=client, query_string=f"token={tok}")
+    for doc_id in (doc_a, doc_b):
+        s.emit("join_document", {"document_id": doc_id})
+    s.get_received()
+
+    now = [time.monotonic()]
+    monkeypatch.setattr(socket_limiter, "_clock", lambda: now[0])
+    for name, value in (("rate", 1), ("burst", 1), ("user_rate", 100), ("user_burst", 100)):
+        monkeypatch.setattr(socket_limiter, name, value)
+    monkeypatch.setattr(socket_limiter, "_sids", {})
+    monkeypatch.setattr(socket_limiter, "_users", {})
+
+    # one token: everything after the first change is held, in order
+    for doc_id, ch in ((doc_a, "a"), (doc_a, "b"), (doc_b, "x")):
+        s.emit("document_change", {"document_id": doc_id, "version": 0, "delta": {"ops": [{"insert": ch}]}})
+    s.emit("update_document_metadata", {"document_id": doc_a, "title": "A"})
+    s.emit("update_document_metadata", {"document_id": doc_b, "title": "B"})
+    assert socket_limiter.stats()["held"] == 4
+    while socket_limiter.stats()["held"]:
+        now[0] += 1
+        socket_limiter.release()
+    s.disconnect()
+
+    auth = {"Authorization": f"Bearer {tok}"}
+    a = client.get(f"/api/documents/{doc_a}", headers=auth).get_json()
+    b = client.get(f"/api/documents/{doc_b}", headers=auth).get_json()
+    assert sorted(a["content"]["ops"][0]["insert"]) == sorted("ab\n") and a["title"] == "A"
+    assert b["content"] == {"ops": [{"insert": "x\n"}]} and b["title"] == "B"
@@ -0,0 +1,133 @@
+import pytest
+
+from app.extensions import socketio
+from app.realtime.shards import HashRing, LocalBus, ShardRouter, shards
+
+
+def _register_and_login(client, username, email, password="pw"):
+    client.post("/api/register", json={"username": username, "email": email, "password": password})
+    r = client.post("/api/login", json={"email": email, "password": password})
+    j = r.get_json()
+    return j["user_id"], j["access_token"]
+
+
+def _create_doc(client, token, content):
+    r = client.post("/api/documents", json={"title": "Shard", "content": content},
+                    headers={"Authorization": f"Bearer {token}"})
+    assert r.status_code == 201
+    return r.get_json()["id"]
+
+
+@pytest.fixture()
+def bus(app):
+    """This process joins an in-process bus as worker "local"; stopped afterwards."""
+    bus = LocalBus()
+    shards._app = app
+    shards.start(bus, "local")
+    yield bus
+    shards.stop()
+
+
+def _peer(app, bus, doc_id, prefix="peer"):
+    """Start a second worker whose name makes it the owner of doc_id."""
+    for i in range(10000):
+        name = f"{prefix}-{i}"
+        if HashRing(["local", name]).owner(doc_id) == name:
+            peer = ShardRouter()
+            peer._app = app
+            peer._tasks = dict(shards._tasks)  # same process, same task code
+            peer.start(bus, name)
+            return peer
+    raise AssertionError("no worker name owns the document")
+
+
+def test_ring_is_balanced_and_moves_few_keys():
+    four = HashRing(["w1", "w2", "w3", "w4"])
+    owners = [four.owner(k) for k in range(20000)]
+    for node in four.nodes:
+        assert 0.15 < owners.count(node) / len(owners) < 0.35
+
+    five = HashRing(["w1", "w2", "w3", "w4", "w5"])
+    moved = [k for k in range(20000) if five.owner(k) != owners[k]]
+    assert all(five.owner(k) == "w5" for k in moved)
+    assert len(moved) / 20000 < 0.3
+
+
+def test_changes_are_forwarded_to_the_owner(app, client, bus):
+    from app.realtime.buffer import write_buffer
+
+    _, tok = _register_and_login(client, "sh_fwd", "sh_fwd@example.com")
+    doc_id = _create_doc(client, tok, {"ops": [{"insert": "abc\n"}]})
+    peer = _peer(app, bus, doc_id)
+    calls = []
+    peer.task("join")(lambda doc_id, **kw: calls.append(("join", doc_id, kw["sid"])))
+    peer.task("change")(lambda doc_id, **kw: calls.append(("change", doc_id, kw["ops"])))
+
+    s = socketio.test_client(app, flask_test_client=client, query_string=f"token={tok}")
+    s.emit("join_document", {"document_id": doc_id})
+    s.emit("document_change", {"document_id": doc_id, "version": 0, "delta": {"ops": [{"insert": "X"}]}})
+
+    assert [c[0] for c in calls] == ["join", "change"]
+    assert calls[1] == ("change", doc_id, [{"insert": "X"}])
+    assert write_buffer.peek(doc_id) is None  # nothing live on the non-owner
+    assert shards.stats()["forwarded"] == 2
+    s.disconnect()
+    peer.stop()
+
+
+def test_rest_reads_ask_the_owner(app, client, bus):
+    _, tok = _register_and_login(client, "sh_rest", "sh_rest@example.com")
+    doc_id = _create_doc(client, tok, {"ops": [{"insert": "stale\n"}]})
+    peer = _peer(app, bus, doc_id)
+
+    @peer.task("snapshot")
+    def _snapshot(doc_id):
+        from app.realtime.snapshots import snapshot_cache
+        snap = dict(snapshot_cache.get(doc_id))
+        snap["content"] = {"ops": [{"insert": "live\n"}]}  # as if edited on the owner
+        return snap
+
+    r = client.get(f"/api/documents/{doc_id}", headers={"Authorization": f"Bearer {tok}"})
+    assert r.status_code == 200
+    assert r.get_json()["content"] == {"ops": [{"insert": "live\n"}]}
+    peer.stop()
+
+
+def test_ownership_moves_after_flushing(app, client, bus, db_session):
+    from app.models import Document
+    from app.realtime.buffer import write_buffer
+
+    _, tok = _register_and_login(client, "sh_move", "sh_move@example.com")
+    doc_id = _create_doc(client, tok, {"ops": [{"insert": "\n"}]})
+
+    # alone in the ring, this worker owns and edits the document
+    s = socketio.test_client(app, flask_test_client=client, query_string=f"token={tok}")
+    s.emit("join_document", {"document_id": doc_id})
+    s.emit("document_change", {"document_id": doc_id, "version": 0, "delta": {"ops": [{"insert": "hi"}]}})
+    assert write_buffer.peek(doc_id).dirty
+
+    # a new worker takes it over: the edit is written out and forgotten here
+    peer = _peer(app, bus, doc_id)
+    assert write_buffer.peek(doc_id) is None
+    db_session.expire_all()
+    doc = db_session.get(Document, doc_id)
+    assert doc.content == {"ops": [{"insert": "hi\n"}]}
+    assert doc.version == 1
+
+    # and comes back once that worker leaves
+    peer.stop()
+    assert shards.owner(doc_id) == "local"
+    s.disconnect()
+
+
+def test_unanswered_calls_return_503(app, client, bus, monkeypatch):
+    _, tok = _register_and_login(client, "sh_503", "sh_503@example.com")
+    doc_id = _create_doc(client, tok, {"ops": [{"insert": "\n"}]})
+    peer = _peer(app, bus, doc_id)
+    bus._subscribers[peer.worker_id] = lambda message: None  # owner hangs
+    monkeypatch.setattr(shards, "timeout", 0.05)
+
+    r = client.get(f"/api/documents/{doc_id}", headers={"Authorization": f"Bearer {tok}"})
+    assert r.status_code == 503
+    bus._subscribers[peer.worker_id] = peer._receive
+    peer.stop()
@@ -121,4 +121,135 @@ def test_transfer_ownership(client):
         json={"title": "new owner updated"},
         headers=_auth_headers(new_owner_tok),
     )
-    assert r.status_code == 200
\ No newline at end of file
+    assert r.status_code == 200
+
+def test_bulk_sharing(app, client, queries, monkeypatch):
+    owner_id, owner_tok = _register_and_login(client, "bulk_owner", "bulk_owner@example.com")
+    other_id, other_tok = _register_and_login(client, "bulk_other", "bulk_other@example.com")
+    users = [_register_and_login(client, f"bulk_{i}", f"bulk_{i}@example.com") for i in range(6)]
+    auth = _auth_headers(owner_tok)
+
+    r = client.post("/api/documents/bulk", json={"documents": [{"title": f"B{i}"} for i in range(5)]}, headers=auth)
+    assert r.status_code == 201
+    docs = [d["id"] for d in r.get_json()]
+    assert [d["title"] for d in r.get_json()] == [f"B{i}" for i in range(5)]
+    assert client.post("/api/documents/bulk", json={"documents": []}, headers=auth).status_code == 422
+
+    # one document, many users: statements don't grow with the number of users
+    counts = []
+    for batch, level in ((users[:2], "viewer"), (users[2:], "editor")):
+        with queries() as q:
+            r = client.post(f"/api/documents/{docs[0]}/collaborators/bulk", json={
+                "user_ids": [uid for uid, _ in batch[1:]] + [owner_id, 999999],
+                "emails": [f"bulk_{users.index(batch[0])}@example.com", "nobody@example.com"],
+                "permission_level": level,
+            }, headers=auth)
+        assert r.status_code == 200
+        body = r.get_json()
+        assert body["shared"] == sorted(uid for uid, _ in batch)
+        assert body["not_found"] == {"user_ids": [999999], "emails": ["nobody@example.com"]}
+        counts.append(len(q))
+    assert counts[0] == counts[1] <= 5
+
+    # re-sharing updates roles in place; the owner row is never touched
+    r = client.post(f"/api/documents/{docs[0]}/collaborators/bulk",
+                    json={"user_ids": [users[0][0]], "permission_level": "editor"}, headers=auth)
+    rows = {c["user_id"]: c["permission_level"]
+            for c in client.get(f"/api/documents/{docs[0]}/collaborators", headers=auth).get_json()}
+    assert rows[owner_id] == "owner" and rows[users[0][0]] == "editor" and len(rows) == 7
+
+    # many documents, one user; documents owned by someone else are denied
+    foreign = _create_doc(client, other_tok, title="Not yours")
+    from app.api import sharing
+    from app.extensions import socketio
+    from app.realtime.shards import shards
+    emails, broadcasts = [], []
+    monkeypatch.setattr(sharing, "send_share_email_bg", lambda *a, **kw: emails.append(a))
+    monkeypatch.setattr(sharing, "send_shares_email_bg", lambda *a, **kw: emails.append(a))
+    broadcast = shards.broadcast
+    monkeypatch.setattr(shards, "broadcast", lambda name, **kw: (broadcasts.append(name), broadcast(name, **kw)))
+    _, token = users[5]
+    s = socketio.test_client(app, flask_test_client=client, query_string=f"token={token}")
+    s.get_received()
+
+    r = client.post("/api/documents/bulk/collaborators",
+                    json={"document_ids": docs + [foreign], "email": "bulk_5@example.com"}, headers=auth)
+    assert r.status_code == 200
+    assert r.get_json() == {"shared": docs, "denied": [foreign]}
+    # one of each per invitee, listing the documents, however many there are
+    notes = [m["args"][0] for m in s.get_received() if m["name"] == "notify"]
+    assert [(n["type"], [d["doc_id"] for d in n["documents"]]) for n in notes] == [("shares_added", docs)]
+    assert emails == [("bulk_5@example.com", [(d, f"B{i}") for i, d in enumerate(docs)], "bulk_owner")]
+    assert sorted(broadcasts) == ["contacts.invalidate", "overviews.invalidate", "permissions.invalidate",
+                                  "snapshot.sharing_versions"]
+    s.disconnect()
+    shared = client.get("/api/documents/overview", headers=_auth_headers(token)).get_json()["shared_with_me"]
+    assert sorted(d["id"] for d in shared) == sorted(docs)
+    assert {d["permission_level"] for d in shared if d["id"] != docs[0]} == {"viewer"}
+    assert client.get(f"/api/documents/{foreign}", headers=_auth_headers(token)).status_code == 403
+
+    r = client.post("/api/documents/bulk/collaborators", json={"document_ids": docs, "user_id": owner_id}, headers=auth)
+    assert r.status_code == 400
+    r = client.post("/api/documents/bulk/collaborators", json={"document_ids": docs, "email": "nobody@example.com"},
+                    headers=auth)
+    assert r.status_code == 404
+
+def test_user_search_prefers_recent_collaborators(client, queries):
+    uid, tok = _register_and_login(client, "finder", "finder@example.com")
+    ids = {name: _register_and_login(client, name, f"{name}@example.com")[0]
+           for name in ("findme_c", "findme_a", "findme_b", "lookfor_findme")}
+    auth = _auth_headers(tok)
+
+    def search(q):
+        r = client.get("/api/users/search", query_string={"q": q}, headers=auth)
+        assert r.status_code == 200
+        return [u["username"] for u in r.get_json()]
+
+    # prefix of email or username, case-insensitive, never the caller
+    assert search("FINDME") == ["findme_a", "findme_b", "findme_c"]
+    assert search("finde") == []
+    assert search("lookfor") == ["lookfor_findme"]
+    # LIKE wildcards are literal
+    assert search("findm%") == [] and search("findm_") == []
+    # short queries only search people the caller works with
+    assert search("fin") == []
+
+    doc = _create_doc(client, tok)
+    r = client.post(f"/api/documents/{doc}/collaborators", json={"user_id": ids["findme_b"]}, headers=auth)
+    assert r.status_code == 200
+    assert search("findme") == ["findme_b", "findme_a", "findme_c"]
+    with queries() as q:
+        assert search("fin") == ["findme_b"]
+    assert not q.selects("users"), q.report()
+
+
+def test_revoke_during_a_permission_read_is_not_cached_over(app, client):
+    from sqlalchemy import event
+    from app.extensions import db
+    from app.permissions import permission_cache
+
+    owner_id, owner_tok = _register_and_login(client, "race_owner", "race_owner@example.com")
+    collab_id, _ = _register_and_login(client, "race_collab", "race_collab@example.com")
+    doc_id = _create_doc(client, owner_tok)
+    r = client.post(f"/api/documents/{doc_id}/collaborators",
+                    json={"user_id": collab_id, "permission_level": "editor"}, headers=_auth_headers(owner_tok))
+    assert r.status_code < 300
+
+    with app.app_context():
+        engine = db.engine
+        permission_cache._drop(doc_id, None)
+
+        # the revoke's invalidation arrives while the read is in Postgres
+        def revoke(conn, cursor, statement, *args):
+            if "FROM document_collaborators" in statement:
+                permission_cache._drop(doc_id, collab_id)
+
+        event.listen(engine, "after_cursor_execute", revoke)
+        try:
+            assert permission_cache.level(doc_id, collab_id) == "editor"
+        finally:
+            event.remove(engine, "after_cursor_execute", revoke)
+        assert permission_cache._cache.get(doc_id) in (None, {})
+        # a read that starts afterwards is cached as usual
+        assert permission_cache.level(doc_id, collab_id) == "editor"
+        assert permission_cache._cache.get(doc_id) == {collab_id: "editor"}
@@ -29,6 +29,12 @@ type NotifyEvent =
       permission_level: "viewer" | "editor";
       by_user: { id: number; username?: string; email?: string };
     }
+  | {
+      type: "shares_added";
+      documents: { doc_id: number; title: string }[];
+      permission_level: "viewer" | "editor";
+      by_user: { id: number; username?: string; email?: string };
+    }
   | {
       type: "share_role_changed";
       doc_id: number;
@@ -118,6 +124,24 @@ export default function Navbar() {
             return [newDoc, ...prev];
           }
 
+          case "shares_added": {
+            const owner = { id: evt.by_user.id, username: evt.by_user.username, email: evt.by_user.email };
+            const added = new Map(evt.documents.map((d) => [d.doc_id, d.title]));
+            const next = prev.map((d) =>
+              added.has(d.id) ? { ...d, title: added.get(d.id)!, permission_level: evt.permission_level } : d
+            );
+            const fresh: SharedDoc[] = evt.documents
+              .filter((d) => !prev.some((p) => p.id === d.doc_id))
+              .map((d) => ({
+                id: d.doc_id,
+                title: d.title,
+                updated_at: new Date().toISOString(),
+                permission_level: evt.permission_level,
+                owner,
+              }));
+            return [...fresh, ...next];
+          }
+
           case "share_role_changed": {
             const hasIt = prev.some((d) => d.id === evt.doc_id);
             if (!hasIt) {
@@ -150,6 +174,10 @@ export default function Navbar() {
       // Maintain unseen IDs (badge + closable notifications).
       setUnseenIds((prev) => {
         switch (evt.type) {
+          case "shares_added": {
+            const ids = evt.documents.map((d) => d.doc_id).filter((id) => !prev.includes(id));
+            return [...ids, ...prev];
+          }
           case "share_added":
           case "share_role_changed":
           case "ownership_lost": {
@@ -6,3 +6,8 @@ export const SOCKET_URL =
   (import.meta.env.VITE_SOCKET_URL as string | undefined) ||
   (isProduction ? "" : "http://localhost:8000");
 export const WS_PATH = import.meta.env.VITE_WS_PATH || "/socket.io";
+// e.g. "websocket" when several backend workers run without sticky sessions
+export const SOCKET_TRANSPORTS = (import.meta.env.VITE_SOCKET_TRANSPORTS as string | undefined)
+  ?.split(",")
+  .map((t) => t.trim())
+  .filter(Boolean);
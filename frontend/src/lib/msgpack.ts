@@ -0,0 +1,91 @@
+// Minimal MessagePack decoder for the server's binary socket payloads
+// (see backend/app/realtime/codec.py). Decode-only; we never send msgpack.
+
+const utf8 = new TextDecoder();
+
+export function decodeMsgpack(buf: Uint8Array): unknown {
+  const view = new DataView(buf.buffer, buf.byteOffset, buf.byteLength);
+  let pos = 0;
+
+  const str = (len: number) => {
+    const s = utf8.decode(buf.subarray(pos, pos + len));
+    pos += len;
+    return s;
+  };
+  const bin = (len: number) => {
+    const b = buf.slice(pos, pos + len);
+    pos += len;
+    return b;
+  };
+  const arr = (len: number): unknown[] => {
+    const out = new Array(len);
+    for (let i = 0; i < len; i++) out[i] = read();
+    return out;
+  };
+  const map = (len: number): Record<string, unknown> => {
+    const out: Record<string, unknown> = {};
+    for (let i = 0; i < len; i++) {
+      const k = String(read());
+      out[k] = read();
+    }
+    return out;
+  };
+  const u8 = () => view.getUint8(pos++);
+  const u16 = () => { const v = view.getUint16(pos); pos += 2; return v; };
+  const u32 = () => { const v = view.getUint32(pos); pos += 4; return v; };
+
+  function read(): unknown {
+    const t = u8();
+    if (t <= 0x7f) return t;
+    if (t >= 0xe0) return t - 0x100;
+    if ((t & 0xf0) === 0x80) return map(t & 0x0f);
+    if ((t & 0xf0) === 0x90) return arr(t & 0x0f);
+    if ((t & 0xe0) === 0xa0) return str(t & 0x1f);
+    let v: number;
+    switch (t) {
+      case 0xc0: return null;
+      case 0xc2: return false;
+      case 0xc3: return true;
+      case 0xc4: return bin(u8());
+      case 0xc5: return bin(u16());
+      case 0xc6: return bin(u32());
+      case 0xca: v = view.getFloat32(pos); pos += 4; return v;
+      case 0xcb: v = view.getFloat64(pos); pos += 8; return v;
+      case 0xcc: return u8();
+      case 0xcd: return u16();
+      case 0xce: return u32();
+      case 0xcf: v = Number(view.getBigUint64(pos)); pos += 8; return v;
+      case 0xd0: v = view.getInt8(pos); pos += 1; return v;
+      case 0xd1: v = view.getInt16(pos); pos += 2; return v;
+      case 0xd2: v = view.getInt32(pos); pos += 4; return v;
+      case 0xd3: v = Number(view.getBigInt64(pos)); pos += 8; return v;
+      case 0xd9: return str(u8());
+      case 0xda: return str(u16());
+      case 0xdb: return str(u32());
+      case 0xdc: return arr(u16());
+      case 0xdd: return arr(u32());
+      case 0xde: return map(u16());
+      case 0xdf: return map(u32());
+      default: throw new Error(`msgpack: unsupported type 0x${t.toString(16)}`);
+    }
+  }
+
+  return read();
+}
+
+const FLAG_DEFLATE = 1;
+
+async function inflate(data: Uint8Array): Promise<Uint8Array> {
+  const stream = new Blob([data]).stream().pipeThrough(new DecompressionStream("deflate"));
+  return new Uint8Array(await new Response(stream).arrayBuffer());
+}
+
+/** Socket payloads arrive as JSON objects or, for binary clients, as flag byte + msgpack body. */
+export async function decodePayload<T>(data: unknown): Promise<T> {
+  if (!(data instanceof ArrayBuffer) && !ArrayBuffer.isView(data)) return data as T;
+  const bytes = data instanceof ArrayBuffer
+    ? new Uint8Array(data)
+    : new Uint8Array(data.buffer, data.byteOffset, data.byteLength);
+  const body = bytes.subarray(1);
+  return decodeMsgpack(bytes[0] === FLAG_DEFLATE ? await inflate(body) : body) as T;
+}
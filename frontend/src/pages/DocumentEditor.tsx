@@ -1,17 +1,24 @@
 import { useEffect, useRef, useState } from "react";
 import { useNavigate, useParams } from "react-router-dom";
 import Button from "../components/ui/Button";
-import Quill from "quill";
+import Quill, { Delta } from "quill";
 import { io, Socket } from "socket.io-client";
 import "quill/dist/quill.snow.css";
 
 import { getAccessToken } from "../lib/auth";
-import { SOCKET_URL } from "../lib/env";
+import { SOCKET_TRANSPORTS, SOCKET_URL } from "../lib/env";
+import { decodePayload } from "../lib/msgpack";
 
 type QuillContent = Parameters<Quill["setContents"]>[0];
 
-type LoadEvent = { title: string; description?: string; content: QuillContent | null };
-type UpdatedEvent = { document_id: number; content: QuillContent; by_user_id: number };
+type DeltaOps = Delta["ops"];
+
+type LoadEvent = { title: string; description?: string; content: QuillContent | null; version: number };
+type UpdateItem = { version: number; ack: true } | { version: number; delta: { ops: DeltaOps } };
+type UpdatesEvent = { document_id: number; items: UpdateItem[] };
+type Range = { index: number; length: number } | null;
+type PeerState = { client_id: number; user_id: number; username: string | null; cursor: Range; selection: Range };
+type AwarenessEvent = { document_id: number; client_id?: number; states: PeerState[]; removed: number[] };
 
 export default function DocumentEditor() {
   const { docId } = useParams<{ docId: string }>();
@@ -22,12 +29,21 @@ export default function DocumentEditor() {
   const socketRef = useRef<Socket | null>(null);
   const applyingRemoteRef = useRef(false);
 
+  // OT client state: last server version seen, the change awaiting ack,
+  // and local edits made while waiting (sent once the ack arrives)
+  const versionRef = useRef(0);
+  const loadedRef = useRef(false); // updates before the first snapshot are already in it
+  const inflightRef = useRef<Delta | null>(null);
+  const bufferRef = useRef<Delta | null>(null);
+
   // If load arrives before Quill is created, stash it here
   const pendingContentRef = useRef<QuillContent | null>(null);
 
   const [title, setTitle] = useState("");
   const [loading, setLoading] = useState(true);
   const [msg, setMsg] = useState<string | null>(null);
+  const [peers, setPeers] = useState<Record<number, PeerState>>({});
+  const clientIdRef = useRef<number | null>(null);
 
   // 1) Initialize Quill as soon as the div exists
   useEffect(() => {
@@ -47,13 +63,28 @@ export default function DocumentEditor() {
       },
     });
 
-    // local edits → broadcast full delta
-    q.on("text-change", (_delta, _old, source) => {
+    // local edits → send only the change, one at a time
+    q.on("text-change", (change, _old, source) => {
       if (source !== "user" || applyingRemoteRef.current) return;
-      const full = q.getContents();
+      if (inflightRef.current) {
+        bufferRef.current = bufferRef.current ? bufferRef.current.compose(change) : change;
+        return;
+      }
+      inflightRef.current = change;
       socketRef.current?.emit("document_change", {
         document_id: Number(docId),
-        content: full,
+        version: versionRef.current,
+        delta: { ops: change.ops },
+      });
+    });
+
+    // cursor moves go to the awareness channel; the server batches them per tick
+    q.on("selection-change", (range) => {
+      if (!range) return;
+      socketRef.current?.emit("awareness_update", {
+        document_id: Number(docId),
+        cursor: { index: range.index + range.length, length: 0 },
+        selection: range,
       });
     });
 
@@ -90,23 +121,43 @@ export default function DocumentEditor() {
     }
 
     const s = io(SOCKET_URL || window.location.origin, {
-      query: { token },
+      // large payloads arrive as compressed MessagePack (see lib/msgpack.ts)
+      query: { token, encoding: "msgpack" },
       withCredentials: false,
-      // leave transports unspecified; socket.io will negotiate
+      // unset unless configured; socket.io will negotiate
+      transports: SOCKET_TRANSPORTS,
     });
     socketRef.current = s;
 
+    // Decoding is async, so run document events through one promise chain
+    // to keep them in the order the server sent them.
+    let queue: Promise<void> = Promise.resolve();
+    const inOrder = <T,>(handler: (data: T) => void) => (raw: unknown) => {
+      queue = queue
+        .then(() => decodePayload<T>(raw))
+        .then(handler)
+        .catch((err) => setMsg("Could not read update: " + String(err)));
+    };
+
     s.on("connect_error", (err) => {
       setMsg("Connection error: " + err.message);
       setLoading(false);
     });
 
     s.on("connect", () => {
-      s.emit("join_document", { document_id: idNum });
+      // on a reconnect, only ask for what we missed; with an unacknowledged
+      // edit we can't tell whether the server has it, so take a snapshot
+      const resume = loadedRef.current && !inflightRef.current;
+      s.emit("join_document", { document_id: idNum, ...(resume && { version: versionRef.current }) });
     });
 
-    s.on("load_document_content", (data: LoadEvent) => {
+    s.on("load_document_content", inOrder((data: LoadEvent) => {
       setTitle(data.title ?? "");
+      // a snapshot replaces everything, including unacknowledged edits
+      versionRef.current = data.version ?? 0;
+      loadedRef.current = true;
+      inflightRef.current = null;
+      bufferRef.current = null;
       const content: QuillContent = data.content ?? [];
 
       if (quillRef.current) {
@@ -121,16 +172,59 @@ export default function DocumentEditor() {
         pendingContentRef.current = content;
       }
       setLoading(false);
-    });
+    }));
+
+    const applyAck = (version: number) => {
+      versionRef.current = version;
+      inflightRef.current = bufferRef.current;
+      bufferRef.current = null;
+      if (inflightRef.current) {
+        s.emit("document_change", {
+          document_id: idNum,
+          version: versionRef.current,
+          delta: { ops: inflightRef.current.ops },
+        });
+      }
+    };
+
+    const applyRemote = (version: number, ops: DeltaOps) => {
+      // the server applied this before our pending edits: rebase both ways
+      let remote = new Delta(ops);
+      for (const ref of [inflightRef, bufferRef]) {
+        const local = ref.current;
+        if (!local) continue;
+        ref.current = remote.transform(local, true);
+        remote = local.transform(remote, false);
+      }
+      versionRef.current = version;
 
-    s.on("document_updated", (data: UpdatedEvent) => {
       if (!quillRef.current) {
-        pendingContentRef.current = data.content;
+        pendingContentRef.current = new Delta(pendingContentRef.current ?? []).compose(remote);
         return;
       }
       applyingRemoteRef.current = true;
-      quillRef.current.setContents(data.content);
+      quillRef.current.updateContents(remote, "api");
       applyingRemoteRef.current = false;
+    };
+
+    // one frame per batching window: our acks and everyone else's changes, in version order
+    s.on("document_updates", inOrder((data: UpdatesEvent) => {
+      if (!loadedRef.current) return;
+      for (const item of data.items) {
+        if (item.version <= versionRef.current) continue; // already covered by a snapshot or catch-up
+        if ("ack" in item) applyAck(item.version);
+        else applyRemote(item.version, item.delta.ops);
+      }
+    }));
+
+    s.on("awareness", (data: AwarenessEvent) => {
+      if (data.client_id !== undefined) clientIdRef.current = data.client_id;
+      setPeers((prev) => {
+        const next = { ...prev };
+        for (const st of data.states) next[st.client_id] = st;
+        for (const id of data.removed) delete next[id];
+        return next;
+      });
     });
 
     s.on("error", (data: { message?: string }) => {
@@ -161,6 +255,14 @@ export default function DocumentEditor() {
       {loading && <div className="text-sm text-gray-500">Loading document…</div>}
       {msg && <div className="text-sm text-red-600">{msg}</div>}
 
+      <div className="text-sm text-gray-500">
+        Online:{" "}
+        {Object.values(peers)
+          .filter((p) => p.client_id !== clientIdRef.current)
+          .map((p) => p.username ?? `user ${p.user_id}`)
+          .join(", ") || "just you"}
+      </div>
+
       <div ref={editorElRef} className="h-[480px] border rounded bg-white" />
     </div>
   );
@@ -20,9 +20,13 @@ type SharedDoc = {
   owner: { id: number; username?: string; email?: string };
 };
 
+type Section = "mine" | "shared_with_me";
+
 type OverviewResponse = {
   mine: MineDoc[];
   shared_with_me: SharedDoc[];
+  // cursor for the next page of each list; null/absent at the end
+  next_cursor?: Partial<Record<Section, string | null>>;
 };
 
 type Me = { id: number; email?: string; username?: string };
@@ -31,6 +35,7 @@ export default function DocumentsList() {
   const [data, setData] = useState<OverviewResponse | null>(null);
   const [msg, setMsg] = useState<string | null>(null);
   const [busyId, setBusyId] = useState<number | null>(null);
+  const [loadingMore, setLoadingMore] = useState<Section | null>(null);
   const [me, setMe] = useState<Me | null>(null);
   const navigate = useNavigate();
 
@@ -65,6 +70,49 @@ export default function DocumentsList() {
     })();
   }, []);
 
+  async function loadMore(section: Section) {
+    const cursor = data?.next_cursor?.[section];
+    if (!cursor) return;
+    setLoadingMore(section);
+    try {
+      const param = section === "mine" ? "mine_cursor" : "shared_cursor";
+      const r = await apiFetch(
+        `${API_BASE}/documents/overview?section=${section}&${param}=${encodeURIComponent(cursor)}`
+      );
+      const body = await safeJson<Partial<OverviewResponse>>(r);
+      if (!r.ok || !body) {
+        setMsg(`Error ${r.status}`);
+        return;
+      }
+      setData((prev) =>
+        prev
+          ? {
+              ...prev,
+              [section]: [...prev[section], ...(body[section] ?? [])],
+              next_cursor: { ...prev.next_cursor, [section]: body.next_cursor?.[section] ?? null },
+            }
+          : prev
+      );
+    } catch (e: unknown) {
+      setMsg(errorMessage(e));
+    } finally {
+      setLoadingMore(null);
+    }
+  }
+
+  const renderMore = (section: Section) =>
+    data?.next_cursor?.[section] ? (
+      <div className="mt-2">
+        <Button
+          disabled={loadingMore === section}
+          onClick={() => loadMore(section)}
+          variant="secondary"
+        >
+          {loadingMore === section ? "Loading…" : "Load more"}
+        </Button>
+      </div>
+    ) : null;
+
   async function delDoc(id: number) {
     if (!confirm("Delete this document? This cannot be undone.")) return;
     setBusyId(id);
@@ -183,11 +231,13 @@ export default function DocumentsList() {
       <section>
         <h2 className="text-lg font-semibold mb-2">My documents</h2>
         {renderMine()}
+        {renderMore("mine")}
       </section>
 
       <section>
         <h2 className="text-lg font-semibold mb-2">Shared with me</h2>
         {renderShared()}
+        {renderMore("shared_with_me")}
       </section>
     </div>
   );